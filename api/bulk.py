@@ -0,0 +1,185 @@
+"""
+Registro masivo de transacciones.
+
+En lugar de validar y guardar cada elemento por separado, el lote completo se
+valida contra productos, tarjetas y contactos cargados con una sola consulta
+cada uno, las filas se insertan con un único ``bulk_create`` y el stock y los
+saldos se actualizan una sola vez por producto y por tarjeta.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .models import Sale, Purchase, Product, Card, Contact
+from .serializers import SaleSerializer
+from .ledger import apply_deltas, record_stock_movements, record_card_transactions
+from .rollups import bump_rollups, sale_entries, purchase_entries
+
+
+DOES_NOT_EXIST = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+RELATED_FIELDS = ('product', 'contact', 'card')
+
+
+class SaleBulkItemSerializer(serializers.ModelSerializer):
+    """Valida los campos de una venta sin consultar la base de datos"""
+    product = serializers.IntegerField()
+    contact = serializers.IntegerField(required=False, allow_null=True)
+    card = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = Sale
+        fields = ['product', 'contact', 'card', 'quantity', 'unit_price',
+                  'created_at', 'is_credit']
+
+
+class PurchaseBulkItemSerializer(SaleBulkItemSerializer):
+    """Valida los campos de una compra sin consultar la base de datos"""
+
+    class Meta(SaleBulkItemSerializer.Meta):
+        model = Purchase
+
+
+def _load(model, business, ids, lock=False):
+    if not ids:
+        return {}
+    queryset = model.objects.filter(business=business, pk__in=ids).order_by('pk')
+    if lock:
+        queryset = queryset.select_for_update()
+    return {obj.pk: obj for obj in queryset}
+
+
+def _missing(field, pk):
+    return {field: [DOES_NOT_EXIST.format(pk_value=pk)]}
+
+
+def _non_field(message):
+    return {'non_field_errors': [message]}
+
+
+def _bulk_register(model, item_serializer_class, business, items_data, direction):
+    """
+    Valida y guarda un lote de ventas (``direction=-1``) o compras
+    (``direction=1``) en una sola transacción.
+
+    ``direction`` es el signo del cambio de stock; el saldo de la tarjeta se
+    mueve en sentido contrario. Cuando un elemento resta stock o saldo se
+    verifica que alcance, teniendo en cuenta los elementos anteriores del lote.
+
+    Devuelve ``(created, errors)`` donde ``created`` es una lista de
+    ``(index, instancia)``.
+    """
+    errors = []
+    valid = []
+
+    for index, item_data in enumerate(items_data):
+        serializer = item_serializer_class(data=item_data)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'index': index, 'errors': serializer.errors})
+
+    created = []
+    with transaction.atomic():
+        # Bloquear en orden de pk para evitar interbloqueos entre lotes
+        products = _load(Product, business, {d['product'] for _, d in valid}, lock=True)
+        cards = _load(Card, business, {d['card'] for _, d in valid if d.get('card')}, lock=True)
+        contacts = _load(Contact, business, {d['contact'] for _, d in valid if d.get('contact')})
+
+        # Stock disponible: las unidades reservadas por pedidos no se venden
+        stock = {pk: product.stock - product.reserved for pk, product in products.items()}
+        balances = {pk: card.balance for pk, card in cards.items()}
+        stock_deltas = defaultdict(int)
+        balance_deltas = defaultdict(int)
+
+        for index, data in valid:
+            product = products.get(data['product'])
+            if product is None:
+                errors.append({'index': index, 'errors': _missing('product', data['product'])})
+                continue
+            card_id = data.get('card')
+            if card_id and card_id not in cards:
+                errors.append({'index': index, 'errors': _missing('card', card_id)})
+                continue
+            contact_id = data.get('contact')
+            if contact_id and contact_id not in contacts:
+                errors.append({'index': index, 'errors': _missing('contact', contact_id)})
+                continue
+
+            quantity = data['quantity'] * direction
+            if stock[product.pk] + quantity < 0:
+                errors.append({'index': index, 'errors': _non_field(
+                    f"Stock insuficiente. Solo hay {stock[product.pk]} unidades disponibles."
+                )})
+                continue
+
+            amount = 0
+            if not data.get('is_credit') and card_id:
+                amount = -direction * data['quantity'] * data['unit_price']
+                if balances[card_id] + amount < 0:
+                    errors.append({'index': index, 'errors': _non_field(
+                        "La tarjeta no tiene saldo suficiente"
+                    )})
+                    continue
+                balances[card_id] += amount
+                balance_deltas[card_id] += amount
+
+            stock[product.pk] += quantity
+            stock_deltas[product.pk] += quantity
+
+            obj = model(
+                business=business,
+                product=product,
+                contact=contacts.get(contact_id),
+                card=cards.get(card_id),
+                **{k: v for k, v in data.items() if k not in RELATED_FIELDS}
+            )
+            if direction < 0:
+                obj.unit_cost = product.purchase_price
+            created.append((index, obj))
+
+        model.objects.bulk_create([obj for _, obj in created])
+
+        apply_deltas(stock_deltas, balance_deltas, require_funds=True)
+        reason = 'sale' if direction < 0 else 'purchase'
+        record_stock_movements(
+            (obj.product_id, obj.quantity * direction, reason, obj.pk) for _, obj in created
+        )
+        record_card_transactions(
+            (obj.card_id, -direction * obj.quantity * obj.unit_price, reason, obj.pk)
+            for _, obj in created if obj.card_id and not obj.is_credit
+        )
+        bump_rollups(
+            entry for _, obj in created
+            for entry in (sale_entries(obj) if direction < 0
+                          else purchase_entries(obj))
+        )
+
+    errors.sort(key=lambda err: err['index'])
+    return created, errors
+
+
+def bulk_register_sales(business, sales_data):
+    """
+    Registra una lista de ventas en una sola transacción.
+
+    Devuelve ``(results, errors)`` con el mismo formato que el modo por
+    elemento de ``SaleViewSet.batch``: los elementos inválidos se reportan
+    por índice y no impiden que se registren los demás.
+    """
+    created, errors = _bulk_register(
+        Sale, SaleBulkItemSerializer, business, sales_data, direction=-1
+    )
+    return SaleSerializer([sale for _, sale in created], many=True).data, errors
+
+
+def bulk_register_purchases(business, purchases_data):
+    """
+    Registra una lista de compras en una sola transacción.
+
+    Devuelve ``(created, errors)`` donde ``created`` es una lista de
+    ``(index, compra)``.
+    """
+    return _bulk_register(
+        Purchase, PurchaseBulkItemSerializer, business, purchases_data, direction=1
+    )
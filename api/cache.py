@@ -0,0 +1,146 @@
+"""
+Caché de respuestas públicas con contadores de versión.
+
+Cada espacio de nombres (``products``, ``businesses``) tiene una versión
+guardada en la caché de Django. Las claves de las respuestas incluyen esa
+versión, de modo que invalidar es solo cambiarla con ``bump_version``: las
+entradas antiguas dejan de leerse y caducan solas. La versión es además la
+marca de tiempo del último cambio, que se usa como ``Last-Modified``.
+
+El seguimiento de pedidos usa como versión el ``updated_at`` de cada pedido
+(``set_order_version``), así que un pedido que no cambia no vuelve a leerse.
+
+Funciona con cualquier backend de caché. Con varios procesos hay que usar uno
+compartido (archivos, Redis, ...) para que todos vean la misma versión.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'public-cache-version:{}'
+
+
+def cache_is_shared():
+    """
+    Si todos los procesos ven la misma caché. Con una caché local de cada
+    proceso las versiones no se comparten, así que no se pueden anunciar
+    ``ETag`` ni ``Last-Modified``: otro proceso respondería 304 con datos viejos.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    return not backend.endswith(('LocMemCache', 'DummyCache'))
+
+
+def business_namespace(business_id):
+    """Espacio de las respuestas de un solo negocio (escaparate)"""
+    return f'business:{business_id}'
+
+
+def get_version(namespace):
+    version = cache.get(VERSION_KEY.format(namespace))
+    if version is None:
+        version = time.time_ns()
+        # add() no pisa la versión que otro proceso haya guardado entre medias
+        if not cache.add(VERSION_KEY.format(namespace), version, timeout=None):
+            version = cache.get(VERSION_KEY.format(namespace), version)
+    return version
+
+
+def bump_version(*namespaces):
+    """
+    Invalida las respuestas de los espacios indicados cuando la transacción
+    en curso se confirme (o al momento, fuera de una transacción).
+    """
+    def bump():
+        version = time.time_ns()
+        cache.set_many({VERSION_KEY.format(namespace): version for namespace in namespaces}, timeout=None)
+    transaction.on_commit(bump)
+
+
+def order_version_key(tracking_code):
+    """Clave con la versión (``updated_at``) del pedido que ve ``track_order``"""
+    return f'track-order-version:{tracking_code}'
+
+
+def order_version(order):
+    return int(order.updated_at.timestamp() * 1_000_000)
+
+
+def set_order_version(order, deleted=False):
+    """
+    Publica la nueva versión del pedido al confirmarse la transacción; las
+    respuestas guardadas con la anterior dejan de usarse.
+    """
+    if not cache_is_shared():
+        return
+    key = order_version_key(order.tracking_code)
+    if deleted:
+        transaction.on_commit(lambda: cache.delete(key))
+    else:
+        version = order_version(order)
+        timeout = getattr(settings, 'TRACK_ORDER_CACHE_TIMEOUT', 300)
+        transaction.on_commit(lambda: cache.set(key, version, timeout=timeout))
+
+
+def not_modified(request, etag, last_modified):
+    """Si la petición condicional ya tiene la versión ``etag``/``last_modified``"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in [value.strip() for value in if_none_match.split(',')] or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+class VersionedCacheMixin:
+    """
+    Cachea las respuestas ``list`` y ``retrieve`` de un viewset de solo
+    lectura bajo la versión de ``cache_namespace`` y responde 304 a las
+    peticiones condicionales (``If-None-Match``/``If-Modified-Since``).
+    """
+    cache_namespace = None
+    # Segundos que dura una respuesta; por defecto PUBLIC_CACHE_TIMEOUT
+    cache_timeout = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(VersionedCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(VersionedCacheMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def cached_response(self, request, render, namespace=None):
+        """Devuelve ``render()`` desde la caché o lo calcula y lo guarda"""
+        namespace = namespace or self.cache_namespace
+        version = get_version(namespace)
+        # Las licencias caducan y los horarios avanzan sin guardar nada: las
+        # respuestas se renuevan al menos una vez por periodo
+        timeout = self.cache_timeout or getattr(settings, 'PUBLIC_CACHE_TIMEOUT', 300)
+        period = int(time.time()) // timeout
+        params = sorted(request.query_params.lists())
+        raw_key = f'{namespace}:{version}:{period}:{self.action}:{sorted(self.kwargs.items())}:{params}'
+        digest = hashlib.md5(raw_key.encode('utf-8')).hexdigest()
+        etag = quote_etag(digest)
+        last_modified = max(version // 1_000_000_000, period * timeout)
+
+        headers = {'Cache-Control': 'public, no-cache'}
+        if cache_is_shared():
+            headers.update({'ETag': etag, 'Last-Modified': http_date(last_modified)})
+            if not_modified(request, etag, last_modified):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = f'public-response:{digest}'
+        data = cache.get(key)
+        if data is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, timeout=timeout)
+        return Response(data, headers=headers)
+
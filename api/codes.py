@@ -0,0 +1,143 @@
+"""
+Códigos de seguimiento de los pedidos sin consultas por pedido.
+
+Cada código sale de un número de secuencia único cifrado con una permutación
+con clave (una red Feistel sobre ``SECRET_KEY``) y escrito en 8 caracteres
+base 36. Como la permutación es biyectiva, números distintos dan códigos
+distintos, y los consecutivos no se parecen entre sí.
+
+Los números se reparten por bloques de ``BLOCK_SIZE``: cada proceso inserta
+una fila en ``OrderCodeBlock`` para obtener un bloque propio y lo consume en
+memoria, así que solo hay una consulta cada ``BLOCK_SIZE`` pedidos. La fila
+se inserta fuera de la transacción de quien pide el código (en un hilo con su
+propia conexión en autocommit), así que el bloque no se pierde aunque esa
+transacción se deshaga. En SQLite la transacción abierta retiene el bloqueo
+de escritura y la segunda conexión quedaría esperando: allí el bloque se
+inserta en la misma transacción y solo se reutiliza cuando esta se confirma;
+si se deshace se pide otro, porque SQLite podría repetir el número. Por eso en
+SQLite cada código pedido dentro de una transacción aún sin confirmar gasta un
+bloque entero y una consulta: los pedidos deben crearse de a uno por
+transacción, como en ``OrderViewSet.create``, para que el resto del bloque
+sirva a los siguientes.
+
+Los códigos aleatorios anteriores siguen en la misma tabla; la probabilidad
+de coincidir con uno es ínfima y el índice único sigue como red de seguridad.
+"""
+import hashlib
+import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+ALPHABET = string.digits + string.ascii_uppercase
+CODE_LENGTH = 8
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+BLOCK_SIZE = 1000
+
+# Feistel balanceado de 42 bits: el menor tamaño par que cubre 36^8
+HALF_BITS = 21
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+
+
+def _round_keys():
+    seed = hashlib.sha256(f'order-codes:{settings.SECRET_KEY}'.encode()).digest()
+    return [seed[i * 8:(i + 1) * 8] for i in range(ROUNDS)]
+
+
+def _round(key, value):
+    digest = hashlib.blake2b(value.to_bytes(3, 'big'), key=key, digest_size=4).digest()
+    return int.from_bytes(digest, 'big') & HALF_MASK
+
+
+def permute(number, keys=None):
+    """Permutación con clave de ``[0, 36^8)`` sobre sí mismo"""
+    keys = keys or _round_keys()
+    value = number
+    # Se cifra dentro del espacio de 42 bits hasta caer en el de los códigos
+    while True:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for key in keys:
+            left, right = right, left ^ _round(key, right)
+        value = (left << HALF_BITS) | right
+        if value < CODE_SPACE:
+            return value
+
+
+def encode(value):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+class _Block:
+    def __init__(self, block_id, committed=True):
+        if (block_id + 1) * BLOCK_SIZE > CODE_SPACE:
+            raise RuntimeError('Se agotó el espacio de códigos de seguimiento')
+        self.next = block_id * BLOCK_SIZE
+        self.end = self.next + BLOCK_SIZE
+        self.committed = committed
+
+    def confirm(self):
+        self.committed = True
+
+
+def _insert_block():
+    from .models import OrderCodeBlock
+    return OrderCodeBlock.objects.create().pk
+
+
+def _insert_block_autocommit():
+    # Se ejecuta en un hilo aparte: Django le abre una conexión propia
+    try:
+        return _insert_block()
+    finally:
+        connections[DEFAULT_DB_ALIAS].close()
+
+
+class CodeAllocator:
+    """Reparte números de secuencia por bloques; seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._block = None
+        self._keys = None
+
+    def _usable(self, block):
+        return block is not None and block.committed and block.next < block.end
+
+    def _allocate(self):
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return _Block(_insert_block())
+        if connection.vendor != 'sqlite':
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                return _Block(executor.submit(_insert_block_autocommit).result())
+        # Sin confirmar solo da un número: los siguientes esperan al commit
+        block = _Block(_insert_block(), committed=False)
+        transaction.on_commit(block.confirm)
+        return block
+
+    def next_number(self):
+        with self._lock:
+            if not self._usable(self._block):
+                self._block = self._allocate()
+            number = self._block.next
+            self._block.next += 1
+            return number
+
+    def next_code(self):
+        if self._keys is None:
+            self._keys = _round_keys()
+        return encode(permute(self.next_number(), self._keys))
+
+
+allocator = CodeAllocator()
+
+
+def next_order_code():
+    return allocator.next_code()
@@ -0,0 +1,147 @@
+"""
+Directorio de ubicaciones de negocios públicos.
+
+``LocationDirectoryEntry`` guarda cuántos negocios públicos con licencia
+vigente hay en cada provincia y municipio. ``LocationDirectoryMember``
+recuerda dónde se contó cada negocio y hasta cuándo, de modo que los cambios
+de ``Business`` y ``License`` solo suman o restan en las filas afectadas.
+Las licencias caducan sin guardarse: ``expire_members`` (comando
+``expire_location_directory``, programado) retira a los negocios vencidos, y
+mientras tanto la lectura descuenta los que ya vencieron sin escribir nada.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Business, License, LocationDirectoryEntry, LocationDirectoryMember
+
+# Ubicación con la que se crea el negocio por defecto de cada usuario
+UNSET_PROVINCE = 'No especificada'
+UNSET_MUNICIPALITY = 'No especificado'
+
+
+def _bump_entry(province, municipality, delta):
+    key = {'province': province, 'municipality': municipality}
+    if LocationDirectoryEntry.objects.filter(**key).update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            LocationDirectoryEntry.objects.create(count=max(delta, 0), **key)
+    except IntegrityError:
+        # Otra transacción creó la fila entre medias
+        LocationDirectoryEntry.objects.filter(**key).update(count=F('count') + delta)
+
+
+def sync_business(business_id):
+    """Cuenta el negocio en su ubicación actual o lo retira si ya no es visible"""
+    with transaction.atomic():
+        business = Business.objects.filter(pk=business_id).values(
+            'is_public', 'province', 'municipality', 'user_id'
+        ).first()
+        expires_at = None
+        if business and business['is_public']:
+            expires_at = License.objects.filter(
+                user_id=business['user_id'], expiration_date__gt=timezone.now()
+            ).values_list('expiration_date', flat=True).first()
+
+        member = LocationDirectoryMember.objects.select_for_update().filter(business_id=business_id).first()
+        location = (business['province'], business['municipality']) if expires_at else None
+        previous = (member.province, member.municipality) if member else None
+
+        if location != previous:
+            if previous:
+                _bump_entry(*previous, -1)
+            if location:
+                _bump_entry(*location, 1)
+            bump_version('locations')
+
+        if location is None:
+            if member:
+                member.delete()
+        elif member:
+            member.province, member.municipality = location
+            member.expires_at = expires_at
+            member.save(update_fields=['province', 'municipality', 'expires_at'])
+        else:
+            LocationDirectoryMember.objects.create(
+                business_id=business_id, province=location[0], municipality=location[1], expires_at=expires_at
+            )
+
+
+def remove_business(business_id):
+    with transaction.atomic():
+        member = LocationDirectoryMember.objects.select_for_update().filter(business_id=business_id).first()
+        if member:
+            _bump_entry(member.province, member.municipality, -1)
+            member.delete()
+            bump_version('locations')
+
+
+def expire_members():
+    """Retira del directorio los negocios cuya licencia ya venció"""
+    expired = list(LocationDirectoryMember.objects.filter(
+        expires_at__lte=timezone.now()
+    ).values_list('business_id', flat=True))
+    for business_id in expired:
+        # Puede que la licencia se haya renovado sin pasar por las señales
+        sync_business(business_id)
+    return len(expired)
+
+
+def location_directory():
+    """
+    ``[{province, count, municipalities: [{municipality, count}]}]`` por orden
+    alfabético. Solo lee: los negocios con la licencia vencida que
+    ``expire_members`` aún no retiró se descuentan aquí.
+    """
+    expired = Counter({
+        (row['province'], row['municipality']): row['total']
+        for row in LocationDirectoryMember.objects.filter(expires_at__lte=timezone.now()).values(
+            'province', 'municipality'
+        ).annotate(total=Count('pk'))
+    })
+    provinces = defaultdict(list)
+    # Los negocios recién creados llevan la ubicación de relleno de crear_licencia_y_negocio
+    entries = LocationDirectoryEntry.objects.filter(count__gt=0).exclude(
+        province__in=['', UNSET_PROVINCE]
+    ).exclude(municipality__in=['', UNSET_MUNICIPALITY])
+    for province, municipality, count in entries.order_by('province', 'municipality').values_list(
+        'province', 'municipality', 'count'
+    ):
+        count -= expired[province, municipality]
+        if count > 0:
+            provinces[province].append({'municipality': municipality, 'count': count})
+    return [
+        {'province': province, 'count': sum(item['count'] for item in municipalities),
+         'municipalities': municipalities}
+        for province, municipalities in provinces.items()
+    ]
+
+
+def rebuild_directory():
+    """Recalcula el directorio completo desde los negocios y licencias"""
+    with transaction.atomic():
+        LocationDirectoryMember.objects.all().delete()
+        LocationDirectoryEntry.objects.all().delete()
+        now = timezone.now()
+        members = [
+            LocationDirectoryMember(business_id=pk, province=province, municipality=municipality,
+                                    expires_at=expires_at)
+            for pk, province, municipality, expires_at in Business.objects.filter(
+                is_public=True, user__license__expiration_date__gt=now
+            ).values_list('pk', 'province', 'municipality', 'user__license__expiration_date').iterator()
+        ]
+        LocationDirectoryMember.objects.bulk_create(members, batch_size=1000)
+
+        counts = defaultdict(int)
+        for member in members:
+            counts[member.province, member.municipality] += 1
+        LocationDirectoryEntry.objects.bulk_create(
+            LocationDirectoryEntry(province=province, municipality=municipality, count=count)
+            for (province, municipality), count in counts.items()
+        )
+    bump_version('locations')
+    return len(members)
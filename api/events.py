@@ -0,0 +1,83 @@
+"""
+Avisos en vivo del estado de los pedidos.
+
+``broker`` reparte, dentro del proceso, cada cambio de estado de un pedido a
+las conexiones abiertas en ``/api/track/<código>/events/`` (ver
+``track_order_events``). Cada suscriptor es una cola de asyncio en el bucle
+del servidor ASGI; los cambios se publican desde las vistas síncronas al
+confirmarse la transacción, con ``call_soon_threadsafe``.
+
+Es un broker en memoria: con varios procesos cada uno solo avisa a sus
+propias conexiones, así que el servidor ASGI debe ejecutarse con un único
+proceso para que todos los clientes reciban los cambios.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+
+# Solo importa el último estado: si un cliente se atrasa se descartan los viejos
+QUEUE_SIZE = 8
+FINAL_STATUSES = ('delivered', 'cancelled')
+
+
+def order_event(order):
+    return {
+        'tracking_code': order.tracking_code,
+        'status': order.get_status_display(),
+        'status_code': order.status,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+    }
+
+
+def _put_latest(queue, payload):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(payload)
+
+
+class OrderBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, tracking_code):
+        """Cola que recibirá los cambios del pedido; debe llamarse desde el bucle de asyncio"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[tracking_code].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, tracking_code, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(tracking_code)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[tracking_code]
+
+    def publish(self, tracking_code, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(tracking_code, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put_latest, queue, payload)
+            except RuntimeError:
+                # El bucle ya se cerró
+                self.unsubscribe(tracking_code, (loop, queue))
+
+    def watchers(self, tracking_code=None):
+        with self._lock:
+            if tracking_code is not None:
+                return len(self._subscribers.get(tracking_code, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+broker = OrderBroker()
+
+
+def publish_order(order):
+    """Avisa del estado del pedido a sus suscriptores cuando se confirme la transacción"""
+    payload = order_event(order)
+    transaction.on_commit(lambda: broker.publish(order.tracking_code, payload))
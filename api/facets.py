@@ -0,0 +1,213 @@
+"""
+Facetas del catálogo público.
+
+``ProductFacetCount`` guarda, por negocio, cuántos productos públicos tiene
+en cada categoría, rango de precio, provincia y municipio. Al guardar o
+borrar un producto solo se suma o resta uno en las filas de sus valores
+anterior y nuevo, y solo si cambió algún campo de ``FACET_FIELDS``; al
+cambiar la ubicación de un negocio se mueven sus filas de provincia y
+municipio. Así leer los conteos del catálogo entero es sumar una tabla
+pequeña en lugar de agrupar todos los productos. ``rebuild_facets`` los
+recalcula desde cero.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Business, Product, ProductFacetCount
+
+# Campos de Product que cambian las facetas
+FACET_FIELDS = {'category', 'sale_price', 'is_public', 'business'}
+
+# Rangos de precio: (etiqueta, mínimo incluido, máximo excluido)
+PRICE_BUCKETS = [
+    ('0-100', Decimal('0'), Decimal('100')),
+    ('100-500', Decimal('100'), Decimal('500')),
+    ('500-1000', Decimal('500'), Decimal('1000')),
+    ('1000-5000', Decimal('1000'), Decimal('5000')),
+    ('5000+', Decimal('5000'), None),
+]
+
+DEFAULT_CATEGORY = 'Otros'
+
+
+def price_bucket(price):
+    for label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return label
+    return PRICE_BUCKETS[0][0]
+
+
+def facet_values(product):
+    """Valores de un producto que determinan sus facetas"""
+    return {
+        'business_id': product.business_id, 'category': product.category,
+        'sale_price': product.sale_price, 'is_public': product.is_public,
+    }
+
+
+def stored_facet_values(product_id):
+    return Product.objects.filter(pk=product_id).values('business_id', 'category', 'sale_price', 'is_public').first()
+
+
+def _product_keys(values):
+    # La ubicación depende del negocio: se resuelve solo si cambia
+    if not values or not values['is_public']:
+        return []
+    return [
+        ('category', (values['category'] or DEFAULT_CATEGORY)[:100]),
+        ('price', price_bucket(Decimal(values['sale_price'] or 0))),
+        ('location', ''),
+    ]
+
+
+def _bump(business_id, facet, value, delta):
+    key = {'business_id': business_id, 'facet': facet, 'value': value[:100]}
+    if ProductFacetCount.objects.filter(**key).update(count=Greatest(F('count') + delta, Value(0))):
+        return
+    if delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ProductFacetCount.objects.create(count=delta, **key)
+    except IntegrityError:
+        # Otra transacción creó la fila entre medias
+        ProductFacetCount.objects.filter(**key).update(count=F('count') + delta)
+
+
+def update_product_facets(previous, current):
+    """
+    Pasa un producto de los valores ``previous`` a ``current`` (``facet_values``;
+    ``None`` si no existía o ya no existe) sumando o restando uno en las filas
+    que cambian.
+    """
+    deltas = defaultdict(int)
+    for values, sign in ((previous, -1), (current, 1)):
+        for facet, value in _product_keys(values):
+            deltas[values['business_id'], facet, value] += sign
+
+    # Orden determinista para no interbloquear con otras transacciones
+    for (business_id, facet, value), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        if facet != 'location':
+            _bump(business_id, facet, value, delta)
+            continue
+        location = Business.objects.filter(pk=business_id).values('province', 'municipality').first()
+        if location is not None:
+            _bump(business_id, 'province', location['province'], delta)
+            _bump(business_id, 'municipality', location['municipality'], delta)
+
+
+def move_business_location(business_id, location):
+    """Pasa los conteos de provincia y municipio del negocio a su nueva ubicación"""
+    for facet in ('province', 'municipality'):
+        value = location[facet][:100]
+        previous = ProductFacetCount.objects.filter(business_id=business_id, facet=facet).exclude(value=value)
+        moved = previous.aggregate(total=Sum('count'))['total'] or 0
+        previous.delete()
+        if moved:
+            _bump(business_id, facet, value, moved)
+
+
+def refresh_business_facets(business_id):
+    with transaction.atomic():
+        business = Business.objects.filter(pk=business_id).values('province', 'municipality').first()
+        ProductFacetCount.objects.filter(business_id=business_id).delete()
+        if business is None:
+            return
+        ProductFacetCount.objects.bulk_create(_facet_rows(business_id, business))
+
+
+def _facet_rows(business_id, business):
+    counts = Counter()
+    for category, price in Product.objects.filter(
+        business_id=business_id, is_public=True
+    ).values_list('category', 'sale_price'):
+        counts['category', category or DEFAULT_CATEGORY] += 1
+        counts['price', price_bucket(price)] += 1
+
+    total = sum(count for (facet, _), count in counts.items() if facet == 'category')
+    if total:
+        counts['province', business['province']] += total
+        counts['municipality', business['municipality']] += total
+
+    return [
+        ProductFacetCount(business_id=business_id, facet=facet, value=value[:100], count=count)
+        for (facet, value), count in counts.items()
+    ]
+
+
+def rebuild_facets(business_ids=None):
+    """Recalcula las facetas de los negocios indicados (o de todos)"""
+    businesses = Business.objects.all()
+    if business_ids is not None:
+        businesses = businesses.filter(pk__in=business_ids)
+    total = 0
+    for business_id in businesses.values_list('pk', flat=True).iterator():
+        refresh_business_facets(business_id)
+        total += 1
+    return total
+
+
+def facet_filters(params):
+    """
+    Traduce los parámetros ``category``, ``province``, ``municipality``,
+    ``price`` (etiqueta de rango), ``min_price`` y ``max_price`` a filtros de
+    ``Product`` (un ``Q``). Los valores no válidos se ignoran.
+    """
+    filters = {}
+    conditions = Q()
+    if params.get('category') == DEFAULT_CATEGORY:
+        # Los productos sin categoría se cuentan como DEFAULT_CATEGORY
+        conditions &= Q(category__isnull=True) | Q(category='') | Q(category=DEFAULT_CATEGORY)
+    elif params.get('category'):
+        filters['category'] = params['category']
+    if params.get('province'):
+        filters['business__province'] = params['province']
+    if params.get('municipality'):
+        filters['business__municipality'] = params['municipality']
+
+    buckets = {label: (low, high) for label, low, high in PRICE_BUCKETS}
+    if params.get('price') in buckets:
+        low, high = buckets[params['price']]
+        filters['sale_price__gte'] = low
+        if high is not None:
+            filters['sale_price__lt'] = high
+    for param, lookup in (('min_price', 'sale_price__gte'), ('max_price', 'sale_price__lte')):
+        try:
+            filters[lookup] = Decimal(params[param])
+        except (KeyError, InvalidOperation):
+            pass
+    return conditions & Q(**filters)
+
+
+def facet_counts(params=None):
+    """
+    Conteos de productos públicos visibles por faceta. ``province`` y
+    ``municipality`` acotan los conteos al ser datos del negocio; las demás
+    facetas se cuentan sobre todo el catálogo de esos negocios.
+    """
+    params = params or {}
+    rows = ProductFacetCount.objects.filter(
+        count__gt=0,
+        business__is_public=True,
+        business__user__license__expiration_date__gt=timezone.now(),
+    )
+    if params.get('province'):
+        rows = rows.filter(business__province=params['province'])
+    if params.get('municipality'):
+        rows = rows.filter(business__municipality=params['municipality'])
+
+    result = {facet: [] for facet, _ in ProductFacetCount.FACET_CHOICES}
+    for row in rows.values('facet', 'value').annotate(total=Sum('count')).order_by('facet', '-total', 'value'):
+        result[row['facet']].append({'value': row['value'], 'count': row['total']})
+
+    # Los rangos de precio se devuelven en su orden natural
+    order = {label: position for position, (label, _, _) in enumerate(PRICE_BUCKETS)}
+    result['price'].sort(key=lambda item: order.get(item['value'], len(order)))
+    return result
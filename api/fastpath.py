@@ -0,0 +1,137 @@
+"""
+Renderizado rápido de solo lectura para los endpoints públicos.
+
+``ValuesRenderer`` produce la misma salida que un serializer de DRF pero a
+partir de ``.values()``: los campos del serializer se resuelven una sola vez
+(consulta, conversión de cada valor) y cada fila se arma con un bucle simple,
+sin crear instancias de modelo ni recorrer los campos por objeto. La
+comparación con DRF está en ``python manage.py benchmark_serializers``.
+"""
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+def _identity(value, request):
+    return value
+
+
+def _file_url(storage, absolute):
+    def convert(name, request):
+        if not name:
+            return None
+        url = storage.url(name)
+        if absolute and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return convert
+
+
+def _file_name(name, request):
+    return name or None
+
+
+def _field_converter(field):
+    def convert(value, request):
+        return field.to_representation(value)
+    return convert
+
+
+class ValuesRenderer:
+    """
+    Compila ``serializer_class`` en una lista de ``(clave, consulta, conversión)``.
+
+    Soporta los campos de modelo y relaciones con ``source`` con puntos;
+    los ``SerializerMethodField`` se describen en ``method_fields`` como
+    ``{nombre: (consulta, conversión)}``.
+    """
+
+    def __init__(self, serializer_class, method_fields=None):
+        self.serializer_class = serializer_class
+        self.method_fields = method_fields or {}
+        self._columns = None
+
+    @property
+    def columns(self):
+        # Se compila en el primer uso: los serializers necesitan las apps cargadas
+        if self._columns is None:
+            self._columns = self._compile()
+        return self._columns
+
+    def _compile(self):
+        model = self.serializer_class.Meta.model
+        columns = []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                lookup, convert = self.method_fields[name]
+            elif isinstance(field, serializers.FileField):
+                storage = model._meta.get_field(field.source).storage
+                use_url = getattr(field, 'use_url', True)
+                lookup, convert = field.source, _file_url(storage, absolute=True) if use_url else _file_name
+            else:
+                lookup = field.source.replace('.', '__')
+                if isinstance(field, serializers.RelatedField):
+                    convert = _identity
+                elif isinstance(field, (serializers.CharField, serializers.IntegerField,
+                                        serializers.BooleanField)) and not getattr(field, 'choices', None):
+                    # Los valores ya vienen con el tipo de la columna
+                    convert = _identity
+                else:
+                    convert = _field_converter(field)
+            columns.append((name, lookup, convert))
+        return columns
+
+    def values(self, queryset):
+        """``queryset.values()`` con las columnas que necesita el serializer"""
+        return queryset.values(*dict.fromkeys(lookup for _, lookup, _ in self.columns))
+
+    def rows(self, records, request=None):
+        """Convierte diccionarios de ``values()`` en la salida del serializer"""
+        columns = self.columns
+        rows = []
+        for values in records:
+            row = {}
+            for name, lookup, convert in columns:
+                value = values[lookup]
+                row[name] = None if value is None else convert(value, request)
+            rows.append(row)
+        return rows
+
+    def render(self, queryset, request=None):
+        return self.rows(self.values(queryset), request)
+
+
+def image_url(model, field_name='image'):
+    """Conversión para ``image_url``: URL relativa de la imagen o ``None``"""
+    return (field_name, _file_url(model._meta.get_field(field_name).storage, absolute=False))
+
+
+class ValuesReadMixin:
+    """
+    ``list`` y ``retrieve`` de un viewset de solo lectura renderizados con
+    ``renderer`` en lugar del serializer. Respeta filtros y paginación.
+    """
+    renderer = None
+
+    def extend_rows(self, rows):
+        """Punto de extensión para añadir datos calculados a las filas"""
+        return rows
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.renderer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.extend_rows(self.renderer.rows(page, request)))
+        return Response(self.extend_rows(self.renderer.rows(queryset, request)))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        rows = self.extend_rows(self.renderer.rows(self.renderer.values(queryset)[:1], request))
+        if not rows:
+            raise Http404
+        return Response(rows[0])
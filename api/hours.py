@@ -0,0 +1,125 @@
+"""
+Horario de apertura compilado.
+
+Al guardar ``BusinessSettings`` el JSON de ``business_hours`` se traduce a
+filas ``BusinessHoursInterval`` con los minutos de la semana en que abre y
+cierra el negocio (0 = lunes 00:00, hora de ``BUSINESS_HOURS_TIME_ZONE``).
+Saber qué negocios están abiertos es entonces una consulta por rango sobre
+un índice, sin leer ni interpretar el JSON de cada negocio.
+"""
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import BusinessHoursInterval
+
+DAYS = ['lunes', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+def _local_now():
+    return timezone.now().astimezone(ZoneInfo(getattr(settings, 'BUSINESS_HOURS_TIME_ZONE', 'America/Havana')))
+
+
+def minute_of_week(moment=None):
+    moment = moment or _local_now()
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def _parse_time(value):
+    try:
+        hours, minutes = str(value).split(':')[:2]
+        hours, minutes = int(hours), int(minutes)
+    except (TypeError, ValueError):
+        return None
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > MINUTES_PER_DAY:
+        return None
+    return hours * 60 + minutes
+
+
+def compile_intervals(business_hours):
+    """
+    Intervalos ``(abre, cierra)`` en minutos de la semana, ordenados y sin
+    solapes. Un cierre anterior o igual a la apertura pasa al día siguiente
+    y lo que cruza el domingo a medianoche se parte en dos. Las franjas mal
+    formadas se ignoran.
+    """
+    intervals = []
+    for index, day in enumerate(DAYS):
+        config = (business_hours or {}).get(day)
+        if not isinstance(config, dict) or not config.get('abierto'):
+            continue
+        for slot in config.get('horario') or []:
+            if not isinstance(slot, dict):
+                continue
+            opens, closes = _parse_time(slot.get('apertura')), _parse_time(slot.get('cierre'))
+            if opens is None or closes is None:
+                continue
+            if closes <= opens:
+                closes += MINUTES_PER_DAY
+            start, end = index * MINUTES_PER_DAY + opens, index * MINUTES_PER_DAY + closes
+            if end > MINUTES_PER_WEEK:
+                intervals.append((0, end - MINUTES_PER_WEEK))
+                end = MINUTES_PER_WEEK
+            intervals.append((start, end))
+
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compile_business_hours(business_id, business_hours):
+    with transaction.atomic():
+        BusinessHoursInterval.objects.filter(business_id=business_id).delete()
+        BusinessHoursInterval.objects.bulk_create(
+            BusinessHoursInterval(business_id=business_id, opens_at=start, closes_at=end)
+            for start, end in compile_intervals(business_hours)
+        )
+
+
+def filter_open_now(queryset, open_now=True):
+    """Filtra negocios abiertos (o cerrados) en este momento"""
+    minute = minute_of_week()
+    is_open = Exists(BusinessHoursInterval.objects.filter(
+        business=OuterRef('pk'), opens_at__lte=minute, closes_at__gt=minute
+    ))
+    return queryset.filter(is_open if open_now else ~is_open)
+
+
+def open_status(business_ids):
+    """
+    ``{business_id: {'is_open_now': bool, 'opens_next_at': datetime | None}}``
+    con una sola consulta. ``opens_next_at`` es la próxima apertura posterior
+    a este momento, en la hora local de los negocios.
+    """
+    now = _local_now().replace(second=0, microsecond=0)
+    minute = minute_of_week(now)
+    week_start = now - timedelta(minutes=minute)
+
+    intervals = {business_id: [] for business_id in business_ids}
+    for business_id, opens_at, closes_at in BusinessHoursInterval.objects.filter(
+        business_id__in=business_ids
+    ).values_list('business_id', 'opens_at', 'closes_at'):
+        intervals[business_id].append((opens_at, closes_at))
+
+    status = {}
+    for business_id, ranges in intervals.items():
+        # Lo que empieza el lunes a las 00:00 continúa el domingo si ese día cierra a medianoche
+        wraps = any(closes_at == MINUTES_PER_WEEK for _, closes_at in ranges)
+        openings = [opens_at for opens_at, _ in ranges if not (wraps and opens_at == 0)]
+        # Las aperturas ya pasadas esta semana se repiten la próxima
+        offsets = [opens_at if opens_at > minute else opens_at + MINUTES_PER_WEEK for opens_at in openings]
+        status[business_id] = {
+            'is_open_now': any(opens_at <= minute < closes_at for opens_at, closes_at in ranges),
+            'opens_next_at': week_start + timedelta(minutes=min(offsets)) if offsets else None,
+        }
+    return status
@@ -0,0 +1,144 @@
+"""
+Variantes redimensionadas de las imágenes subidas.
+
+Al guardarse un ``Product``, ``Business`` o ``Contact`` con una imagen nueva,
+se generan tras confirmar la transacción (en un hilo aparte, fuera de la
+petición) versiones WebP y JPEG de cada tamaño de ``VARIANT_SIZES``. Los
+nombres llevan el hash del contenido original, así que una misma imagen no se
+procesa dos veces y las URL pueden cachearse indefinidamente.
+
+Los nombres quedan en el campo ``image_variants`` del modelo::
+
+    {"source": "product_images/foto.jpg",
+     "variants": {"thumb": {"webp": "...", "jpeg": "..."}, ...}}
+
+``python manage.py generate_image_variants`` genera las que falten.
+"""
+import hashlib
+import logging
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .cache import bump_version, business_namespace
+
+logger = logging.getLogger(__name__)
+
+# Lado mayor en píxeles de cada variante
+VARIANT_SIZES = {
+    'thumb': 200,
+    'medium': 600,
+    'large': 1200,
+}
+QUALITY = 80
+
+
+def needs_variants(instance):
+    """Si la imagen actual no coincide con la de las variantes guardadas"""
+    image_name = instance.image.name if instance.image else ''
+    return (instance.image_variants or {}).get('source', '') != image_name
+
+
+def schedule_variants(instance):
+    """Genera las variantes de ``instance`` cuando se confirme la transacción"""
+    model, pk = type(instance), instance.pk
+
+    def run():
+        if getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+            threading.Thread(target=_generate_in_thread, args=(model, pk), daemon=True).start()
+        else:
+            generate_variants(model, pk)
+    transaction.on_commit(run)
+
+
+def _generate_in_thread(model, pk):
+    try:
+        generate_variants(model, pk)
+    except Exception:
+        logger.exception('Error al generar las variantes de %s %s', model.__name__, pk)
+    finally:
+        connection.close()
+
+
+def generate_variants(model, pk):
+    """
+    Genera y guarda las variantes de la imagen actual del objeto. Devuelve
+    ``False`` si el objeto ya no existe o la imagen cambió mientras tanto.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return False
+    source = instance.image.name if instance.image else ''
+
+    variants = {}
+    if source:
+        try:
+            with instance.image.open('rb') as image_file:
+                content = image_file.read()
+            variants = _write_variants(instance.image.storage, instance.image.field.upload_to, content)
+        except (OSError, Image.DecompressionBombError):
+            # Se registra la imagen como procesada para no reintentar un archivo dañado
+            logger.exception('No se pudo procesar la imagen %s', source)
+
+    # Solo si la imagen sigue siendo la misma que se procesó
+    updated = model.objects.filter(pk=pk, image=source).update(
+        image_variants={'source': source, 'variants': variants}
+    )
+    if updated:
+        _invalidate_cache(instance)
+    return bool(updated)
+
+
+def _write_variants(storage, upload_to, content):
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    directory = os.path.join(str(upload_to).rstrip('/'), 'variants')
+    with Image.open(BytesIO(content)) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in original.getbands() or 'transparency' in original.info
+            original = original.convert('RGBA' if has_alpha else 'RGB')
+        variants = {}
+        for size_name, size in VARIANT_SIZES.items():
+            names = {
+                'webp': os.path.join(directory, f'{digest}-{size_name}.webp'),
+                'jpeg': os.path.join(directory, f'{digest}-{size_name}.jpg'),
+            }
+            # Mismo contenido, mismo nombre: si ya existen no se vuelven a generar
+            if not all(storage.exists(name) for name in names.values()):
+                resized = original.copy()
+                resized.thumbnail((size, size), Image.LANCZOS)
+                _save(storage, names['webp'], resized, 'WEBP', quality=QUALITY, method=6)
+                _save(storage, names['jpeg'], resized.convert('RGB'), 'JPEG',
+                      quality=QUALITY, optimize=True, progressive=True)
+            variants[size_name] = names
+    return variants
+
+
+def _save(storage, name, image, format, **options):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **options)
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _invalidate_cache(instance):
+    # Los listados públicos exponen las variantes de productos y negocios
+    model_name = instance._meta.model_name
+    if model_name == 'product':
+        bump_version('products', business_namespace(instance.business_id))
+    elif model_name == 'business':
+        bump_version('products', 'businesses', business_namespace(instance.pk))
+
+
+def variant_urls(image_variants, storage):
+    """``{tamaño: {formato: url}}`` a partir del valor de ``image_variants``"""
+    return {
+        size_name: {format: storage.url(name) for format, name in names.items()}
+        for size_name, names in (image_variants or {}).get('variants', {}).items()
+    }
@@ -0,0 +1,256 @@
+"""
+Actualización de stock y saldos.
+
+Todos los cambios de ``Product.stock`` y ``Card.balance`` pasan por aquí. En
+lugar de leer la fila, modificarla en Python y guardarla completa, se aplica
+un delta con un ``UPDATE`` condicional sobre la columna afectada, de modo que
+dos terminales vendiendo el mismo producto no se pisan los cambios.
+
+Para evitar interbloqueos, cuando una operación toca varias filas se
+actualizan siempre primero los productos y luego las tarjetas, cada grupo en
+orden de pk (ver ``apply_deltas``).
+
+Cada cambio de stock queda además registrado en ``StockMovement``. Con las
+fotos periódicas de ``StockSnapshot`` el stock en cualquier instante se
+obtiene con la última foto anterior más la suma de un rango acotado de
+movimientos (ver ``stock_at``).
+
+Cada cambio de saldo queda registrado en ``CardTransaction`` con el saldo
+resultante, y ``CardBalanceCheckpoint`` guarda el saldo de cierre de cada día
+con movimientos, de modo que un extracto cuesta un registro por día en lugar
+de uno por transacción (ver ``card_statement``).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import F, Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_version, business_namespace
+from .models import (
+    Product, Card, StockMovement, StockSnapshot, CardTransaction, CardBalanceCheckpoint
+)
+
+
+def adjust_stock(product_id, delta, reason, reference_id=None, keep_reserved=True):
+    """
+    Suma ``delta`` al stock del producto y registra el movimiento.
+
+    Si el delta es negativo solo se aplica cuando hay stock suficiente sin
+    tocar las unidades reservadas por pedidos; en caso contrario se lanza
+    ``ValidationError``. Los ajustes manuales pasan ``keep_reserved=False``
+    porque corrigen el stock físico.
+    """
+    _update_stock(product_id, delta, keep_reserved)
+    StockMovement.objects.create(
+        product_id=product_id, quantity=delta, reason=reason, reference_id=reference_id
+    )
+
+
+def _update_stock(product_id, delta, keep_reserved=True):
+    queryset = Product.objects.filter(pk=product_id)
+    if delta < 0:
+        floor = F('reserved') - delta if keep_reserved else -delta
+        queryset = queryset.filter(stock__gte=floor)
+    if queryset.update(stock=F('stock') + delta):
+        _stock_changed(product_id)
+        return
+
+    product = Product.objects.filter(pk=product_id).values('stock', 'reserved').first()
+    if product is None:
+        raise Product.DoesNotExist(f"El producto {product_id} no existe")
+    if keep_reserved and product['reserved']:
+        raise ValidationError(
+            f"Stock insuficiente. Solo hay {max(product['stock'] - product['reserved'], 0)} unidades "
+            f"disponibles ({product['reserved']} reservadas para pedidos)."
+        )
+    raise ValidationError(f"Stock insuficiente. Solo hay {product['stock']} unidades disponibles.")
+
+
+def _stock_changed(product_id):
+    # Solo se invalida el escaparate del negocio: invalidar el catálogo global
+    # en cada venta lo dejaría sin caché. El catálogo muestra el stock con el
+    # retraso de PUBLIC_CACHE_TIMEOUT como máximo
+    def bump():
+        business_ids = Product.objects.filter(pk=product_id).values_list('business_id', flat=True)
+        bump_version(*(business_namespace(business_id) for business_id in business_ids))
+    # El cambio ya está confirmado: si la invalidación falla se registra y no se
+    # informa al cliente de un error sobre una venta que sí se guardó
+    transaction.on_commit(bump, robust=True)
+
+
+def adjust_balance(card_id, delta, reason, reference_id=None, require_funds=False):
+    """
+    Suma ``delta`` al saldo de la tarjeta y registra la transacción.
+
+    Con ``require_funds`` un delta negativo solo se aplica si el saldo alcanza;
+    en caso contrario se lanza ``ValidationError``. Devuelve el saldo nuevo.
+    """
+    _update_balance(card_id, delta, require_funds)
+    balances = record_card_transactions([(card_id, delta, reason, reference_id)])
+    return balances[int(card_id)]
+
+
+def _update_balance(card_id, delta, require_funds):
+    queryset = Card.objects.filter(pk=card_id)
+    if require_funds and delta < 0:
+        queryset = queryset.filter(balance__gte=-delta)
+    if queryset.update(balance=F('balance') + delta):
+        return
+
+    if not Card.objects.filter(pk=card_id).exists():
+        raise Card.DoesNotExist(f"La tarjeta {card_id} no existe")
+    raise ValidationError("La tarjeta no tiene saldo suficiente")
+
+
+def apply_deltas(stock=None, balances=None, require_funds=False):
+    """
+    Aplica varios deltas en orden determinista: productos y luego tarjetas,
+    cada grupo ordenado por pk.
+
+    ``stock`` y ``balances`` son diccionarios ``{pk: delta}``. Debe llamarse
+    dentro de una transacción para que un fallo deshaga los deltas previos.
+    No registra movimientos: quien agrega los deltas debe registrar cada
+    movimiento de origen con ``record_stock_movements`` y
+    ``record_card_transactions``.
+    """
+    for product_id in sorted(stock or {}):
+        if stock[product_id]:
+            _update_stock(product_id, stock[product_id])
+    for card_id in sorted(balances or {}):
+        if balances[card_id]:
+            _update_balance(card_id, balances[card_id], require_funds)
+
+
+def record_stock_movements(movements):
+    """Registra en bloque movimientos ``(product_id, delta, reason, reference_id)``"""
+    now = timezone.now()
+    StockMovement.objects.bulk_create(
+        StockMovement(product_id=product_id, quantity=delta, reason=reason,
+                      reference_id=reference_id, created_at=now)
+        for product_id, delta, reason, reference_id in movements
+    )
+
+
+def stock_at(product_id, at):
+    """
+    Stock del producto en el instante ``at``: última foto anterior más los
+    movimientos registrados desde entonces.
+    """
+    snapshot = StockSnapshot.objects.filter(
+        product_id=product_id, taken_at__lte=at
+    ).order_by('-taken_at').values('taken_at', 'stock').first()
+
+    movements = StockMovement.objects.filter(product_id=product_id, created_at__lte=at)
+    base = 0
+    if snapshot:
+        movements = movements.filter(created_at__gt=snapshot['taken_at'])
+        base = snapshot['stock']
+    return base + (movements.aggregate(total=Sum('quantity'))['total'] or 0)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def take_stock_snapshots(at):
+    """
+    Guarda una foto en ``at`` para cada producto con movimientos desde su
+    última foto. El valor se calcula desde el propio registro, así la foto
+    es coherente con los movimientos aunque el stock haya cambiado después.
+
+    Devuelve la cantidad de fotos creadas.
+    """
+    last_snapshot = StockSnapshot.objects.filter(
+        product=OuterRef('pk'), taken_at__lte=at
+    ).order_by('-taken_at')
+    moved = StockMovement.objects.filter(
+        product=OuterRef('pk'),
+        created_at__gt=OuterRef('last_taken_at'),
+        created_at__lte=at,
+    ).values('product').annotate(total=Sum('quantity')).values('total')
+
+    products = Product.objects.annotate(
+        last_taken_at=Coalesce(Subquery(last_snapshot.values('taken_at')[:1]), Value(EPOCH)),
+        last_stock=Coalesce(Subquery(last_snapshot.values('stock')[:1]), Value(0)),
+        moved=Subquery(moved),
+    ).filter(moved__isnull=False).values_list('pk', 'last_stock', 'moved')
+
+    snapshots = StockSnapshot.objects.bulk_create(
+        StockSnapshot(product_id=pk, taken_at=at, stock=last_stock + moved)
+        for pk, last_stock, moved in products.iterator()
+    )
+    return len(snapshots)
+
+
+def record_card_transactions(transactions):
+    """
+    Registra en bloque transacciones ``(card_id, delta, reason, reference_id)``
+    ya aplicadas al saldo, en el orden en que ocurrieron, y actualiza el
+    cierre del día de cada tarjeta.
+
+    El saldo resultante de cada transacción se reconstruye hacia atrás desde
+    el saldo actual, por lo que debe llamarse en la misma transacción que
+    aplicó los deltas. Devuelve el saldo actual de cada tarjeta.
+    """
+    transactions = [(int(card_id), *rest) for card_id, *rest in transactions]
+    if not transactions:
+        return {}
+    balances = dict(Card.objects.filter(
+        pk__in={card_id for card_id, *_ in transactions}
+    ).values_list('pk', 'balance'))
+
+    now = timezone.now()
+    running = dict(balances)
+    rows = []
+    for card_id, delta, reason, reference_id in reversed(transactions):
+        rows.append(CardTransaction(
+            card_id=card_id, amount=delta, balance_after=running[card_id],
+            reason=reason, reference_id=reference_id, created_at=now
+        ))
+        running[card_id] -= delta
+    rows.reverse()
+    CardTransaction.objects.bulk_create(rows)
+
+    today = timezone.localdate(now)
+    CardBalanceCheckpoint.objects.bulk_create(
+        [CardBalanceCheckpoint(card_id=card_id, day=today, balance=balance)
+         for card_id, balance in balances.items()],
+        update_conflicts=True,
+        unique_fields=['card', 'day'],
+        update_fields=['balance'],
+    )
+    return balances
+
+
+def balance_at(card_id, at):
+    """Saldo de la tarjeta en el instante ``at``, o ``None`` si no hay registro"""
+    return CardTransaction.objects.filter(
+        card_id=card_id, created_at__lte=at
+    ).order_by('-created_at', '-id').values_list('balance_after', flat=True).first()
+
+
+def card_statement(card_id, start, end):
+    """
+    Saldo de cierre diario de la tarjeta entre las fechas ``start`` y ``end``.
+
+    Lee solo los cierres guardados en el rango y el anterior a ``start``; los
+    días sin movimientos repiten el cierre del día previo.
+    """
+    opening = CardBalanceCheckpoint.objects.filter(
+        card_id=card_id, day__lt=start
+    ).order_by('-day').values_list('balance', flat=True).first()
+    closings = dict(CardBalanceCheckpoint.objects.filter(
+        card_id=card_id, day__gte=start, day__lte=end
+    ).values_list('day', 'balance'))
+
+    days = []
+    balance = opening
+    day = start
+    while day <= end:
+        balance = closings.get(day, balance)
+        days.append({'day': day, 'closing_balance': balance, 'has_movements': day in closings})
+        day += timedelta(days=1)
+
+    return {'opening_balance': opening, 'closing_balance': balance, 'days': days}
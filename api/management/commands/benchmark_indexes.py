@@ -0,0 +1,142 @@
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import Product, Sale, Purchase, Expense, Contact, Order
+
+# Índices compuestos de la migración 0007 que se comparan
+BENCHMARK_INDEXES = [
+    'sale_business_created_idx',
+    'purchase_business_created_idx',
+    'expense_business_created_idx',
+    'contact_business_created_idx',
+    'order_business_created_idx',
+    'order_business_status_idx',
+    'product_public_category_idx',
+]
+
+CATEGORIES = ['Alimentos', 'Bebidas', 'Aseo', 'Ropa', 'Electrónica', 'Hogar', 'Otros']
+STATUSES = [status for status, _ in Order.STATUS_CHOICES]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara los planes de consulta (EXPLAIN) y los tiempos de las consultas '
+        'más frecuentes por negocio con y sin los índices compuestos. Siembra sus '
+        'propios datos dentro de una transacción que se deshace al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--businesses', type=int, default=20, help='Negocios a crear')
+        parser.add_argument('--rows', type=int, default=5000, help='Filas por negocio y tabla')
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por consulta')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            businesses = self.seed(options['businesses'], options['rows'])
+            queries = self.queries(businesses[len(businesses) // 2])
+
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            with_indexes = self.measure('Con índices', queries, options['repeat'])
+
+            # DROP INDEX es transaccional en SQLite y PostgreSQL: el rollback final lo restaura
+            with connection.cursor() as cursor:
+                for name in BENCHMARK_INDEXES:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                cursor.execute('ANALYZE')
+            without_indexes = self.measure('Sin índices', queries, options['repeat'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Resumen (ms por consulta)'))
+            for label in queries:
+                before, after = without_indexes[label], with_indexes[label]
+                self.stdout.write(
+                    f"  {label}: sin índices {before:.2f}  con índices {after:.2f}  "
+                    f"(x{before / after if after else 0:.1f})"
+                )
+
+            # Deshace los datos sembrados y restaura los índices
+            transaction.set_rollback(True)
+
+    def seed(self, business_count, rows):
+        self.stdout.write(f'Sembrando {business_count} negocios con {rows} filas por tabla...')
+        now = timezone.now()
+        businesses = []
+        for _ in range(business_count):
+            user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:12]}')
+            business = user.business
+            businesses.append(business)
+
+            def moment():
+                return now - timedelta(minutes=random.randint(0, 60 * 24 * 365))
+
+            # bulk_create omite las señales y la validación de límites del plan
+            products = Product.objects.bulk_create(
+                Product(business=business, name=f'Producto {i}', stock=1000,
+                        category=random.choice(CATEGORIES), is_public=random.random() < 0.7,
+                        sale_price=10, purchase_price=5, created_at=moment())
+                for i in range(max(rows // 10, 1))
+            )
+            Contact.objects.bulk_create(
+                (Contact(business=business, name=f'Contacto {i}', number='0', created_at=moment())
+                 for i in range(rows)),
+                batch_size=1000,
+            )
+            Sale.objects.bulk_create(
+                (Sale(business=business, product=random.choice(products), quantity=1,
+                      unit_price=10, created_at=moment()) for _ in range(rows)),
+                batch_size=1000,
+            )
+            Purchase.objects.bulk_create(
+                (Purchase(business=business, product=random.choice(products), quantity=1,
+                          unit_price=5, created_at=moment()) for _ in range(rows)),
+                batch_size=1000,
+            )
+            Expense.objects.bulk_create(
+                (Expense(business=business, description='Gasto', amount=1, created_at=moment())
+                 for _ in range(rows)),
+                batch_size=1000,
+            )
+            # Código explícito para no consultar la tabla por cada pedido
+            Order.objects.bulk_create(
+                (Order(business=business, tracking_code=uuid.uuid4().hex[:8].upper(),
+                       customer_name='Cliente', customer_phone='0', delivery_type='pickup',
+                       status=random.choice(STATUSES), created_at=moment())
+                 for _ in range(rows)),
+                batch_size=1000,
+            )
+        return businesses
+
+    def queries(self, business):
+        month_ago = timezone.now() - timedelta(days=30)
+        return {
+            'Ventas recientes': Sale.objects.filter(business=business).order_by('-created_at', '-id')[:50],
+            'Compras del mes': Purchase.objects.filter(business=business, created_at__gte=month_ago),
+            'Gastos recientes': Expense.objects.filter(business=business).order_by('-created_at', '-id')[:50],
+            'Contactos recientes': Contact.objects.filter(business=business).order_by('-created_at', '-id')[:50],
+            'Pedidos recientes': Order.objects.filter(business=business).order_by('-created_at', '-id')[:50],
+            'Pedidos pendientes': Order.objects.filter(
+                business=business, status='pending'
+            ).order_by('-created_at')[:50],
+            'Catálogo por categoría': Product.objects.filter(is_public=True, category='Bebidas'),
+        }
+
+    def measure(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        timings = {}
+        for label, queryset in queries.items():
+            self.stdout.write(f'  {label}')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            timings[label] = (time.perf_counter() - started) * 1000 / repeat
+            self.stdout.write(f'    {timings[label]:.2f} ms')
+        return timings
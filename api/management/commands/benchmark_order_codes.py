@@ -0,0 +1,76 @@
+import random
+import string
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.models import Order, generate_order_code
+
+CHARACTERS = string.ascii_uppercase + string.digits
+# Sentencias de control de la transacción que no cuentan como consultas
+TRANSACTION_SQL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def random_order_code():
+    """Generador anterior: código aleatorio y una consulta para ver si ya existe"""
+    while True:
+        code = ''.join(random.choices(CHARACTERS, k=8))
+        if not Order.objects.filter(tracking_code=code).exists():
+            return code
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara los pedidos insertados por segundo con el generador de códigos '
+        'aleatorio (una consulta por código) y con el de bloques sin consultas. '
+        'Cada pedido se confirma en su propia transacción, como en '
+        'OrderViewSet.create; el negocio sembrado y sus pedidos se borran al '
+        'terminar. En SQLite un código pedido en una transacción sin confirmar '
+        'gasta un bloque entero (ver api.codes).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000, help='Pedidos a insertar con cada generador')
+        parser.add_argument('--existing', type=int, default=20000,
+                            help='Pedidos previos, para que la tabla no esté vacía')
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(f'bench-{uuid.uuid4().hex[:12]}')
+        business = user.business
+        try:
+            Order.objects.bulk_create(
+                (self.order(business, ''.join(random.choices(CHARACTERS, k=8)))
+                 for _ in range(options['existing'])),
+                batch_size=1000, ignore_conflicts=True,
+            )
+
+            rates = []
+            for label, generate in (('Aleatorio + exists()', random_order_code),
+                                    ('Bloques sin consulta', generate_order_code)):
+                started = time.perf_counter()
+                for _ in range(options['orders']):
+                    with transaction.atomic():
+                        self.order(business, generate()).save()
+                rate = options['orders'] / (time.perf_counter() - started)
+                rates.append(rate)
+
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(100):
+                        with transaction.atomic():
+                            generate()
+                lookups = [query for query in queries if not query['sql'].startswith(TRANSACTION_SQL)]
+                self.stdout.write(f'{label}: {rate:.0f} pedidos/s, {len(lookups) / 100:.2f} consultas por código')
+
+            self.stdout.write(self.style.SUCCESS(f'Mejora: x{rates[1] / rates[0]:.2f}'))
+        finally:
+            # Borra el negocio sembrado y sus pedidos; los bloques usados se quedan
+            # para que no se repitan los números
+            user.delete()
+
+    def order(self, business, code):
+        return Order(business=business, tracking_code=code, customer_name='Cliente',
+                     customer_phone='55555555', delivery_type='pickup')
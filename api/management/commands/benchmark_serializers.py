@@ -0,0 +1,70 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.models import Product
+from api.serializers import PublicProductWithBusinessSerializer
+from api.views.public_views import PublicProductViewSet, public_product_renderer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el tiempo de serializar el catálogo público con DRF y con el '
+        'renderizado desde values(), por cada 1000 productos, y comprueba que '
+        'ambas salidas sean idénticas. Siembra sus propios datos dentro de una '
+        'transacción que se deshace al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000, help='Productos a crear')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por método')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['products'])
+            request = Request(APIRequestFactory().get('/api/public-products/', HTTP_HOST='localhost'))
+            view = PublicProductViewSet(request=request, action='list', format_kwarg=None, kwargs={})
+            queryset = view.get_queryset()
+
+            def drf():
+                return PublicProductWithBusinessSerializer(
+                    queryset.all(), many=True, context=view.get_serializer_context()
+                ).data
+
+            def fast():
+                return public_product_renderer.render(queryset.all(), request)
+
+            results = {}
+            for label, render in (('DRF ModelSerializer', drf), ('values()', fast)):
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    data = render()
+                elapsed = (time.perf_counter() - started) / options['repeat']
+                per_thousand = elapsed * 1000 / max(len(data), 1) * 1000
+                results[label] = (data, per_thousand)
+                self.stdout.write(f'{label}: {len(data)} productos, {per_thousand:.1f} ms por 1000 productos')
+
+            (drf_data, drf_time), (fast_data, fast_time) = results.values()
+            self.stdout.write(f'Mejora: x{drf_time / fast_time:.1f}')
+            if [dict(row) for row in drf_data] == fast_data:
+                self.stdout.write(self.style.SUCCESS('Las dos salidas son idénticas'))
+            else:
+                self.stdout.write(self.style.ERROR('Las salidas difieren'))
+
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        users = [User.objects.create_user(f'bench-{uuid.uuid4().hex[:12]}') for _ in range(max(count // 200, 1))]
+        # bulk_create omite las señales y la validación de límites del plan
+        Product.objects.bulk_create(
+            (Product(business=users[i % len(users)].business, name=f'Producto {i}',
+                     description='Descripción del producto', category='Otros',
+                     stock=i, sale_price=i + 0.5, purchase_price=i, image=f'product_images/{i}.webp' if i % 2 else None)
+             for i in range(count)),
+            batch_size=1000,
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.hours import compile_business_hours
+from api.models import BusinessSettings
+
+
+class Command(BaseCommand):
+    help = 'Compila los horarios de todos los negocios en intervalos semanales'
+
+    def handle(self, *args, **options):
+        compiled = 0
+        for business_id, business_hours in BusinessSettings.objects.values_list(
+            'business_id', 'business_hours'
+        ).iterator():
+            compile_business_hours(business_id, business_hours)
+            compiled += 1
+        self.stdout.write(self.style.SUCCESS(f'Se compilaron los horarios de {compiled} negocios'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.directory import expire_members
+
+
+class Command(BaseCommand):
+    help = 'Retira del directorio de ubicaciones los negocios cuya licencia ya venció'
+
+    def handle(self, *args, **options):
+        expired = expire_members()
+        self.stdout.write(self.style.SUCCESS(f'Se revisaron {expired} negocios con la licencia vencida'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.images import generate_variants, needs_variants
+from api.models import Product, Business, Contact
+
+
+class Command(BaseCommand):
+    help = 'Genera las variantes redimensionadas de las imágenes que aún no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerar también las imágenes que ya tienen variantes'
+        )
+
+    def handle(self, *args, **options):
+        for model in (Product, Business, Contact):
+            generated = 0
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_variants')
+            for instance in queryset.iterator():
+                if options['force'] or needs_variants(instance):
+                    generate_variants(model, instance.pk)
+                    generated += 1
+            self.stdout.write(f'{model.__name__}: {generated} imágenes procesadas')
+        self.stdout.write(self.style.SUCCESS('Variantes generadas'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los conteos de facetas del catálogo público'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--business', type=int, action='append', dest='businesses',
+            help='Recalcular solo este negocio (se puede repetir)'
+        )
+
+    def handle(self, *args, **options):
+        refreshed = rebuild_facets(options['businesses'])
+        self.stdout.write(self.style.SUCCESS(f'Se recalcularon las facetas de {refreshed} negocios'))
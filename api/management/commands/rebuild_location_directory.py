@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.directory import rebuild_directory
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero el directorio de ubicaciones de negocios públicos'
+
+    def handle(self, *args, **options):
+        counted = rebuild_directory()
+        self.stdout.write(self.style.SUCCESS(f'Se contaron {counted} negocios activos'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from api.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los totales financieros diarios a partir de ventas, compras y gastos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--business', type=int, action='append', dest='businesses',
+            help='Recalcular solo este negocio (se puede repetir)'
+        )
+
+    def handle(self, *args, **options):
+        created = rebuild_rollups(options['businesses'])
+        self.stdout.write(self.style.SUCCESS(f'Se crearon {created} filas de totales diarios'))
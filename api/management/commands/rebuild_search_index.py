@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import search
+from api.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo de los productos'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('El motor de base de datos no tiene índice de búsqueda'))
+            return
+        with transaction.atomic():
+            indexed = search.rebuild_index(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'Se indexaron {indexed} productos'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = (
+        'Libera el stock apartado por los pedidos que siguen pendientes pasado '
+        'ORDER_RESERVATION_MINUTES desde su creación'
+    )
+
+    def handle(self, *args, **options):
+        released = release_expired()
+        self.stdout.write(self.style.SUCCESS(f'Se liberaron {released} reservas vencidas'))
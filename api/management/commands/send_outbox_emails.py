@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.outbox import send_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía los correos pendientes de la bandeja de salida por lotes, '
+        'reutilizando una conexión SMTP por lote. Sin --loop vacía la cola y termina.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Correos por lote y conexión')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Intentos antes de marcar como fallido')
+        parser.add_argument('--loop', action='store_true', help='Seguir esperando correos nuevos')
+        parser.add_argument('--interval', type=float, default=5, help='Segundos entre consultas con --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_pending(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f'Lote: {sent} enviados, {failed} con error')
+                # Si todo el lote falló (servidor caído), esperar antes de seguir
+                if sent:
+                    continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Enviados: {total_sent}  Con error: {total_failed}'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.ledger import take_stock_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        'Guarda una foto del stock de cada producto con movimientos desde su última foto. '
+        'Pensado para ejecutarse periódicamente (por ejemplo, una vez al día).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lag-minutes', type=int, default=5,
+            help='Toma la foto unos minutos en el pasado para no dejar fuera '
+                 'movimientos de transacciones que aún no han confirmado'
+        )
+
+    def handle(self, *args, **options):
+        at = timezone.now() - timezone.timedelta(minutes=options['lag_minutes'])
+        created = take_stock_snapshots(at)
+        self.stdout.write(self.style.SUCCESS(f'Se guardaron {created} fotos de stock a las {at:%Y-%m-%d %H:%M:%S}'))
@@ -0,0 +1,117 @@
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, OperationalError
+from rest_framework.exceptions import ValidationError
+
+from api.models import Product, Card, Sale
+from api.serializers import SaleSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de estrés: N vendedores concurrentes venden el mismo producto. '
+        'Comprueba que no se pierdan actualizaciones de stock ni de saldo y '
+        'muestra el rendimiento. Crea sus propios datos y los elimina al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sellers', type=int, default=8, help='Hilos vendedores concurrentes')
+        parser.add_argument('--sales', type=int, default=50, help='Ventas que intenta cada vendedor')
+        parser.add_argument('--stock', type=int, default=300, help='Stock inicial del producto')
+        parser.add_argument('--quantity', type=int, default=1, help='Unidades por venta')
+        parser.add_argument(
+            '--legacy', action='store_true',
+            help='Usar el antiguo patrón leer-modificar-guardar para comparar'
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(f'stress-{uuid.uuid4().hex[:12]}')
+        try:
+            self.run(user, options)
+        finally:
+            user.delete()
+
+    def run(self, user, options):
+        business = user.business
+        product = Product.objects.create(
+            business=business, name='Producto de prueba', stock=options['stock'], sale_price=1
+        )
+        card = Card.objects.create(business=business, name='Caja', number='0000', balance=0)
+        request = SimpleNamespace(user=user)
+
+        counters = {'sold': 0, 'rejected': 0, 'failed': 0}
+        lock = threading.Lock()
+
+        def legacy_sale(quantity):
+            # Patrón anterior: leer, modificar en Python y guardar la fila completa
+            with transaction.atomic():
+                current = Product.objects.get(id=product.id)
+                if current.stock < quantity:
+                    raise ValidationError('Stock insuficiente')
+                Sale.objects.create(business=business, product=current, card=card,
+                                    quantity=quantity, unit_price=1)
+                current.stock -= quantity
+                current.save()
+                current_card = Card.objects.get(id=card.id)
+                current_card.balance += quantity
+                current_card.save()
+
+        def sale(quantity):
+            serializer = SaleSerializer(
+                data={'product': product.id, 'card': card.id, 'quantity': quantity, 'unit_price': '1'},
+                context={'request': request}
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        register = legacy_sale if options['legacy'] else sale
+
+        def seller():
+            try:
+                for _ in range(options['sales']):
+                    try:
+                        register(options['quantity'])
+                        outcome = 'sold'
+                    except ValidationError:
+                        outcome = 'rejected'
+                    except OperationalError:
+                        outcome = 'failed'
+                    with lock:
+                        counters[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=seller) for _ in range(options['sellers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        card.refresh_from_db()
+        sold_units = sum(Sale.objects.filter(product=product).values_list('quantity', flat=True))
+        attempts = options['sellers'] * options['sales']
+
+        self.stdout.write(f"Modo: {'leer-modificar-guardar' if options['legacy'] else 'delta condicional'}")
+        self.stdout.write(f"Vendedores: {options['sellers']}  Intentos: {attempts}  Tiempo: {elapsed:.2f}s")
+        self.stdout.write(f"Rendimiento: {attempts / elapsed:.1f} intentos/s")
+        self.stdout.write(
+            f"Vendidas: {counters['sold']}  Rechazadas por stock: {counters['rejected']}  "
+            f"Fallidas por bloqueo: {counters['failed']}"
+        )
+        self.stdout.write(
+            f"Stock final: {product.stock} (esperado {options['stock'] - sold_units})  "
+            f"Saldo final: {card.balance} (esperado {sold_units})"
+        )
+
+        if product.stock == options['stock'] - sold_units and card.balance == sold_units and product.stock >= 0:
+            self.stdout.write(self.style.SUCCESS('Sin actualizaciones perdidas'))
+        else:
+            self.stdout.write(self.style.ERROR('Se perdieron actualizaciones'))
@@ -0,0 +1,82 @@
+"""
+Instrumentación de consultas SQL por petición.
+
+``QueryTimingMiddleware`` cuenta las consultas y el tiempo de base de datos de
+cada petición con ``connection.execute_wrapper`` (sin depender de
+``DEBUG``), añade una cabecera ``Server-Timing`` con los totales y registra en
+el logger ``api.performance`` las peticiones que superan los umbrales
+configurados. Solo guarda un contador por SQL distinto, así que puede quedar
+activo en producción.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('api.performance')
+
+
+class QueryStats:
+    """Acumula número, tiempo y repeticiones de las consultas ejecutadas"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def most_repeated(self):
+        """``(sql, veces)`` de la consulta más repetida, típico síntoma de N+1"""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+class QueryTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_queries = getattr(settings, 'REQUEST_TIMING_MAX_QUERIES', 30)
+        self.max_db_ms = getattr(settings, 'REQUEST_TIMING_MAX_DB_MS', 300)
+        self.max_total_ms = getattr(settings, 'REQUEST_TIMING_MAX_TOTAL_MS', 1000)
+
+    def __call__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(stats))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = stats.duration * 1000
+
+        # En respuestas en streaming solo se cuenta hasta que empieza el envío
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{stats.count} consultas", '
+            f'app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}'
+        )
+
+        if stats.count > self.max_queries or db_ms > self.max_db_ms or total_ms > self.max_total_ms:
+            self.log_slow_request(request, response, stats, db_ms, total_ms)
+        return response
+
+    def log_slow_request(self, request, response, stats, db_ms, total_ms):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.route if match else request.path
+        sql, repeated = stats.most_repeated()
+        logger.warning(
+            'Petición lenta %s %s -> %s: %d consultas, %.1f ms en BD, %.1f ms en total. '
+            'Consulta más repetida (%d veces): %s',
+            request.method, endpoint, response.status_code, stats.count, db_ms, total_ms,
+            repeated, sql,
+        )
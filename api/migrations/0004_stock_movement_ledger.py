@@ -0,0 +1,54 @@
+# Generated by Django 5.1.2 on 2026-10-18 07:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def snapshot_existing_stock(apps, schema_editor):
+    # El historial anterior no existe: el stock actual es el punto de partida
+    Product = apps.get_model('api', 'Product')
+    StockSnapshot = apps.get_model('api', 'StockSnapshot')
+    now = timezone.now()
+    StockSnapshot.objects.bulk_create(
+        StockSnapshot(product_id=product_id, taken_at=now, stock=stock)
+        for product_id, stock in Product.objects.values_list('id', 'stock').iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_card_is_business'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('reason', models.CharField(choices=[('initial', 'Stock inicial'), ('adjustment', 'Ajuste manual'), ('sale', 'Venta'), ('purchase', 'Compra'), ('undo_sale', 'Venta deshecha'), ('undo_purchase', 'Compra deshecha')], max_length=20)),
+                ('reference_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'created_at'], name='stockmove_product_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('stock', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='api.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'taken_at'], name='stocksnap_product_taken_idx')],
+            },
+        ),
+        migrations.RunPython(snapshot_existing_stock, migrations.RunPython.noop),
+    ]
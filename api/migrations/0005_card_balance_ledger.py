@@ -0,0 +1,61 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def open_existing_cards(apps, schema_editor):
+    # El historial anterior no existe: el saldo actual es el punto de partida
+    Card = apps.get_model('api', 'Card')
+    CardTransaction = apps.get_model('api', 'CardTransaction')
+    CardBalanceCheckpoint = apps.get_model('api', 'CardBalanceCheckpoint')
+    today = timezone.localdate()
+    cards = list(Card.objects.values_list('id', 'balance'))
+    CardTransaction.objects.bulk_create(
+        CardTransaction(card_id=card_id, amount=balance, balance_after=balance, reason='opening')
+        for card_id, balance in cards
+    )
+    CardBalanceCheckpoint.objects.bulk_create(
+        CardBalanceCheckpoint(card_id=card_id, day=today, balance=balance)
+        for card_id, balance in cards
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_stock_movement_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardBalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='api.card')),
+            ],
+            options={
+                'unique_together': {('card', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CardTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('reason', models.CharField(choices=[('opening', 'Saldo inicial'), ('adjustment', 'Ajuste manual'), ('sale', 'Venta'), ('purchase', 'Compra'), ('expense', 'Gasto'), ('undo_sale', 'Venta deshecha'), ('undo_purchase', 'Compra deshecha'), ('undo_expense', 'Gasto deshecho')], max_length=20)),
+                ('reference_id', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='api.card')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['card', 'created_at'], name='cardtx_card_created_idx')],
+            },
+        ),
+        migrations.RunPython(open_existing_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_card_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('revenue', 'Ingresos por ventas'), ('cost_of_goods', 'Costo de lo vendido'), ('purchases', 'Compras'), ('expenses', 'Gastos')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='api.business')),
+            ],
+            options={
+                'unique_together': {('business', 'day', 'category')},
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE api_product_search USING fts5("
+            "name, category, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO api_product_search (rowid, name, category, description) "
+            "SELECT id, name, coalesce(category, ''), coalesce(description, '') FROM api_product"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE api_product_search ("
+            "product_id bigint PRIMARY KEY REFERENCES api_product (id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE INDEX api_product_search_document_idx ON api_product_search USING GIN (document)"
+        )
+        schema_editor.execute(
+            "INSERT INTO api_product_search (product_id, document) "
+            "SELECT id, "
+            "setweight(to_tsvector('spanish', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('spanish', coalesce(category, '')), 'B') || "
+            "setweight(to_tsvector('spanish', coalesce(description, '')), 'C') "
+            "FROM api_product"
+        )
+    # Otros motores no tienen índice: api.search usa icontains
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS api_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
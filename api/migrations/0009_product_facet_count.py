@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Categoría'), ('province', 'Provincia'), ('municipality', 'Municipio'), ('price', 'Rango de precio')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_counts', to='api.business')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet', 'value'], name='facet_facet_value_idx')],
+                'unique_together': {('business', 'facet', 'value')},
+            },
+        ),
+    ]
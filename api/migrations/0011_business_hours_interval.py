@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusinessHoursInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opens_at', models.PositiveIntegerField()),
+                ('closes_at', models.PositiveIntegerField()),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hours_intervals', to='api.business')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['opens_at', 'closes_at'], name='hours_opens_closes_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_business_hours_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationDirectoryEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('province', models.CharField(max_length=100)),
+                ('municipality', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('province', 'municipality')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LocationDirectoryMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('province', models.CharField(max_length=100)),
+                ('municipality', models.CharField(max_length=100)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('business', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='directory_member', to='api.business')),
+            ],
+        ),
+    ]
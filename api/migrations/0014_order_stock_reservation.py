@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='reservation',
+            field=models.CharField(choices=[('none', 'Sin reserva'), ('active', 'Reservado'), ('released', 'Liberado'), ('expired', 'Vencido'), ('consumed', 'Descontado del stock')], default='none', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='reservation_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('initial', 'Stock inicial'), ('adjustment', 'Ajuste manual'), ('sale', 'Venta'), ('purchase', 'Compra'), ('undo_sale', 'Venta deshecha'), ('undo_purchase', 'Compra deshecha'), ('order', 'Pedido entregado')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['reservation', 'reservation_expires_at'], name='order_reservation_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_events(apps, schema_editor):
+    # Sin historial previo: el pedido estuvo pendiente desde su creación y, si
+    # ya cambió, está en su estado actual desde la última modificación. Las
+    # notas acumuladas pasan al evento del estado actual.
+    Order = apps.get_model('api', 'Order')
+    OrderStatusEvent = apps.get_model('api', 'OrderStatusEvent')
+    events = []
+    for order in Order.objects.only(
+        'pk', 'business_id', 'status', 'status_notes', 'created_at', 'updated_at'
+    ).iterator():
+        if len(events) >= 1000:
+            OrderStatusEvent.objects.bulk_create(events)
+            events = []
+        note = order.status_notes or ''
+        if order.status == 'pending':
+            events.append(OrderStatusEvent(order_id=order.pk, business_id=order.business_id, status='pending',
+                                           note=note, entered_at=order.created_at))
+            continue
+        changed_at = max(order.updated_at, order.created_at)
+        events.append(OrderStatusEvent(order_id=order.pk, business_id=order.business_id, status='pending',
+                                       entered_at=order.created_at, left_at=changed_at))
+        events.append(OrderStatusEvent(order_id=order.pk, business_id=order.business_id, status=order.status,
+                                       note=note, entered_at=changed_at))
+    OrderStatusEvent.objects.bulk_create(events)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_order_code_block'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('confirmed', 'Confirmado'), ('preparing', 'En preparación'), ('ready', 'Listo para entrega/recogida'), ('in_delivery', 'En camino'), ('delivered', 'Entregado'), ('cancelled', 'Cancelado')], max_length=20)),
+                ('note', models.TextField(blank=True, default='')),
+                ('entered_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('left_at', models.DateTimeField(blank=True, null=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.business')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='api.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'entered_at'], name='orderevent_order_entered_idx'), models.Index(fields=['business', 'status', 'entered_at'], name='orderevent_business_status_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_order_status_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status_notes',
+            field=models.TextField(blank=True, help_text='Obsoleto: notas anteriores al historial de estados (OrderStatusEvent)', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+def backfill_unit_cost(apps, schema_editor):
+    # Las ventas anteriores no guardaron su costo: se usa el precio de compra
+    # actual del producto, el mismo que usaban los totales diarios
+    Sale = apps.get_model('api', 'Sale')
+    Product = apps.get_model('api', 'Product')
+    Sale.objects.filter(product__isnull=False).update(unit_cost=models.Subquery(
+        Product.objects.filter(pk=models.OuterRef('product_id')).values('purchase_price')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_order_status_notes_deprecated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_unit_cost, migrations.RunPython.noop),
+    ]
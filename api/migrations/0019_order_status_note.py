@@ -0,0 +1,24 @@
+# Generated by Django 5.1.2 on 2026-10-18 08:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_sale_unit_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusNote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('note', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notes', to='api.orderstatusevent')),
+            ],
+        ),
+    ]
@@ -1,5 +1,7 @@
+from django.db import transaction
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from .models import Business
+from .rollups import bump_rollups
 
 class BusinessFilterMixin:
     """
@@ -40,4 +42,29 @@ class BusinessFilterMixin:
                 "detail": "No business found for current user",
                 "user_id": user.id,
                 "has_business": False
-            })
\ No newline at end of file
+            })
+
+class RollupMixin:
+    """
+    Mantiene los totales diarios al editar o borrar ventas, compras y gastos:
+    resta lo que aportaba la fila guardada y suma lo que aporta la nueva, en
+    la misma transacción. ``rollup_entries`` es ``sale_entries``,
+    ``purchase_entries`` o ``expense_entries``.
+    """
+    rollup_entries = None
+
+    def _stored_entries(self, instance):
+        # La fila se relee bloqueada para no restar valores que otra petición ya cambió
+        stored = type(instance).objects.select_for_update().get(pk=instance.pk)
+        return type(self).rollup_entries(stored, sign=-1)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            previous = self._stored_entries(serializer.instance)
+            super().perform_update(serializer)
+            bump_rollups(previous + type(self).rollup_entries(serializer.instance))
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            bump_rollups(self._stored_entries(instance))
+            super().perform_destroy(instance)
@@ -5,11 +5,14 @@ from io import BytesIO
 from django.core.files import File
 import uuid
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.core.validators import MinValueValidator
-import random
-import string
+
+from .cache import bump_version, business_namespace, set_order_version
+from . import search
+from . import images
+from . import codes
 
 
 def validate_product_limit(business_id, license_type):
@@ -35,6 +38,8 @@ class Business(models.Model):
     is_public = models.BooleanField(default=True)
     created_at = models.DateTimeField(default=timezone.now, blank=True)
     image = models.ImageField(upload_to='business_images/', null=True, blank=True)
+    # Versiones redimensionadas de la imagen (ver api.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         # Eliminamos unique_together ya que OneToOneField ya garantiza la unicidad
@@ -52,11 +57,19 @@ class Product(models.Model):
     sale_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     is_public = models.BooleanField(default=True)
     stock = models.IntegerField(validators=[MinValueValidator(0)])
+    # Unidades apartadas por pedidos abiertos; se vende stock - reserved (ver api.reservations)
+    reserved = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(default=timezone.now, blank=True)
     image = models.ImageField(upload_to='product_images/', null=True, blank=True)
+    # Versiones redimensionadas de la imagen (ver api.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         unique_together = ['business', 'name']
+        indexes = [
+            # Catálogo público filtrado por categoría
+            models.Index(fields=['is_public', 'category'], name='product_public_category_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(stock__gte=0),
@@ -85,6 +98,13 @@ class Contact(models.Model):
     is_supplier = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now, blank=True)
     image = models.ImageField(upload_to='contact_images/', null=True, blank=True)
+    # Versiones redimensionadas de la imagen (ver api.images)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'created_at', 'id'], name='contact_business_created_idx'),
+        ]
 
 class Card(models.Model):
     business = models.ForeignKey(Business, on_delete=models.CASCADE)
@@ -105,9 +125,18 @@ class Sale(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Precio de compra del producto al vender: el costo de lo vendido no cambia
+    # aunque el producto cambie de precio después
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
     created_at = models.DateTimeField(default=timezone.now, blank=True)
     is_credit = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Listados y rangos de fechas por negocio
+            models.Index(fields=['business', 'created_at', 'id'], name='sale_business_created_idx'),
+        ]
+
 
 
 
@@ -122,6 +151,11 @@ class Purchase(models.Model):
     created_at = models.DateTimeField(default=timezone.now, blank=True)
     is_credit = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'created_at', 'id'], name='purchase_business_created_idx'),
+        ]
+
 class Expense(models.Model):
     business = models.ForeignKey(Business, on_delete=models.CASCADE)
     card = models.ForeignKey(Card, on_delete=models.SET_NULL, null=True, blank=True)
@@ -130,6 +164,174 @@ class Expense(models.Model):
     category = models.CharField(max_length=100, default='Otros', blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'created_at', 'id'], name='expense_business_created_idx'),
+        ]
+
+class StockMovement(models.Model):
+    """Registro inmutable de cada cambio en el stock de un producto"""
+    REASON_CHOICES = [
+        ('initial', 'Stock inicial'),
+        ('adjustment', 'Ajuste manual'),
+        ('sale', 'Venta'),
+        ('purchase', 'Compra'),
+        ('undo_sale', 'Venta deshecha'),
+        ('undo_purchase', 'Compra deshecha'),
+        ('order', 'Pedido entregado'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    quantity = models.IntegerField()  # Positivo entra, negativo sale
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    reference_id = models.PositiveBigIntegerField(null=True, blank=True)  # Venta o compra de origen
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='stockmove_product_created_idx'),
+        ]
+
+class StockSnapshot(models.Model):
+    """Stock de un producto en un instante, para no recorrer todo el historial"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    taken_at = models.DateTimeField()
+    stock = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'taken_at'], name='stocksnap_product_taken_idx'),
+        ]
+
+class CardTransaction(models.Model):
+    """Registro inmutable de cada cambio en el saldo de una tarjeta"""
+    REASON_CHOICES = [
+        ('opening', 'Saldo inicial'),
+        ('adjustment', 'Ajuste manual'),
+        ('sale', 'Venta'),
+        ('purchase', 'Compra'),
+        ('expense', 'Gasto'),
+        ('undo_sale', 'Venta deshecha'),
+        ('undo_purchase', 'Compra deshecha'),
+        ('undo_expense', 'Gasto deshecho'),
+    ]
+
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='transactions')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)  # Positivo entra, negativo sale
+    balance_after = models.DecimalField(max_digits=10, decimal_places=2)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    reference_id = models.PositiveBigIntegerField(null=True, blank=True)  # Venta, compra o gasto de origen
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['card', 'created_at'], name='cardtx_card_created_idx'),
+        ]
+
+class CardBalanceCheckpoint(models.Model):
+    """Saldo de cierre de una tarjeta en cada día con movimientos"""
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='checkpoints')
+    day = models.DateField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        unique_together = ['card', 'day']
+
+class DailyRollup(models.Model):
+    """Totales diarios por negocio y categoría, mantenidos al registrar cada transacción"""
+    CATEGORY_CHOICES = [
+        ('revenue', 'Ingresos por ventas'),
+        ('cost_of_goods', 'Costo de lo vendido'),
+        ('purchases', 'Compras'),
+        ('expenses', 'Gastos'),
+    ]
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['business', 'day', 'category']
+
+class LocationDirectoryEntry(models.Model):
+    """Negocios públicos con licencia vigente por provincia y municipio"""
+    province = models.CharField(max_length=100)
+    municipality = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['province', 'municipality']
+
+class LocationDirectoryMember(models.Model):
+    """Negocio contado en ``LocationDirectoryEntry`` hasta que caduque su licencia"""
+    business = models.OneToOneField(Business, on_delete=models.CASCADE, related_name='directory_member')
+    province = models.CharField(max_length=100)
+    municipality = models.CharField(max_length=100)
+    expires_at = models.DateTimeField(db_index=True)
+
+class ProductFacetCount(models.Model):
+    """Productos públicos de un negocio por valor de cada faceta del catálogo"""
+    FACET_CHOICES = [
+        ('category', 'Categoría'),
+        ('province', 'Provincia'),
+        ('municipality', 'Municipio'),
+        ('price', 'Rango de precio'),
+    ]
+
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='facet_counts')
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['business', 'facet', 'value']
+        indexes = [
+            models.Index(fields=['facet', 'value'], name='facet_facet_value_idx'),
+        ]
+
+@receiver(post_save, sender=Product)
+def registrar_stock_inicial(sender, instance, created, **kwargs):
+    if created and instance.stock:
+        StockMovement.objects.create(product=instance, quantity=instance.stock, reason='initial')
+
+@receiver(post_save, sender=Product)
+def indexar_producto(sender, instance, update_fields=None, **kwargs):
+    # Los ajustes de stock o precio no tocan el texto indexado
+    if update_fields is None or search.INDEXED_FIELDS & set(update_fields):
+        search.index_products([(instance.pk, instance.name, instance.category, instance.description)])
+
+@receiver(post_delete, sender=Product)
+def desindexar_producto(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+
+@receiver(pre_save, sender=Product)
+def recordar_facetas_producto(sender, instance, update_fields=None, **kwargs):
+    # Valores guardados antes del cambio, para restarlos de sus facetas
+    from .facets import FACET_FIELDS, stored_facet_values
+    if instance.pk and (update_fields is None or FACET_FIELDS & set(update_fields)):
+        instance._facet_previous = stored_facet_values(instance.pk)
+
+@receiver(post_save, sender=Product)
+def actualizar_facetas_producto(sender, instance, created, update_fields=None, **kwargs):
+    from .facets import FACET_FIELDS, facet_values, update_product_facets
+    if update_fields is None or FACET_FIELDS & set(update_fields):
+        previous = None if created else instance.__dict__.pop('_facet_previous', None)
+        update_product_facets(previous, facet_values(instance))
+
+@receiver(post_delete, sender=Product)
+def descontar_facetas_producto(sender, instance, **kwargs):
+    from .facets import facet_values, update_product_facets
+    update_product_facets(facet_values(instance), None)
+
+@receiver(post_save, sender=Card)
+def registrar_saldo_inicial(sender, instance, created, **kwargs):
+    if created:
+        balance = instance.balance or 0
+        CardTransaction.objects.create(card=instance, amount=balance, balance_after=balance, reason='opening')
+        CardBalanceCheckpoint.objects.create(card=instance, day=timezone.localdate(), balance=balance)
+
 def get_expiration_date():
     return timezone.now() + timezone.timedelta(days=7)
 
@@ -202,15 +404,13 @@ class LicenseRenewal(models.Model):
     class Meta:
         ordering = ['-requested_at']
 
+class OrderCodeBlock(models.Model):
+    """Bloque de números reservado por un proceso para generar códigos (ver api.codes)"""
+    created_at = models.DateTimeField(default=timezone.now)
+
 def generate_order_code():
-    # Genera un código de 8 caracteres alfanuméricos
-    length = 8
-    characters = string.ascii_uppercase + string.digits
-    while True:
-        code = ''.join(random.choices(characters, k=length))
-        # Verificar que el código no exista
-        if not Order.objects.filter(tracking_code=code).exists():
-            return code
+    # Genera un código de 8 caracteres alfanuméricos sin consultar la base
+    return codes.next_order_code()
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -228,6 +428,14 @@ class Order(models.Model):
         ('delivery', 'Entrega a domicilio')
     ]
 
+    RESERVATION_CHOICES = [
+        ('none', 'Sin reserva'),  # Pedidos anteriores a las reservas
+        ('active', 'Reservado'),
+        ('released', 'Liberado'),
+        ('expired', 'Vencido'),
+        ('consumed', 'Descontado del stock'),
+    ]
+
     # Código de seguimiento
     tracking_code = models.CharField(
         max_length=8, 
@@ -255,9 +463,22 @@ class Order(models.Model):
     status_notes = models.TextField(
         null=True, 
         blank=True, 
-        help_text="Notas sobre el cambio de estado del pedido"
+        help_text="Obsoleto: notas anteriores al historial de estados (OrderStatusEvent)"
     )
 
+    # Stock apartado para el pedido (ver api.reservations)
+    reservation = models.CharField(max_length=10, choices=RESERVATION_CHOICES, default='none', editable=False)
+    reservation_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business', 'created_at', 'id'], name='order_business_created_idx'),
+            # Reservas vencidas que debe liberar release_expired_reservations
+            models.Index(fields=['reservation', 'reservation_expires_at'], name='order_reservation_expiry_idx'),
+            # Pedidos de un negocio por estado, los más recientes primero
+            models.Index(fields=['business', 'status', 'created_at'], name='order_business_status_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey('Order', related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey('Product', on_delete=models.PROTECT)
@@ -272,6 +493,55 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
+class OrderStatusEvent(models.Model):
+    """Paso de un pedido por un estado: se inserta uno por cada cambio (ver api.order_history)"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_events')
+    # Copia del negocio del pedido para agregar los tiempos sin unir con Order
+    business = models.ForeignKey(Business, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    note = models.TextField(blank=True, default='')
+    entered_at = models.DateTimeField(default=timezone.now)
+    left_at = models.DateTimeField(null=True, blank=True)  # Nulo mientras sea el estado actual
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'entered_at'], name='orderevent_order_entered_idx'),
+            # Tiempos medios por estado de un negocio en un rango de fechas
+            models.Index(fields=['business', 'status', 'entered_at'], name='orderevent_business_status_idx'),
+        ]
+
+class OrderStatusNote(models.Model):
+    """Nota añadida a un pedido sin cambiar de estado; se inserta una por nota"""
+    event = models.ForeignKey(OrderStatusEvent, on_delete=models.CASCADE, related_name='notes')
+    note = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+class EmailOutbox(models.Model):
+    """Correo pendiente de envío; lo despacha ``send_outbox_emails`` (ver api.outbox)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('sent', 'Enviado'),
+        ('failed', 'Fallido'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # Próximo intento; mientras un envío está en curso, fin de su reserva
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
 class BusinessSettings(models.Model):
     business = models.OneToOneField(
         Business,
@@ -310,6 +580,21 @@ class BusinessSettings(models.Model):
             }
         super().save(*args, **kwargs)
 
+class BusinessHoursInterval(models.Model):
+    """
+    Intervalo semanal de apertura compilado desde ``BusinessSettings.business_hours``.
+    Los extremos son minutos desde el lunes a las 00:00, hora local del negocio.
+    """
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='hours_intervals')
+    opens_at = models.PositiveIntegerField()
+    closes_at = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['opens_at', 'closes_at'], name='hours_opens_closes_idx'),
+        ]
+
+
 @receiver(post_save, sender=Business)
 def crear_configuracion_negocio(sender, instance, created, **kwargs):
     if created:
@@ -325,4 +610,90 @@ def crear_configuracion_negocio(sender, instance, created, **kwargs):
                 "domingo": {"abierto": False, "horario": []}
             },
             delivery_zones={}  # Inicialmente vacío para que el usuario agregue sus propias zonas
-        )
\ No newline at end of file
+        )
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidar_cache_productos(sender, instance, **kwargs):
+    bump_version('products', business_namespace(instance.business_id))
+
+@receiver(post_save, sender=Business)
+@receiver(post_delete, sender=Business)
+def invalidar_cache_negocios(sender, instance, **kwargs):
+    bump_version('products', 'businesses', business_namespace(instance.pk))
+
+@receiver(post_save, sender=License)
+@receiver(post_delete, sender=License)
+def invalidar_cache_licencias(sender, instance, **kwargs):
+    namespaces = [
+        business_namespace(business_id)
+        for business_id in Business.objects.filter(user_id=instance.user_id).values_list('pk', flat=True)
+    ]
+    bump_version('products', 'businesses', *namespaces)
+
+@receiver(post_save, sender=BusinessSettings)
+@receiver(post_delete, sender=BusinessSettings)
+def invalidar_cache_configuracion(sender, instance, **kwargs):
+    # El listado de negocios muestra el estado según el horario
+    bump_version('businesses', business_namespace(instance.business_id))
+
+@receiver(pre_save, sender=Business)
+def recordar_ubicacion_negocio(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or {'province', 'municipality'} & set(update_fields)):
+        instance._previous_location = Business.objects.filter(pk=instance.pk).values(
+            'province', 'municipality'
+        ).first()
+
+@receiver(post_save, sender=Business)
+def actualizar_facetas_negocio(sender, instance, created, **kwargs):
+    # Solo la ubicación del negocio aparece en las facetas de sus productos
+    from .facets import move_business_location
+    previous = None if created else instance.__dict__.pop('_previous_location', None)
+    location = {'province': instance.province, 'municipality': instance.municipality}
+    if previous and previous != location:
+        move_business_location(instance.pk, location)
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Business)
+@receiver(post_save, sender=Contact)
+def generar_variantes_imagen(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if images.needs_variants(instance):
+        images.schedule_variants(instance)
+
+@receiver(post_save, sender=BusinessSettings)
+def compilar_horario(sender, instance, update_fields=None, **kwargs):
+    from .hours import compile_business_hours
+    if update_fields is None or 'business_hours' in update_fields:
+        compile_business_hours(instance.business_id, instance.business_hours)
+
+@receiver(post_save, sender=Business)
+def actualizar_directorio_negocio(sender, instance, **kwargs):
+    from .directory import sync_business
+    sync_business(instance.pk)
+
+@receiver(pre_delete, sender=Business)
+def retirar_negocio_directorio(sender, instance, **kwargs):
+    from .directory import remove_business
+    remove_business(instance.pk)
+
+@receiver(post_save, sender=License)
+@receiver(post_delete, sender=License)
+def actualizar_directorio_licencia(sender, instance, **kwargs):
+    from .directory import sync_business
+    for business_id in Business.objects.filter(user_id=instance.user_id).values_list('pk', flat=True):
+        sync_business(business_id)
+
+@receiver(post_save, sender=Order)
+def publicar_estado_pedido(sender, instance, created, update_fields=None, **kwargs):
+    from .events import publish_order
+    # Los clientes que siguen el pedido en vivo reciben cada cambio de estado
+    if not created and (update_fields is None or 'status' in update_fields):
+        publish_order(instance)
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidar_seguimiento_pedido(sender, instance, **kwargs):
+    # track_order guarda su respuesta bajo la versión del pedido
+    set_order_version(instance, deleted=kwargs['signal'] is post_delete)
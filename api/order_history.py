@@ -0,0 +1,76 @@
+"""
+Historial de estados de los pedidos.
+
+Cada cambio de estado cierra el evento abierto del pedido (``left_at``) e
+inserta uno nuevo con el estado y la nota, en lugar de reescribir el texto
+acumulado de ``Order.status_notes``. Las notas sin cambio de estado se
+insertan en ``OrderStatusNote`` ligadas al evento abierto, así que ninguna
+fila del historial se reescribe salvo para cerrarla. Como cada evento guarda cuándo entró y
+salió el pedido del estado, los tiempos medios por estado de un negocio son
+una agregación sobre el índice ``(business, status, entered_at)``.
+"""
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F
+from django.utils import timezone
+
+from .models import Order, OrderStatusEvent, OrderStatusNote
+
+
+def record_status(order, previous_status=None, note='', at=None):
+    """
+    Registra el estado actual del pedido. Sin cambio de estado solo se
+    inserta la nota para el evento abierto; ``previous_status=None`` indica un
+    pedido recién creado.
+    """
+    if order.status not in dict(Order.STATUS_CHOICES):
+        raise ValueError(f'Estado de pedido no válido: {order.status}')
+    at = at or timezone.now()
+    note = note or ''
+    if previous_status is not None and previous_status == order.status:
+        if note:
+            event_id = OrderStatusEvent.objects.filter(
+                order=order, left_at=None
+            ).order_by('-entered_at').values_list('pk', flat=True).first()
+            if event_id is not None:
+                OrderStatusNote.objects.create(event_id=event_id, note=note, created_at=at)
+        return None
+
+    if previous_status is not None:
+        OrderStatusEvent.objects.filter(order=order, left_at=None).update(left_at=at)
+    return OrderStatusEvent.objects.create(
+        order=order, business_id=order.business_id, status=order.status, note=note, entered_at=at
+    )
+
+
+def status_durations(business, start=None, end=None):
+    """
+    Tiempo medio que pasan los pedidos del negocio en cada estado, contando
+    los pasos cerrados que empezaron entre ``start`` y ``end``, y cuántos
+    pedidos están ahora mismo en cada uno.
+    """
+    events = OrderStatusEvent.objects.filter(business=business)
+    if start:
+        events = events.filter(entered_at__gte=start)
+    if end:
+        events = events.filter(entered_at__lte=end)
+
+    closed = events.filter(left_at__isnull=False).values('status').annotate(
+        transitions=Count('id'),
+        average=Avg(ExpressionWrapper(F('left_at') - F('entered_at'), output_field=DurationField())),
+    )
+    current = dict(OrderStatusEvent.objects.filter(
+        business=business, left_at__isnull=True
+    ).values('status').annotate(total=Count('id')).values_list('status', 'total'))
+
+    stats = {row['status']: row for row in closed}
+    result = []
+    for status, label in Order.STATUS_CHOICES:
+        row = stats.get(status, {})
+        average = row.get('average')
+        result.append({
+            'status': status,
+            'status_display': label,
+            'transitions': row.get('transitions', 0),
+            'average_seconds': round(average.total_seconds()) if average is not None else None,
+            'current': current.get(status, 0),
+        })
+    return result
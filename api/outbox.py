@@ -0,0 +1,104 @@
+"""
+Bandeja de salida de correos.
+
+Las vistas no hablan con el servidor SMTP: ``queue_email`` guarda el correo
+en ``EmailOutbox`` dentro de la transacción en curso, así que solo existe si
+el cambio que lo origina se confirma. ``send_pending`` (comando
+``send_outbox_emails``) los envía por lotes sobre una sola conexión SMTP y
+reintenta los fallidos con espera exponencial.
+
+Para reservar un lote se le asigna un ``claim_token`` y se mueve
+``next_attempt_at`` al final de la reserva: si el proceso muere a mitad del
+envío, los correos vuelven a estar disponibles al vencer la reserva.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    """Encola un correo; no se guarda si no hay destinatarios"""
+    recipients = [address for address in recipient_list if address]
+    if not recipients:
+        return None
+    return EmailOutbox.objects.create(
+        subject=subject[:255],
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=recipients,
+    )
+
+
+def retry_delay(attempts):
+    """Espera antes del siguiente intento: base * 2^(intentos - 1), con tope"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), 6 * 60 * 60))
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    token = uuid.uuid4()
+    ids = list(EmailOutbox.objects.filter(
+        status='pending', next_attempt_at__lte=now
+    ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+    # La condición se repite en el UPDATE: si otro proceso reservó antes, no se pisa
+    EmailOutbox.objects.filter(
+        id__in=ids, status='pending', next_attempt_at__lte=now
+    ).update(claim_token=token, next_attempt_at=now + CLAIM_LEASE)
+    return list(EmailOutbox.objects.filter(claim_token=token, status='pending').order_by('id'))
+
+
+def send_pending(batch_size=None, max_attempts=None):
+    """
+    Envía un lote de correos pendientes. Devuelve ``(enviados, fallidos)``;
+    los fallidos que aún tienen intentos quedan pendientes para más tarde.
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = max_attempts or getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent, failures = [], []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        failures = [(email, error) for email in emails]
+    else:
+        try:
+            for email in emails:
+                message = EmailMessage(
+                    subject=email.subject, body=email.body, from_email=email.from_email,
+                    to=email.recipients, connection=connection,
+                )
+                try:
+                    message.send()
+                    sent.append(email.id)
+                except Exception as error:
+                    failures.append((email, error))
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    EmailOutbox.objects.filter(id__in=sent).update(
+        status='sent', sent_at=now, claim_token=None, attempts=F('attempts') + 1, last_error=''
+    )
+    for email, error in failures:
+        attempts = email.attempts + 1
+        EmailOutbox.objects.filter(id=email.id).update(
+            status='failed' if attempts >= max_attempts else 'pending',
+            attempts=attempts,
+            next_attempt_at=now + retry_delay(attempts),
+            claim_token=None,
+            last_error=f'{type(error).__name__}: {error}'[:2000],
+        )
+    return len(sent), len(failures)
@@ -12,12 +12,13 @@ class IsOwnerOrNoAccess(permissions.BasePermission):
             return True
             
         # Para otros métodos (PUT, PATCH, DELETE), verificar si es propietario
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
+        # Comparar ids evita cargar el usuario propietario en cada comprobación
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.id
         elif hasattr(obj, 'business'):
-            return obj.business.user == request.user
+            return obj.business.user_id == request.user.id
         elif hasattr(obj, 'product'):
-            return obj.product.business.user == request.user
+            return obj.product.business.user_id == request.user.id
         else:
             return False
 
@@ -34,12 +35,13 @@ class OnlyOwnerAccess(permissions.BasePermission):
     
     def has_object_permission(self, request, view, obj):
         # Verificar si es propietario para todos los métodos
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
+        # Comparar ids evita cargar el usuario propietario en cada comprobación
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.id
         elif hasattr(obj, 'business'):
-            return obj.business.user == request.user
+            return obj.business.user_id == request.user.id
         elif hasattr(obj, 'product'):
-            return obj.product.business.user == request.user
+            return obj.product.business.user_id == request.user.id
         else:
             return False
 
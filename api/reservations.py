@@ -0,0 +1,196 @@
+"""
+Reservas de stock para los pedidos públicos.
+
+Al crear un pedido sus unidades se apartan en ``Product.reserved``: el stock
+físico no cambia, pero las ventas solo pueden usar ``stock - reserved`` (ver
+``api.ledger``). La reserva de cada pedido pasa por ``Order.reservation``:
+
+- ``active``: apartada al crear el pedido.
+- ``released``: el pedido se canceló y las unidades vuelven a estar a la venta.
+- ``expired``: el negocio no confirmó el pedido a tiempo; la libera
+  ``release_expired_reservations``.
+- ``consumed``: el pedido se entregó y las unidades salieron del stock.
+
+Cada transición se hace con un ``UPDATE`` condicional sobre el pedido, así
+que una reserva no se libera ni se descuenta dos veces aunque dos peticiones
+cambien el estado a la vez. Los productos se bloquean siempre en orden de pk,
+como en el resto del ledger.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_version, business_namespace
+from .ledger import record_stock_movements
+from .models import Order, Product
+
+
+def reservation_expiry():
+    """Fecha en que vence una reserva creada ahora si el pedido sigue pendiente"""
+    return timezone.now() + timedelta(minutes=getattr(settings, 'ORDER_RESERVATION_MINUTES', 120))
+
+
+def _quantities(items):
+    quantities = defaultdict(int)
+    for item in items:
+        quantities[item.product_id] += item.quantity
+    return dict(quantities)
+
+
+def _per_product(quantities):
+    return Case(
+        *(When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()),
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+def _lock(quantities):
+    return {
+        pk: (stock, reserved)
+        for pk, stock, reserved in Product.objects.select_for_update().filter(
+            pk__in=quantities
+        ).order_by('pk').values_list('pk', 'stock', 'reserved')
+    }
+
+
+def _changed(business_id):
+    # Como en ledger._stock_changed, solo el escaparate del negocio
+    bump_version(business_namespace(business_id))
+
+
+def reserve_stock(business_id, lines):
+    """
+    Aparta las unidades de ``lines`` (``OrderItem`` sin guardar) con dos
+    consultas. Devuelve los errores por item si alguna no alcanza, sin
+    reservar nada. Debe llamarse dentro de la transacción que crea el pedido.
+    """
+    quantities = _quantities(lines)
+    current = _lock(quantities)
+
+    errors = []
+    for index, line in enumerate(lines):
+        stock, reserved = current[line.product_id]
+        available = max(stock - reserved, 0)
+        if available < quantities[line.product_id]:
+            errors.append({
+                'index': index,
+                'error': f'Stock insuficiente para {line.product.name}. Solo hay {available} unidades disponibles.',
+            })
+    if errors:
+        return errors
+
+    per_product = _per_product(quantities)
+    updated = Product.objects.filter(
+        pk__in=quantities, stock__gte=F('reserved') + per_product
+    ).update(reserved=F('reserved') + per_product)
+    if updated != len(quantities):
+        # Solo ocurre si la base no respeta el bloqueo (SQLite) y otra venta se adelantó
+        raise ValidationError('El stock cambió mientras se creaba el pedido. Inténtalo de nuevo.')
+    _changed(business_id)
+    return []
+
+
+def _transition(order, from_states, to_state, **conditions):
+    """Cambia la reserva del pedido solo si sigue en uno de ``from_states``"""
+    changed = Order.objects.filter(pk=order.pk, reservation__in=from_states, **conditions).update(
+        reservation=to_state, reservation_expires_at=None
+    )
+    if changed:
+        order.reservation, order.reservation_expires_at = to_state, None
+    return bool(changed)
+
+
+def release_reservation(order, to_state='released', **conditions):
+    """Devuelve a la venta las unidades apartadas por el pedido"""
+    with transaction.atomic():
+        if not _transition(order, ['active'], to_state, **conditions):
+            return False
+        quantities = _quantities(order.items.all())
+        _lock(quantities)
+        per_product = _per_product(quantities)
+        Product.objects.filter(pk__in=quantities).update(
+            reserved=Greatest(F('reserved') - per_product, Value(0))
+        )
+        _changed(order.business_id)
+    return True
+
+
+def consume_reservation(order):
+    """
+    Descuenta del stock las unidades del pedido entregado. Si la reserva ya se
+    había liberado o vencido, las unidades se toman del stock disponible y se
+    lanza ``ValidationError`` si no alcanza. Los pedidos anteriores a las
+    reservas no tocan el stock.
+    """
+    with transaction.atomic():
+        if _transition(order, ['active'], 'consumed'):
+            reserved = True
+        elif _transition(order, ['released', 'expired'], 'consumed'):
+            reserved = False
+        else:
+            return False
+        quantities = _quantities(order.items.all())
+        current = _lock(quantities)
+        per_product = _per_product(quantities)
+
+        if reserved:
+            products = Product.objects.filter(pk__in=quantities, stock__gte=per_product)
+            updated = products.update(
+                stock=F('stock') - per_product,
+                reserved=Greatest(F('reserved') - per_product, Value(0)),
+            )
+        else:
+            products = Product.objects.filter(pk__in=quantities, stock__gte=F('reserved') + per_product)
+            updated = products.update(stock=F('stock') - per_product)
+        if updated != len(quantities):
+            short = [
+                pk for pk, (stock, reserved_units) in current.items()
+                if stock - (0 if reserved else reserved_units) < quantities[pk]
+            ]
+            raise ValidationError(
+                f'Stock insuficiente para entregar el pedido (productos {", ".join(map(str, short))}).'
+            )
+
+        record_stock_movements(
+            (product_id, -quantity, 'order', order.pk) for product_id, quantity in quantities.items()
+        )
+        _changed(order.business_id)
+    return True
+
+
+def apply_status(order, new_status):
+    """
+    Ajusta la reserva al nuevo estado del pedido: se libera al cancelar, se
+    descuenta al entregar y deja de vencer en cuanto el negocio confirma el
+    pedido. Los campos de la reserva se guardan aquí; quien guarde el pedido
+    después debe hacerlo con ``update_fields`` sin incluirlos.
+    """
+    if new_status == 'cancelled':
+        release_reservation(order)
+    elif new_status == 'delivered':
+        consume_reservation(order)
+    elif new_status != 'pending':
+        if Order.objects.filter(pk=order.pk, reservation='active').exclude(
+            reservation_expires_at=None
+        ).update(reservation_expires_at=None):
+            order.reservation_expires_at = None
+
+
+def release_expired(now=None):
+    """Libera las reservas de pedidos pendientes que vencieron. Devuelve cuántas"""
+    now = now or timezone.now()
+    expired = Order.objects.filter(
+        reservation='active', reservation_expires_at__lte=now
+    ).order_by('reservation_expires_at')
+    released = 0
+    for order in expired.iterator():
+        # Puede que el negocio lo haya confirmado o cancelado entre medias
+        if release_reservation(order, to_state='expired', reservation_expires_at__lte=now):
+            released += 1
+    return released
@@ -0,0 +1,109 @@
+"""
+Totales financieros diarios por negocio.
+
+Cada venta, compra y gasto suma (o resta, al deshacerse) su importe en la fila
+``DailyRollup`` de su día y categoría, de modo que los reportes mensuales o
+anuales leen unos cientos de filas en lugar de recorrer todas las
+transacciones. ``rebuild_rollups`` recalcula la tabla desde cero.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Count, DecimalField, ExpressionWrapper, Value
+from django.db.models.functions import TruncDate, Coalesce
+from django.utils import timezone
+
+from .models import DailyRollup, Sale, Purchase, Expense
+
+
+def sale_entries(sale, sign=1):
+    """Ingreso y costo de lo vendido de una venta, al costo guardado en la venta"""
+    day = timezone.localdate(sale.created_at)
+    return [
+        (sale.business_id, day, 'revenue', sign * sale.quantity * sale.unit_price, sign),
+        (sale.business_id, day, 'cost_of_goods', sign * sale.quantity * (sale.unit_cost or 0), sign),
+    ]
+
+
+def purchase_entries(purchase, sign=1):
+    day = timezone.localdate(purchase.created_at)
+    return [(purchase.business_id, day, 'purchases', sign * purchase.quantity * purchase.unit_price, sign)]
+
+
+def expense_entries(expense, sign=1):
+    day = timezone.localdate(expense.created_at)
+    return [(expense.business_id, day, 'expenses', sign * expense.amount, sign)]
+
+
+def bump_rollups(entries):
+    """
+    Aplica entradas ``(business_id, day, category, amount, count)`` como
+    incrementos en la base de datos, agrupadas por fila.
+    """
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for business_id, day, category, amount, count in entries:
+        totals[(business_id, day, category)][0] += amount
+        totals[(business_id, day, category)][1] += count
+
+    # Orden determinista para no interbloquear con otras transacciones
+    for (business_id, day, category), (amount, count) in sorted(totals.items()):
+        key = {'business_id': business_id, 'day': day, 'category': category}
+        if DailyRollup.objects.filter(**key).update(amount=F('amount') + amount, count=F('count') + count):
+            continue
+        try:
+            with transaction.atomic():
+                DailyRollup.objects.create(amount=amount, count=count, **key)
+        except IntegrityError:
+            # Otra transacción creó la fila entre medias
+            DailyRollup.objects.filter(**key).update(amount=F('amount') + amount, count=F('count') + count)
+
+
+def _money(expression):
+    return Coalesce(
+        Sum(ExpressionWrapper(expression, output_field=DecimalField(max_digits=14, decimal_places=2))),
+        Value(Decimal('0')),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def rebuild_rollups(business_ids=None):
+    """
+    Recalcula desde cero los totales diarios de los negocios indicados (o de
+    todos). Devuelve la cantidad de filas creadas.
+    """
+    def scoped(queryset):
+        if business_ids is not None:
+            queryset = queryset.filter(business_id__in=business_ids)
+        return queryset.annotate(day=TruncDate('created_at')).values('business_id', 'day')
+
+    with transaction.atomic():
+        rows = []
+        for row in scoped(Sale.objects.all()).annotate(
+            revenue=_money(F('quantity') * F('unit_price')),
+            cost=_money(F('quantity') * F('unit_cost')),
+            total=Count('id'),
+        ):
+            rows.append(DailyRollup(business_id=row['business_id'], day=row['day'], category='revenue',
+                                    amount=row['revenue'], count=row['total']))
+            rows.append(DailyRollup(business_id=row['business_id'], day=row['day'], category='cost_of_goods',
+                                    amount=row['cost'], count=row['total']))
+
+        for row in scoped(Purchase.objects.all()).annotate(
+            amount=_money(F('quantity') * F('unit_price')), total=Count('id'),
+        ):
+            rows.append(DailyRollup(business_id=row['business_id'], day=row['day'], category='purchases',
+                                    amount=row['amount'], count=row['total']))
+
+        for row in scoped(Expense.objects.all()).annotate(
+            total_amount=_money(F('amount')), total=Count('id'),
+        ):
+            rows.append(DailyRollup(business_id=row['business_id'], day=row['day'], category='expenses',
+                                    amount=row['total_amount'], count=row['total']))
+
+        existing = DailyRollup.objects.all()
+        if business_ids is not None:
+            existing = existing.filter(business_id__in=business_ids)
+        existing.delete()
+        DailyRollup.objects.bulk_create(rows, batch_size=1000)
+        return len(rows)
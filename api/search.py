@@ -0,0 +1,117 @@
+"""
+Búsqueda de texto completo en el catálogo.
+
+El índice vive en la tabla ``api_product_search`` (migración 0008): una tabla
+virtual FTS5 en SQLite y una columna ``tsvector`` con índice GIN en
+PostgreSQL. Se mantiene sincronizado con las señales de ``Product`` y se puede
+reconstruir con ``python manage.py rebuild_search_index``. En otros motores se
+recurre a ``icontains`` sin ranking.
+
+Nombre, categoría y descripción pesan en ese orden al ordenar resultados.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+TABLE = 'api_product_search'
+# Configuración de texto de PostgreSQL (raíces y palabras vacías en español)
+TEXT_SEARCH_CONFIG = 'spanish'
+INDEXED_FIELDS = {'name', 'description', 'category'}
+
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('{config}', coalesce(%s, '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce(%s, '')), 'B') || "
+    "setweight(to_tsvector('{config}', coalesce(%s, '')), 'C')"
+).format(config=TEXT_SEARCH_CONFIG)
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def index_products(rows):
+    """Indexa o reindexa filas ``(id, name, category, description)``"""
+    rows = [(pk, name or '', category or '', description or '') for pk, name, category, description in rows]
+    if not rows or not is_supported():
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, name, category, description) VALUES (%s, %s, %s, %s)', rows
+            )
+        else:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (product_id, document) VALUES (%s, {POSTGRES_DOCUMENT}) '
+                f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+                rows,
+            )
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported():
+        return
+    column = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE {column} = %s', [(pk,) for pk in product_ids])
+
+
+def rebuild_index(queryset):
+    """Vacía el índice y lo vuelve a llenar con los productos de ``queryset``"""
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    total = 0
+    batch = []
+    for row in queryset.values_list('id', 'name', 'category', 'description').iterator(chunk_size=1000):
+        batch.append(row)
+        if len(batch) == 1000:
+            index_products(batch)
+            total += len(batch)
+            batch = []
+    index_products(batch)
+    return total + len(batch)
+
+
+def _terms(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def search_products(queryset, text):
+    """
+    Filtra ``queryset`` (de ``Product``) por ``text`` y lo ordena por
+    relevancia. Cada palabra se busca como prefijo y deben aparecer todas.
+    """
+    terms = _terms(text)
+    if not terms:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        matches = RawSQL(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [match])
+        # bm25 devuelve valores menores cuanto más relevante; pesos: name, category, description
+        rank = RawSQL(
+            f'SELECT -bm25({TABLE}, 10.0, 4.0, 1.0) FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s AND rowid = {table}.id',
+            [match],
+        )
+    elif connection.vendor == 'postgresql':
+        query = ' & '.join(f'{term}:*' for term in terms)
+        tsquery = f"to_tsquery('{TEXT_SEARCH_CONFIG}', %s)"
+        matches = RawSQL(f'SELECT product_id FROM {TABLE} WHERE document @@ {tsquery}', [query])
+        rank = RawSQL(
+            f'SELECT ts_rank(document, {tsquery}) FROM {TABLE} WHERE product_id = {table}.id',
+            [query],
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(category__icontains=term)
+        return queryset.filter(condition).order_by('name', 'id')
+
+    return queryset.filter(id__in=matches).annotate(search_rank=rank).order_by('-search_rank', 'id')
@@ -1,27 +1,81 @@
 from rest_framework import serializers
 from .models import (
     Product, Sale, Business, Purchase, Expense, Card, Contact, License,
-    LicenseRenewal, Order, OrderItem, BusinessSettings
+    LicenseRenewal, Order, OrderItem, BusinessSettings, StockMovement,
+    CardTransaction, OrderStatusEvent, OrderStatusNote
 )
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 import re
 from django.contrib.auth import authenticate
 from django.db import transaction
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from django.core.mail import send_mail
 from django.conf import settings
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
+from .ledger import adjust_stock, adjust_balance
+from .rollups import bump_rollups, sale_entries, purchase_entries, expense_entries
+from .images import variant_urls
+from django.core.files.storage import default_storage
+
+
+class ImageVariantsField(serializers.Field):
+    """URL de las variantes redimensionadas: ``{tamaño: {formato: url}}``"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return variant_urls(value, default_storage)
+
 
 class ProductSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Product
         fields = ['id', 'name', 'description', 'category', 'purchase_price', 
-                 'sale_price', 'is_public', 'stock', 'created_at', 'image']
+                 'sale_price', 'is_public', 'stock', 'reserved', 'created_at', 'image', 'image_variants']
         read_only_fields = ['business']
 
+    def update(self, instance, validated_data):
+        # El stock no se sobrescribe: la diferencia se aplica como un ajuste
+        # para no pisar ventas concurrentes y dejarla en el historial
+        stock = validated_data.pop('stock', None)
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if validated_data:
+                instance.save(update_fields=list(validated_data))
+            if stock is not None and stock != instance.stock:
+                adjust_stock(instance.id, stock - instance.stock, 'adjustment', keep_reserved=False)
+                instance.refresh_from_db(fields=['stock'])
+        return instance
+
+class PublicProductWithBusinessSerializer(ProductSerializer):
+    business_id = serializers.IntegerField(source='business.id', read_only=True)
+    business_name = serializers.CharField(source='business.name', read_only=True)
+    image_url = serializers.SerializerMethodField()
+
+    def get_image_url(self, obj):
+        if obj.image:
+            return obj.image.url if hasattr(obj.image, 'url') else None
+        return None
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['business_id', 'business_name', 'image_url']
+
+class StockMovementSerializer(serializers.ModelSerializer):
+    reason_display = serializers.CharField(source='get_reason_display', read_only=True)
+
+    class Meta:
+        model = StockMovement
+        fields = ['id', 'quantity', 'reason', 'reason_display', 'reference_id', 'created_at']
+
 class SaleSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sale
@@ -29,37 +83,42 @@ class SaleSerializer(serializers.ModelSerializer):
         read_only_fields = ['business']
 
     def validate(self, data):
-        # Verificar stock disponible
-        product = Product.objects.get(id=data['product'].id)
-        if product.stock < data['quantity']:
+        # Verificación previa sin bloqueo; la definitiva se hace al descontar
+        # el stock en create()
+        product = data.get('product')
+        if product is None:
+            if self.instance is None:
+                raise serializers.ValidationError({'product': 'Se requiere el producto'})
+            return data
+        # Las unidades reservadas por pedidos no se pueden vender
+        available = product.stock - product.reserved
+        if 'quantity' in data and available < data['quantity']:
             raise serializers.ValidationError(
-                f"Stock insuficiente. Solo hay {product.stock} unidades disponibles."
+                f"Stock insuficiente. Solo hay {max(available, 0)} unidades disponibles."
             )
         return data
 
     def create(self, validated_data):
         request = self.context.get('request')
         validated_data['business'] = request.user.business
+        validated_data['unit_cost'] = validated_data['product'].purchase_price
         
         with transaction.atomic():
             # Crear la venta
             sale = super().create(validated_data)
-            
-            # Actualizar el stock del producto
-            product = Product.objects.get(id=sale.product.id)
-            product.stock -= sale.quantity
-            product.save()
-            
-            # Actualizar el saldo de la tarjeta si no es a crédito
-            if not sale.is_credit and sale.card:
-                card = Card.objects.get(id=sale.card.id)
-                total_amount = sale.quantity * sale.unit_price
-                card.balance += total_amount
-                card.save()
-            
+
+            # Descontar el stock solo si alcanza y luego acreditar la tarjeta
+            # si no es a crédito (siempre producto antes que tarjeta)
+            adjust_stock(sale.product_id, -sale.quantity, 'sale', sale.id)
+            if not sale.is_credit and sale.card_id:
+                adjust_balance(sale.card_id, sale.quantity * sale.unit_price, 'sale', sale.id)
+
+            bump_rollups(sale_entries(sale))
             return sale
 
 class BusinessSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Business
         fields = '__all__'  
@@ -77,21 +136,16 @@ class PurchaseSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             # Crear la compra
             purchase = super().create(validated_data)
-            
-            # Actualizar el stock del producto
-            product = Product.objects.get(id=purchase.product.id)
-            product.stock += purchase.quantity
-            product.save()
-            
-            # Actualizar el saldo de la tarjeta si no es a crédito
-            if not purchase.is_credit and purchase.card:
-                card = Card.objects.get(id=purchase.card.id)
+
+            # Sumar el stock y luego debitar la tarjeta si no es a crédito
+            if purchase.product_id:
+                adjust_stock(purchase.product_id, purchase.quantity, 'purchase', purchase.id)
+            if not purchase.is_credit and purchase.card_id:
                 total_amount = purchase.quantity * purchase.unit_price
-                if card.balance < total_amount:
-                    raise ValidationError("La tarjeta no tiene saldo suficiente")
-                card.balance -= total_amount
-                card.save()
-            
+                adjust_balance(purchase.card_id, -total_amount, 'purchase', purchase.id,
+                               require_funds=True)
+
+            bump_rollups(purchase_entries(purchase))
             return purchase
 
 class ExpenseSerializer(serializers.ModelSerializer):
@@ -107,15 +161,13 @@ class ExpenseSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             # Crear el gasto
             expense = super().create(validated_data)
-            
-            # Si hay una tarjeta asociada, actualizar su saldo
-            if expense.card:
-                card = Card.objects.get(id=expense.card.id)
-                if card.balance < expense.amount:
-                    raise ValidationError("La tarjeta no tiene saldo suficiente")
-                card.balance -= expense.amount
-                card.save()
-            
+
+            # Si hay una tarjeta asociada, debitar su saldo si alcanza
+            if expense.card_id:
+                adjust_balance(expense.card_id, -expense.amount, 'expense', expense.id,
+                               require_funds=True)
+
+            bump_rollups(expense_entries(expense))
             return expense
 
 class CardSerializer(serializers.ModelSerializer):
@@ -125,11 +177,25 @@ class CardSerializer(serializers.ModelSerializer):
         read_only_fields = ['business']
 
     def validate(self, data):
-        # Asegurar que balance tenga un valor por defecto si no se proporciona
-        if 'balance' not in data:
+        # Asegurar que balance tenga un valor por defecto al crear la tarjeta
+        if 'balance' not in data and self.instance is None:
             data['balance'] = 0
         return data
 
+    def update(self, instance, validated_data):
+        # El saldo no se sobrescribe: la diferencia se aplica como un ajuste
+        # para no pisar movimientos concurrentes y dejarla en el historial
+        balance = validated_data.pop('balance', None)
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if validated_data:
+                instance.save(update_fields=list(validated_data))
+            if balance is not None and balance != instance.balance:
+                adjust_balance(instance.id, balance - instance.balance, 'adjustment')
+                instance.refresh_from_db(fields=['balance'])
+        return instance
+
     def validate_balance(self, value):
         if value < 0:
             raise serializers.ValidationError("El balance no puede ser negativo")
@@ -141,7 +207,17 @@ class CardSerializer(serializers.ModelSerializer):
         representation['balance'] = float(representation['balance'])
         return representation
 
+class CardTransactionSerializer(serializers.ModelSerializer):
+    reason_display = serializers.CharField(source='get_reason_display', read_only=True)
+
+    class Meta:
+        model = CardTransaction
+        fields = ['id', 'amount', 'balance_after', 'reason', 'reason_display',
+                  'reference_id', 'created_at']
+
 class ContactSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Contact
         fields = '__all__'
@@ -227,6 +303,26 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'subtotal']
         read_only_fields = ['subtotal']
 
+class OrderStatusNoteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderStatusNote
+        fields = ['id', 'note', 'created_at']
+
+class OrderStatusEventSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    duration_seconds = serializers.SerializerMethodField()
+    # Notas añadidas mientras el pedido seguía en este estado
+    notes = OrderStatusNoteSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = OrderStatusEvent
+        fields = ['id', 'status', 'status_display', 'note', 'notes', 'entered_at', 'left_at', 'duration_seconds']
+
+    def get_duration_seconds(self, obj):
+        # El estado actual cuenta hasta ahora
+        end = obj.left_at or timezone.now()
+        return round((end - obj.entered_at).total_seconds())
+
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
@@ -241,9 +337,11 @@ class OrderSerializer(serializers.ModelSerializer):
             'delivery_type_display', 'delivery_address',
             'delivery_municipality', 'delivery_notes', 'pickup_time',
             'status', 'status_display', 'created_at', 'updated_at',
-            'total_amount', 'items', 'status_notes'
+            'total_amount', 'items', 'status_notes', 'reservation', 'reservation_expires_at'
         ]
-        read_only_fields = ['tracking_code', 'business', 'business_name']
+        # status_notes está obsoleto: solo conserva las notas anteriores al
+        # historial; las nuevas están en orders/<id>/timeline/
+        read_only_fields = ['tracking_code', 'business', 'business_name', 'status_notes']
 
     def create(self, validated_data):
         business = self.context.get('business')
@@ -260,24 +358,40 @@ class OrderSerializer(serializers.ModelSerializer):
                 'items': 'Debe incluir al menos un producto en el pedido'
             })
         
-        # Validar tipo de entrega
-        if data['delivery_type'] == 'delivery':
-            if not data.get('delivery_address'):
-                raise serializers.ValidationError({
-                    'delivery_address': 'La dirección es requerida para entregas a domicilio'
-                })
-            if not data.get('delivery_municipality'):
-                raise serializers.ValidationError({
-                    'delivery_municipality': 'El municipio es requerido para entregas a domicilio'
-                })
-        else:  # pickup
-            if not data.get('pickup_time'):
-                raise serializers.ValidationError({
-                    'pickup_time': 'La hora de recogida es requerida'
-                })
-        
+        validate_delivery(data)
         return data
 
+class OrderHeaderSerializer(serializers.ModelSerializer):
+    """Datos del cliente y la entrega de un pedido nuevo; los items se validan aparte"""
+
+    class Meta:
+        model = Order
+        fields = [
+            'customer_name', 'customer_phone', 'delivery_type', 'delivery_address',
+            'delivery_municipality', 'delivery_notes', 'pickup_time'
+        ]
+
+    def validate(self, data):
+        validate_delivery(data)
+        return data
+
+def validate_delivery(data):
+    # Validar tipo de entrega
+    if data['delivery_type'] == 'delivery':
+        if not data.get('delivery_address'):
+            raise serializers.ValidationError({
+                'delivery_address': 'La dirección es requerida para entregas a domicilio'
+            })
+        if not data.get('delivery_municipality'):
+            raise serializers.ValidationError({
+                'delivery_municipality': 'El municipio es requerido para entregas a domicilio'
+            })
+    else:  # pickup
+        if not data.get('pickup_time'):
+            raise serializers.ValidationError({
+                'pickup_time': 'La hora de recogida es requerida'
+            })
+
 class BusinessSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = BusinessSettings
@@ -1,3 +1,1012 @@
-from django.test import TestCase
+import json
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from types import SimpleNamespace
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import (
+    Business, Card, CardTransaction, DailyRollup, EmailOutbox, Expense, License, LocationDirectoryMember, Order,
+    OrderCodeBlock, OrderItem, OrderStatusEvent, Product, ProductFacetCount, Purchase, Sale, StockMovement
+)
+from .outbox import claim_batch, queue_email, send_pending
+from .reservations import (
+    consume_reservation, release_expired, release_reservation, reservation_expiry, reserve_stock
+)
+from .codes import CodeAllocator, permute
+from .directory import location_directory
+from .events import broker
+from .facets import facet_counts, rebuild_facets
+from .hours import open_status
+from .ledger import take_stock_snapshots
+from .rollups import rebuild_rollups
+from .serializers import BusinessSerializer, ProductSerializer, SaleSerializer
+from .views.public_views import business_renderer, product_renderer
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_RETRY_SECONDS=60)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.email = queue_email('Nuevo pedido', 'Cuerpo', ['negocio@example.com'])
+
+    def test_queue_email_without_recipients(self):
+        self.assertIsNone(queue_email('Asunto', 'Cuerpo', ['', None]))
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_send_pending_marks_sent(self):
+        self.assertEqual(send_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['negocio@example.com'])
+
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, 'sent')
+        self.assertEqual(self.email.attempts, 1)
+        self.assertIsNone(self.email.claim_token)
+        self.assertIsNotNone(self.email.sent_at)
+        # Ya enviado: no se vuelve a mandar
+        self.assertEqual(send_pending(), (0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_claimed_emails_are_not_claimed_again(self):
+        self.assertEqual([email.id for email in claim_batch(10)], [self.email.id])
+        self.assertEqual(claim_batch(10), [])
+
+        # Al vencer la reserva vuelve a estar disponible
+        EmailOutbox.objects.filter(id=self.email.id).update(next_attempt_at=timezone.now())
+        self.assertEqual([email.id for email in claim_batch(10)], [self.email.id])
+
+    def test_failed_send_is_retried_later(self):
+        with mock.patch('api.outbox.EmailMessage.send', side_effect=SMTPException('sin conexión')):
+            before = timezone.now()
+            self.assertEqual(send_pending(), (0, 1))
+
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, 'pending')
+        self.assertEqual(self.email.attempts, 1)
+        self.assertIn('sin conexión', self.email.last_error)
+        self.assertGreaterEqual(self.email.next_attempt_at, before + timedelta(seconds=60))
+        # Aún no toca reintentar
+        self.assertEqual(send_pending(), (0, 0))
+
+        EmailOutbox.objects.filter(id=self.email.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_pending(), (1, 0))
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, 'sent')
+        self.assertEqual(self.email.attempts, 2)
+        self.assertEqual(self.email.last_error, '')
+
+    def test_gives_up_after_max_attempts(self):
+        with mock.patch('api.outbox.EmailMessage.send', side_effect=SMTPException('rechazado')):
+            self.assertEqual(send_pending(max_attempts=1), (0, 1))
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, 'failed')
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.business = user.business
+        self.product = Product.objects.create(business=self.business, name='Café', stock=5, sale_price=2)
+
+    def create_order(self, quantity=2):
+        lines = [OrderItem(product=self.product, quantity=quantity, unit_price=Decimal('2.00'),
+                           subtotal=quantity * Decimal('2.00'))]
+        errors = reserve_stock(self.business.id, lines)
+        if errors:
+            return None, errors
+        order = Order.objects.create(
+            business=self.business, customer_name='Ana', customer_phone='5555', delivery_type='pickup',
+            reservation='active', reservation_expires_at=reservation_expiry(),
+        )
+        for line in lines:
+            line.order = order
+        OrderItem.objects.bulk_create(lines)
+        return order, []
+
+    def assertStock(self, stock, reserved):
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.reserved), (stock, reserved))
+
+    def test_reserve_keeps_physical_stock(self):
+        order, errors = self.create_order(2)
+        self.assertEqual(errors, [])
+        self.assertStock(5, 2)
+
+        # Solo quedan 3 disponibles
+        order, errors = self.create_order(4)
+        self.assertIsNone(order)
+        self.assertEqual(errors[0]['index'], 0)
+        self.assertStock(5, 2)
+
+    def test_release_returns_units_once(self):
+        order, _ = self.create_order(2)
+        self.assertTrue(release_reservation(order))
+        self.assertEqual(order.reservation, 'released')
+        self.assertStock(5, 0)
+
+        self.assertFalse(release_reservation(order))
+        self.assertStock(5, 0)
+
+    def test_consume_takes_units_from_stock_once(self):
+        order, _ = self.create_order(2)
+        self.assertTrue(consume_reservation(order))
+        self.assertEqual(order.reservation, 'consumed')
+        self.assertStock(3, 0)
+        self.assertEqual(
+            list(StockMovement.objects.filter(reason='order').values_list('quantity', 'reference_id')),
+            [(-2, order.pk)],
+        )
+
+        self.assertFalse(consume_reservation(order))
+        self.assertFalse(release_reservation(order))
+        self.assertStock(3, 0)
+
+    def test_consume_after_release_uses_available_stock(self):
+        order, _ = self.create_order(2)
+        release_reservation(order)
+        other, _ = self.create_order(4)
+        self.assertStock(5, 4)
+
+        # Solo queda 1 unidad sin apartar para el pedido liberado
+        with self.assertRaises(ValidationError):
+            consume_reservation(order)
+        order.refresh_from_db()
+        self.assertEqual(order.reservation, 'released')
+        self.assertStock(5, 4)
+
+        release_reservation(other)
+        self.assertTrue(consume_reservation(order))
+        self.assertStock(3, 0)
+
+    def test_release_expired(self):
+        order, _ = self.create_order(2)
+        pending, _ = self.create_order(1)
+        Order.objects.filter(pk=order.pk).update(reservation_expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(release_expired(), 1)
+        order.refresh_from_db()
+        pending.refresh_from_db()
+        self.assertEqual(order.reservation, 'expired')
+        self.assertEqual(pending.reservation, 'active')
+        self.assertStock(5, 1)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.product = Product.objects.create(
+            business=self.user.business, name='Café', stock=50, sale_price=3, purchase_price=1
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def rollups(self):
+        return sorted(DailyRollup.objects.filter(count__gt=0).values_list('day', 'category', 'amount', 'count'))
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_update_and_delete_keep_totals(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        sale = self.client.post('/api/sales/', {'product': self.product.id, 'quantity': 2, 'unit_price': '3.00'})
+        purchase = self.client.post('/api/purchases/', {'product': self.product.id, 'quantity': 5, 'unit_price': '1.00'})
+        expense = self.client.post('/api/expenses/', {'amount': '7.50'})
+        for response in (sale, purchase, expense):
+            self.assertEqual(response.status_code, 201, response.content)
+        self.assertMatchesRebuild()
+
+        # Cambiar importes y mover una venta a otro día
+        self.assertEqual(self.client.patch(f"/api/sales/{sale.data['id']}/", {
+            'quantity': 4, 'unit_price': '2.50', 'created_at': yesterday.isoformat()
+        }).status_code, 200)
+        self.assertEqual(self.client.put(f"/api/purchases/{purchase.data['id']}/", {
+            'product': self.product.id, 'quantity': 3, 'unit_price': '2.00'
+        }).status_code, 200)
+        self.assertEqual(self.client.patch(f"/api/expenses/{expense.data['id']}/", {'amount': '9.00'}).status_code, 200)
+        self.assertMatchesRebuild()
+        self.assertIn((timezone.localdate(yesterday), 'revenue', Decimal('10.00'), 1), self.rollups())
+
+        for url in (f"/api/sales/{sale.data['id']}/", f"/api/purchases/{purchase.data['id']}/",
+                    f"/api/expenses/{expense.data['id']}/"):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(Sale.objects.exists() or Purchase.objects.exists() or Expense.objects.exists())
+        self.assertEqual(self.rollups(), [])
+        self.assertMatchesRebuild()
+
+    def test_financial_summary_reads_rollups(self):
+        today = timezone.localdate()
+        self.client.post('/api/sales/', {'product': self.product.id, 'quantity': 2, 'unit_price': '3.00'})
+        self.client.post('/api/purchases/', {'product': self.product.id, 'quantity': 5, 'unit_price': '1.00'})
+        self.client.post('/api/expenses/', {'amount': '7.50'})
+        Sale.objects.create(business=self.user.business, product=self.product, quantity=1, unit_price=100,
+                            created_at=timezone.now() - timedelta(days=40))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/financial-summary/?from={today}&to={today}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {
+            'revenue': Decimal('6.00'), 'cost_of_goods': Decimal('2.00'), 'purchases': Decimal('5.00'),
+            'expenses': Decimal('7.50'), 'gross_profit': Decimal('4.00'), 'net_profit': Decimal('-3.50'),
+        })
+        self.assertEqual([(row['period'], row['sales_count']) for row in response.data['results']], [(today, 1)])
+
+        self.assertEqual(self.client.get('/api/financial-summary/?group=week').status_code, 400)
+        self.assertEqual(self.client.get('/api/financial-summary/?from=ayer').status_code, 400)
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        product = Product.objects.create(business=self.user.business, name='Café', stock=5, sale_price=2)
+        self.client = APIClient()
+        response = self.client.post('/api/orders/', {
+            'business': self.user.business.id, 'customer_name': 'Ana', 'customer_phone': '5555',
+            'delivery_type': 'pickup', 'pickup_time': '10:00',
+            'items': [{'product': product.id, 'quantity': 1, 'unit_price': '2.00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.order_id = response.data['order']['id']
+        self.client.force_authenticate(self.user)
+
+    def change_status(self, **data):
+        return self.client.patch(f'/api/orders/{self.order_id}/status/', data, format='json')
+
+    def test_notes_without_status_change_are_inserted(self):
+        self.assertEqual(self.change_status(status='confirmed', notes='Confirmado por teléfono').status_code, 200)
+        event = OrderStatusEvent.objects.get(order_id=self.order_id, left_at=None)
+        self.change_status(notes='Sin azúcar')
+        self.change_status(notes='Recoge su hermana')
+
+        event.refresh_from_db()
+        self.assertEqual(event.note, 'Confirmado por teléfono')
+        self.assertEqual(OrderStatusEvent.objects.filter(order_id=self.order_id).count(), 2)
+
+        timeline = self.client.get(f'/api/orders/{self.order_id}/timeline/').data
+        self.assertEqual([step['status'] for step in timeline], ['pending', 'confirmed'])
+        self.assertEqual([note['note'] for note in timeline[1]['notes']], ['Sin azúcar', 'Recoge su hermana'])
+
+    def test_invalid_status_is_rejected(self):
+        self.assertEqual(self.change_status(status='lost').status_code, 400)
+        self.assertEqual(OrderStatusEvent.objects.filter(order_id=self.order_id).count(), 1)
+
+
+class LedgerAssertions:
+    def assertLedgerMatches(self, product, card):
+        product.refresh_from_db()
+        card.refresh_from_db()
+        movements = StockMovement.objects.filter(product=product).aggregate(total=Sum('quantity'))['total']
+        transactions = CardTransaction.objects.filter(card=card).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(movements, product.stock)
+        self.assertEqual(transactions or 0, card.balance)
+
+
+class ConcurrentStockTests(LedgerAssertions, TransactionTestCase):
+    SELLERS = 4
+    SALES = 10
+
+    def test_concurrent_sales_do_not_oversell_or_lose_updates(self):
+        user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        product = Product.objects.create(business=user.business, name='Café', stock=15, sale_price=1)
+        card = Card.objects.create(business=user.business, name='Caja', number='0000', balance=0)
+        request = SimpleNamespace(user=user)
+        outcomes = []
+        barrier = threading.Barrier(self.SELLERS)
+
+        def seller():
+            try:
+                barrier.wait()
+                for _ in range(self.SALES):
+                    serializer = SaleSerializer(
+                        data={'product': product.id, 'card': card.id, 'quantity': 1, 'unit_price': '2'},
+                        context={'request': request},
+                    )
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save()
+                        outcomes.append('sold')
+                    except ValidationError:
+                        outcomes.append('rejected')
+                    except OperationalError:
+                        # SQLite bloquea la base entera: se cuenta como venta no hecha
+                        outcomes.append('locked')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=seller) for _ in range(self.SELLERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sold = Sale.objects.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual(sold, outcomes.count('sold'))
+        self.assertGreater(sold, 0)
+        self.assertLessEqual(sold, 15)
+        product.refresh_from_db()
+        card.refresh_from_db()
+        self.assertEqual(product.stock, 15 - sold)
+        self.assertEqual(card.balance, 2 * sold)
+        self.assertLedgerMatches(product, card)
+
+
+class UndoTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.product = Product.objects.create(business=self.user.business, name='Café', stock=10, sale_price=3)
+        self.card = Card.objects.create(business=self.user.business, name='Caja', number='0000', balance=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Saldo inicial registrado en el historial de la tarjeta
+        self.client.patch(f'/api/cards/{self.card.id}/', {'balance': '100.00'})
+
+    def assertState(self, stock, balance):
+        self.assertLedgerMatches(self.product, self.card)
+        self.assertEqual((self.product.stock, self.card.balance), (stock, Decimal(balance)))
+
+    def test_undo_sale(self):
+        sale = self.client.post('/api/sales/', {'product': self.product.id, 'card': self.card.id,
+                                                'quantity': 4, 'unit_price': '3.00'})
+        self.assertState(6, '112.00')
+        self.assertEqual(self.client.post(f"/api/sales/{sale.data['id']}/undo_sale/").status_code, 200)
+        self.assertState(10, '100.00')
+
+    def test_undo_purchase(self):
+        purchase = self.client.post('/api/purchases/', {'product': self.product.id, 'card': self.card.id,
+                                                        'quantity': 5, 'unit_price': '2.00'})
+        self.assertState(15, '90.00')
+        self.assertEqual(self.client.post(f"/api/purchases/{purchase.data['id']}/undo_purchase/").status_code, 200)
+        self.assertState(10, '100.00')
+
+    def test_undo_expense(self):
+        expense = self.client.post('/api/expenses/', {'card': self.card.id, 'amount': '30.00'})
+        self.assertState(10, '70.00')
+        response = self.client.post(f"/api/expenses/{expense.data['id']}/undo_expense/", {'card_id': self.card.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['new_balance'], 100.0)
+        self.assertState(10, '100.00')
+
+    def test_sale_beyond_stock_changes_nothing(self):
+        response = self.client.post('/api/sales/', {'product': self.product.id, 'card': self.card.id,
+                                                    'quantity': 11, 'unit_price': '3.00'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+        self.assertState(10, '100.00')
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        self.business = User.objects.create_user('negocio', 'negocio@example.com', 'clave').business
+        Business.objects.filter(pk=self.business.pk).update(is_public=True, province='La Habana', municipality='Plaza')
+        self.business.refresh_from_db()
+        self.coffee = Product.objects.create(business=self.business, name='Café', category='Bebidas',
+                                             stock=5, sale_price=50)
+        self.rice = Product.objects.create(business=self.business, name='Arroz', category=None,
+                                           stock=5, sale_price=300)
+
+    def counts(self):
+        return sorted(ProductFacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count'))
+
+    def assertMatchesRebuild(self):
+        incremental = self.counts()
+        rebuild_facets()
+        self.assertEqual(incremental, self.counts())
+
+    def test_counts_follow_product_changes(self):
+        self.assertIn(('category', 'Otros', 1), self.counts())
+        self.assertIn(('province', 'La Habana', 2), self.counts())
+        self.assertMatchesRebuild()
+
+        self.coffee.category = 'Alimentos'
+        self.coffee.sale_price = 700
+        self.coffee.save()
+        self.rice.is_public = False
+        self.rice.save()
+        self.assertMatchesRebuild()
+        self.assertIn(('municipality', 'Plaza', 1), self.counts())
+
+        self.rice.is_public = True
+        self.rice.save()
+        self.coffee.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.counts(), sorted([
+            ('category', 'Otros', 1), ('price', '100-500', 1),
+            ('province', 'La Habana', 1), ('municipality', 'Plaza', 1),
+        ]))
+
+    def test_unrelated_saves_do_not_touch_facets(self):
+        with self.assertNumQueries(1):
+            self.coffee.stock = 3
+            self.coffee.save(update_fields=['stock'])
+
+        self.business.name = 'Otro nombre'
+        self.business.save()
+        self.assertMatchesRebuild()
+
+    def test_business_location_change_moves_counts(self):
+        self.business.province = 'Matanzas'
+        self.business.municipality = 'Varadero'
+        self.business.save()
+        self.assertIn(('province', 'Matanzas', 2), self.counts())
+        self.assertNotIn('La Habana', [value for _, value, _ in self.counts()])
+        self.assertMatchesRebuild()
+        self.assertEqual({item['value'] for item in facet_counts({'province': 'Matanzas'})['category']},
+                         {'Bebidas', 'Otros'})
+
+
+class LocationDirectoryTests(TestCase):
+    def setUp(self):
+        self.businesses = []
+        for username in ('plaza', 'cerro'):
+            business = User.objects.create_user(username, f'{username}@example.com', 'clave').business
+            business.is_public = True
+            business.province = 'La Habana'
+            business.municipality = 'Plaza'
+            business.save()
+            self.businesses.append(business)
+
+    def test_expired_license_is_not_counted_without_writing(self):
+        self.assertEqual(location_directory()[0]['count'], 2)
+        # Las licencias caducan con el paso del tiempo, sin pasar por las señales
+        yesterday = timezone.now() - timedelta(days=1)
+        License.objects.filter(user=self.businesses[0].user).update(expiration_date=yesterday)
+        LocationDirectoryMember.objects.filter(business=self.businesses[0]).update(expires_at=yesterday)
+
+        with self.assertNumQueries(2):
+            directory = location_directory()
+        self.assertEqual(directory, [{'province': 'La Habana', 'count': 1,
+                                      'municipalities': [{'municipality': 'Plaza', 'count': 1}]}])
+        self.assertEqual(LocationDirectoryMember.objects.count(), 2)
+
+        call_command('expire_location_directory', stdout=StringIO())
+        self.assertFalse(LocationDirectoryMember.objects.filter(business=self.businesses[0]).exists())
+        self.assertEqual(location_directory(), directory)
+
+    def test_locations_endpoint_skips_placeholder_locations(self):
+        # Un negocio recién creado conserva la ubicación de relleno
+        business = User.objects.create_user('nuevo', 'nuevo@example.com', 'clave').business
+        business.is_public = True
+        business.save()
+        self.assertTrue(LocationDirectoryMember.objects.filter(business=business).exists())
+        response = APIClient().get('/api/public-businesses/locations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [{'province': 'La Habana', 'count': 2,
+                                          'municipalities': [{'municipality': 'Plaza', 'count': 2}]}])
+
+
+class BulkSaleTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.product = Product.objects.create(business=self.user.business, name='Café', stock=5, sale_price=3)
+        self.card = Card.objects.create(business=self.user.business, name='Caja', number='0000', balance=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_mode_reports_invalid_items_by_index(self):
+        response = self.client.post('/api/sales/batch/?mode=bulk', [
+            {'product': self.product.id, 'card': self.card.id, 'quantity': 2, 'unit_price': '3.00'},
+            {'product': self.product.id, 'quantity': 4, 'unit_price': '3.00'},
+            {'product': 0, 'quantity': 1, 'unit_price': '3.00'},
+            {'product': self.product.id, 'quantity': 'dos', 'unit_price': '3.00'},
+            {'product': self.product.id, 'card': self.card.id, 'quantity': 3, 'unit_price': '1.00'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data['success_count'], response.data['error_count']), (2, 3))
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertIn('Stock insuficiente', str(response.data['errors'][0]['errors']))
+        self.assertEqual([sale['quantity'] for sale in response.data['results']], [2, 3])
+        self.assertLedgerMatches(self.product, self.card)
+        self.assertEqual((self.product.stock, self.card.balance), (0, Decimal('9.00')))
+
+    def test_bulk_mode_requires_a_list(self):
+        response = self.client.post('/api/sales/batch/?mode=bulk', {'product': self.product.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Sale.objects.exists())
+
+
+class PurchaseImportTests(LedgerAssertions, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.product = Product.objects.create(business=self.user.business, name='Café', stock=0, sale_price=3)
+        self.card = Card.objects.create(business=self.user.business, name='Caja', number='0000', balance=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.patch(f'/api/cards/{self.card.id}/', {'balance': '100.00'})
+
+    def import_lines(self, body, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.post(f'/api/purchases/import_ndjson/?{query}', body,
+                                content_type='application/x-ndjson')
+
+    def test_streams_one_line_per_purchase_and_a_summary(self):
+        response = self.import_lines('\n'.join([
+            json.dumps({'product': self.product.id, 'card': self.card.id, 'quantity': 4, 'unit_price': '2.50'}),
+            'no es json',
+            '',
+            json.dumps({'product': 0, 'quantity': 1, 'unit_price': '1.00'}),
+            json.dumps({'product': self.product.id, 'quantity': 6, 'unit_price': '1.00'}),
+        ]), chunk_size=2)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line.get('line') for line in lines], [1, 2, 4, 5, None])
+        self.assertIn('id', lines[0])
+        self.assertIn('errors', lines[1])
+        self.assertIn('product', lines[2]['errors'])
+        self.assertEqual(lines[-1], {'success_count': 2, 'error_count': 2})
+
+        self.assertEqual(Purchase.objects.count(), 2)
+        self.assertLedgerMatches(self.product, self.card)
+        self.assertEqual((self.product.stock, self.card.balance), (10, Decimal('90.00')))
+
+    def test_rejects_invalid_chunk_size(self):
+        response = self.import_lines('{}', chunk_size=0)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('chunk_size', response.data['error'])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        now = timezone.now()
+        # Dos gastos con la misma fecha: el id desempata
+        self.expenses = [
+            Expense.objects.create(business=self.user.business, amount=amount, created_at=created_at)
+            for amount, created_at in ((1, now - timedelta(days=2)), (2, now - timedelta(days=1)),
+                                       (3, now - timedelta(days=1)), (4, now), (5, now))
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_follow_created_at_and_id_both_ways(self):
+        expected = [expense.id for expense in sorted(self.expenses, key=lambda e: (e.created_at, e.id), reverse=True)]
+        pages = []
+        response = self.client.get('/api/expenses/?page_size=2')
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['id'] for item in response.data['results']])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(pages, [expected[0:2], expected[2:4], expected[4:]])
+        self.assertIsNone(self.client.get('/api/expenses/?page_size=2').data['previous'])
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([item['id'] for item in previous.data['results']], expected[2:4])
+        self.assertIsNotNone(previous.data['next'])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/expenses/?cursor=no-es-un-cursor').status_code, 404)
+
+
+class PublicCatalogTests(TestCase):
+    def setUp(self):
+        self.business = self.make_business('negocio', 'La Habana', 'Plaza')
+        self.coffee = Product.objects.create(business=self.business, name='Café molido', category='Bebidas',
+                                             stock=5, sale_price=50, is_public=True)
+        self.cup = Product.objects.create(business=self.business, name='Taza', category='Hogar',
+                                          description='Taza para servir café', stock=5, sale_price=300,
+                                          is_public=True)
+        Product.objects.create(business=self.business, name='Café de la casa', stock=5, sale_price=10,
+                               is_public=False)
+        self.other = self.make_business('panaderia', 'Matanzas', 'Varadero')
+        self.bread = Product.objects.create(business=self.other, name='Pan', category='Alimentos',
+                                            stock=5, sale_price=20, is_public=True)
+        self.client = APIClient()
+
+    def make_business(self, username, province, municipality):
+        business = User.objects.create_user(username, f'{username}@example.com', 'clave').business
+        business.is_public = True
+        business.province = province
+        business.municipality = municipality
+        business.save()
+        return business
+
+    def names(self, data):
+        results = data['results'] if isinstance(data, dict) else data
+        return [item['name'] for item in results]
+
+    def test_conditional_requests_until_the_catalog_changes(self):
+        response = self.client.get('/api/public-products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(self.names(response.data)), ['Café molido', 'Pan', 'Taza'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/public-products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/public-products/?category=Hogar',
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.coffee.is_public = False
+            self.coffee.save()
+        response = self.client.get('/api/public-products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(sorted(self.names(response.data)), ['Pan', 'Taza'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_sends_no_validators(self):
+        response = self.client.get('/api/public-products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+    def test_search_ranks_name_matches_first(self):
+        response = self.client.get('/api/public-products/?search=cafe')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(self.names(response.data), ['Café molido', 'Taza'])
+
+        response = self.client.get('/api/public-products/?search=caf&category=Hogar&page_size=1')
+        self.assertEqual(self.names(response.data), ['Taza'])
+        self.assertEqual(self.names(self.client.get('/api/public-products/?search=bicicleta').data), [])
+
+    def test_facet_counts_and_filters(self):
+        facets = self.client.get('/api/public-products/facets/').data
+        self.assertEqual(facets['category'],
+                         [{'value': value, 'count': 1} for value in ('Alimentos', 'Bebidas', 'Hogar')])
+        self.assertEqual(facets['price'], [{'value': '0-100', 'count': 2}, {'value': '100-500', 'count': 1}])
+        self.assertEqual(facets['province'], [{'value': 'La Habana', 'count': 2}, {'value': 'Matanzas', 'count': 1}])
+
+        facets = self.client.get('/api/public-products/facets/?province=Matanzas').data
+        self.assertEqual(facets['category'], [{'value': 'Alimentos', 'count': 1}])
+        self.assertEqual(facets['municipality'], [{'value': 'Varadero', 'count': 1}])
+
+        self.assertEqual(sorted(self.names(self.client.get('/api/public-products/?price=0-100').data)),
+                         ['Café molido', 'Pan'])
+        self.assertEqual(self.names(self.client.get('/api/public-products/?province=La Habana&max_price=100').data),
+                         ['Café molido'])
+        self.assertEqual(self.client.get('/api/public-products/categories/').data, ['Alimentos', 'Bebidas', 'Hogar'])
+
+    def test_storefront_bundles_business_settings_and_products(self):
+        url = f'/api/public-businesses/{self.business.id}/storefront/'
+        response = self.client.get(f'{url}?page_size=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['business']['id'], self.business.id)
+        self.assertIn('is_open_now', response.data['business'])
+        self.assertIn('settings', response.data)
+        self.assertEqual(response.data['products']['count'], 2)
+        self.assertEqual(self.names(response.data['products']), ['Café molido'])
+        self.assertIsNotNone(response.data['products']['next'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cup.name = 'Jarra'
+            self.cup.save()
+        self.assertEqual(self.names(self.client.get(url).data['products']), ['Café molido', 'Jarra'])
+
+        self.assertEqual(self.client.get('/api/public-businesses/abc/storefront/').status_code, 404)
+        Business.objects.filter(pk=self.other.pk).update(is_public=False)
+        self.assertEqual(self.client.get(f'/api/public-businesses/{self.other.id}/storefront/').status_code, 404)
+
+
+
+class BusinessHoursTests(TestCase):
+    # Miércoles a las 10:00 en La Habana
+    NOW = datetime(2026, 10, 21, 10, 0, tzinfo=ZoneInfo('America/Havana'))
+
+    def setUp(self):
+        # Horario por defecto: de lunes a viernes de 9:00 a 18:00
+        self.day = User.objects.create_user('cafeteria', 'cafeteria@example.com', 'clave').business
+        self.night = User.objects.create_user('bar', 'bar@example.com', 'clave').business
+        Business.objects.filter(pk__in=[self.day.pk, self.night.pk]).update(is_public=True)
+        self.night.settings.business_hours = {
+            'miercoles': {'abierto': True, 'horario': [{'apertura': '22:00', 'cierre': '02:00'}]}
+        }
+        self.night.settings.save()
+        self.client = APIClient()
+
+    def test_open_now_filter_and_status(self):
+        with mock.patch('api.hours._local_now', return_value=self.NOW):
+            open_now = self.client.get('/api/public-businesses/?open_now=true').data
+            closed = self.client.get('/api/public-businesses/?open_now=false').data
+
+        self.assertEqual([business['id'] for business in open_now], [self.day.id])
+        self.assertTrue(open_now[0]['is_open_now'])
+        self.assertEqual([business['id'] for business in closed], [self.night.id])
+        self.assertFalse(closed[0]['is_open_now'])
+        self.assertEqual(datetime.fromisoformat(closed[0]['opens_next_at']), self.NOW.replace(hour=22))
+
+    def test_overnight_hours_continue_the_next_day(self):
+        after_midnight = self.NOW + timedelta(hours=15)
+        with mock.patch('api.hours._local_now', return_value=after_midnight):
+            status = open_status([self.day.id, self.night.id])
+        self.assertEqual(status[self.night.id], {'is_open_now': True,
+                                                 'opens_next_at': self.NOW.replace(hour=22) + timedelta(days=7)})
+        self.assertEqual(status[self.day.id], {'is_open_now': False,
+                                               'opens_next_at': self.NOW.replace(day=22, hour=9)})
+
+
+class OrderCodeTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch('api.codes.BLOCK_SIZE', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.allocator = CodeAllocator()
+
+    def test_codes_are_unique_and_take_one_query_per_block(self):
+        codes = []
+        for _ in range(7):
+            with self.captureOnCommitCallbacks(execute=True):
+                codes.append(self.allocator.next_code())
+        self.assertEqual(len(set(codes)), 7)
+        self.assertTrue(all(len(code) == 8 and code.isalnum() and code == code.upper() for code in codes))
+        self.assertEqual(OrderCodeBlock.objects.count(), 3)
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(0):
+            codes.append(self.allocator.next_code())
+        self.assertEqual(len(set(codes)), 8)
+
+    def test_uncommitted_block_is_not_reused(self):
+        # En SQLite el bloque de una transacción sin confirmar solo da un código
+        first = self.allocator.next_code()
+        second = self.allocator.next_code()
+        self.assertNotEqual(first, second)
+        self.assertEqual(OrderCodeBlock.objects.count(), 2)
+
+    def test_permutation_is_a_bijection(self):
+        self.assertEqual(len({permute(number) for number in range(5000)}), 5000)
+
+
+class OrderApiTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.products = [
+            Product.objects.create(business=self.user.business, name=name, stock=5, sale_price=2)
+            for name in ('Café', 'Pan', 'Leche')
+        ]
+        self.client = APIClient()
+
+    def place_order(self, *quantities, **data):
+        return self.client.post('/api/orders/', {
+            'business': self.user.business.id, 'customer_name': 'Ana', 'customer_phone': '5555',
+            'delivery_type': 'pickup', 'pickup_time': '10:00',
+            'items': [{'product': product.id, 'quantity': quantity, 'unit_price': '2.00'}
+                      for product, quantity in zip(self.products, quantities)],
+            **data,
+        }, format='json')
+
+    def test_create_order_reserves_stock_and_queues_email(self):
+        response = self.place_order(2, 1)
+        self.assertEqual(response.status_code, 201, response.content)
+        order = response.data['order']
+        self.assertEqual(response.data['tracking_code'], order['tracking_code'])
+        self.assertEqual(order['total_amount'], '6.00')
+        self.assertEqual([(item['product'], item['quantity']) for item in order['items']],
+                         [(self.products[0].id, 2), (self.products[1].id, 1)])
+        self.assertEqual(list(Product.objects.order_by('id').values_list('reserved', flat=True)), [2, 1, 0])
+        self.assertEqual(EmailOutbox.objects.get().recipients, ['negocio@example.com'])
+
+    def test_query_count_does_not_grow_with_items(self):
+        with CaptureQueriesContext(connection) as one_item:
+            self.assertEqual(self.place_order(1).status_code, 201)
+        with CaptureQueriesContext(connection) as three_items:
+            self.assertEqual(self.place_order(1, 1, 1).status_code, 201)
+        self.assertEqual(len(three_items), len(one_item))
+
+    def test_invalid_orders_save_nothing(self):
+        response = self.place_order(1, 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'][0]['index'], 1)
+
+        response = self.place_order(1, 6)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'][0]['index'], 1)
+
+        self.assertEqual(self.place_order(1, delivery_type='delivery').status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Product.objects.filter(reserved__gt=0).exists())
+
+    def test_track_order_revalidates_until_the_order_changes(self):
+        code = self.place_order(1).data['tracking_code']
+        url = f'/api/track/{code}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['status_code'], response.data['items'][0]['name']), ('pending', 'Café'))
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url).data['status'], 'Pendiente')
+        self.assertFalse([query for query in queries if 'api_order' in query['sql']])
+
+        self.client.force_authenticate(self.user)
+        order_id = Order.objects.get(tracking_code=code).id
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/orders/{order_id}/status/', {'status': 'confirmed'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status_code'], 'confirmed')
+        self.assertNotEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get('/api/track/NOEXISTE/').status_code, 404)
+
+    async def test_events_stream_sends_status_until_final(self):
+        response = await sync_to_async(self.place_order)(1)
+        code = response.data['tracking_code']
+        self.assertEqual((await self.async_client.get('/api/track/NOEXISTE/events/')).status_code, 404)
+
+        response = await self.async_client.get(f'/api/track/{code}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn('"status_code": "pending"', (await anext(stream)).decode())
+        self.assertEqual(broker.watchers(code), 1)
+
+        broker.publish(code, {'tracking_code': code, 'status_code': 'delivered'})
+        self.assertEqual(await anext(stream), b'event: status\ndata: ' + json.dumps(
+            {'tracking_code': code, 'status_code': 'delivered'}
+        ).encode() + b'\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(broker.watchers(code), 0)
+
+    def test_events_stream_requires_asgi(self):
+        code = self.place_order(1).data['tracking_code']
+        self.assertEqual(self.client.get(f'/api/track/{code}/events/').status_code, 501)
+
+    def test_board_groups_orders_by_status(self):
+        codes = [self.place_order(1).data['tracking_code'] for _ in range(5)]
+        for code, status in zip(codes, ('pending', 'pending', 'preparing', 'delivered', 'cancelled')):
+            Order.objects.filter(tracking_code=code).update(status=status)
+        self.client.force_authenticate(self.user)
+
+        # Conteos, pedidos más recientes, items y productos
+        with self.assertNumQueries(4):
+            board = self.client.get('/api/orders/board/?limit=1').data
+        self.assertEqual(board['counts'], {'pending': 2, 'confirmed': 0, 'preparing': 1, 'ready': 0,
+                                           'in_delivery': 0, 'delivered': 1, 'cancelled': 1})
+        columns = {column['status']: column for column in board['columns']}
+        self.assertEqual(list(columns), ['pending', 'confirmed', 'preparing', 'ready', 'in_delivery'])
+        self.assertEqual(columns['pending']['count'], 2)
+        self.assertEqual([order['tracking_code'] for order in columns['pending']['orders']], [codes[1]])
+        self.assertEqual([order['tracking_code'] for order in columns['preparing']['orders']], [codes[2]])
+        self.assertEqual(board['closed'], [
+            {'status': 'delivered', 'status_display': 'Entregado', 'count': 1},
+            {'status': 'cancelled', 'status_display': 'Cancelado', 'count': 1},
+        ])
+
+        delivered = self.client.get('/api/orders/board/delivered/').data
+        self.assertEqual([order['tracking_code'] for order in delivered['results']], [codes[3]])
+        self.assertIsNone(delivered['next'])
+        self.assertEqual(self.client.get('/api/orders/board/pending/').status_code, 404)
+        self.assertEqual(self.client.get('/api/orders/board/?limit=muchos').status_code, 400)
+
+
+class LedgerHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.product = Product.objects.create(business=self.user.business, name='Café', stock=10, sale_price=3)
+        self.card = Card.objects.create(business=self.user.business, name='Caja', number='0000', balance=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.patch(f'/api/cards/{self.card.id}/', {'balance': '100.00'})
+        self.before_sale = timezone.now()
+        self.sale = self.client.post('/api/sales/', {'product': self.product.id, 'card': self.card.id,
+                                                     'quantity': 4, 'unit_price': '3.00'}).data
+
+    def test_product_movements_and_stock_at(self):
+        url = f'/api/products/{self.product.id}/'
+        movements = self.client.get(f'{url}movements/').data
+        self.assertEqual([(m['reason'], m['quantity'], m['reference_id']) for m in movements],
+                         [('sale', -4, self.sale['id']), ('initial', 10, None)])
+
+        self.assertEqual(self.client.get(f'{url}stock_at/', {'at': self.before_sale.isoformat()}).data['stock'], 10)
+        take_stock_snapshots(timezone.now())
+        self.client.post('/api/sales/', {'product': self.product.id, 'quantity': 2, 'unit_price': '3.00'})
+        self.assertEqual(self.client.get(f'{url}stock_at/', {'at': timezone.now().isoformat()}).data['stock'], 4)
+        self.assertEqual(self.client.get(f'{url}stock_at/').status_code, 400)
+
+    def test_card_transactions_balance_at_and_statement(self):
+        url = f'/api/cards/{self.card.id}/'
+        transactions = self.client.get(f'{url}transactions/').data
+        self.assertEqual([(t['reason'], t['amount'], t['balance_after']) for t in transactions],
+                         [('sale', '12.00', '112.00'), ('adjustment', '100.00', '100.00'), ('opening', '0.00', '0.00')])
+
+        self.assertEqual(self.client.get(f'{url}balance_at/', {'at': self.before_sale.isoformat()}).data['balance'],
+                         Decimal('100.00'))
+        self.assertEqual(self.client.get(f'{url}balance_at/').status_code, 400)
+
+        today = timezone.localdate()
+        statement = self.client.get(f'{url}statement/', {'from': today - timedelta(days=1), 'to': today}).data
+        self.assertEqual((statement['opening_balance'], statement['closing_balance']), (None, Decimal('112.00')))
+        self.assertEqual([day['has_movements'] for day in statement['days']], [False, True])
+        backwards = self.client.get(f'{url}statement/', {'from': today, 'to': today - timedelta(days=1)})
+        self.assertEqual(backwards.status_code, 400)
+
+
+class QueryTimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        Product.objects.create(business=self.user.business, name='Café', stock=5, sale_price=3)
+
+    def get_products(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/products/')
+        return response, len(queries)
+
+    def test_server_timing_reports_queries(self):
+        with self.assertNoLogs('api.performance'):
+            response, count = self.get_products()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'],
+                         rf'^db;dur=[\d.]+;desc="{count} consultas", app;dur=[\d.-]+, total;dur=[\d.]+$')
+
+    @override_settings(REQUEST_TIMING_MAX_QUERIES=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('api.performance', 'WARNING') as logs:
+            self.get_products()
+        self.assertIn('Petición lenta GET api/products/', logs.output[0])
+
+
+class FastPathTests(TestCase):
+    def test_renderers_match_the_serializers(self):
+        business = User.objects.create_user('negocio', 'negocio@example.com', 'clave').business
+        Product.objects.create(business=business, name='Café', category=None, description='Molido',
+                               stock=5, sale_price=Decimal('2.50'), purchase_price=1)
+        Product.objects.create(business=business, name='Pan', category='Alimentos', stock=0, sale_price=20,
+                               is_public=False)
+        request = Request(APIRequestFactory().get('/'))
+        for renderer, serializer_class, queryset in (
+            (product_renderer, ProductSerializer, Product.objects.order_by('id')),
+            (business_renderer, BusinessSerializer, Business.objects.order_by('id')),
+        ):
+            expected = serializer_class(queryset, many=True, context={'request': request}).data
+            self.assertEqual(renderer.render(queryset, request), [dict(row) for row in expected])
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media_root, IMAGE_VARIANTS_ASYNC=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('negocio', 'negocio@example.com', 'clave')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('foto.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_generates_resized_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/products/', {
+                'name': 'Café', 'sale_price': '2.00', 'stock': 1, 'image': self.upload(800, 400),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+
+        product = Product.objects.get()
+        variants = self.client.get(f'/api/products/{product.id}/').data['image_variants']
+        self.assertEqual(set(variants), {'thumb', 'medium', 'large'})
+        self.assertTrue(variants['thumb']['webp'].endswith('-thumb.webp'))
+        for size, name in product.image_variants['variants'].items():
+            with Image.open(product.image.storage.path(name['jpeg'])) as image:
+                # La variante grande no amplía una imagen más pequeña
+                self.assertEqual(image.size, {'thumb': (200, 100), 'medium': (600, 300), 'large': (800, 400)}[size])
@@ -3,6 +3,7 @@ from rest_framework.routers import DefaultRouter
 from .views import (
 CardViewSet,
     ExpenseViewSet,
+    FinancialSummaryViewSet,
     ContactViewSet,
     LicenseViewSet,
     LicenseRenewalViewSet,
@@ -36,6 +37,7 @@ router.register(r'sales', SaleViewSet)
 router.register(r'businesses', BusinessViewSet, basename='business')
 router.register(r'purchases', PurchaseViewSet)
 router.register(r'expenses', ExpenseViewSet)
+router.register(r'financial-summary', FinancialSummaryViewSet, basename='financial-summary')
 router.register(r'cards', CardViewSet)
 router.register(r'contacts', ContactViewSet)
 router.register(r'licenses', LicenseViewSet)
@@ -46,5 +48,7 @@ router.register(r'auth', AuthViewSet, basename='auth')
 
 urlpatterns = [
     path('', api_welcome),
+    path('track/<str:tracking_code>/', public_views.track_order, name='track-order'),
+    path('track/<str:tracking_code>/events/', public_views.track_order_events, name='track-order-events'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
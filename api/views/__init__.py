@@ -1,6 +1,7 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .financial_views import CardViewSet, ExpenseViewSet
+from .financial_views import ExpenseViewSet, FinancialSummaryViewSet
+from .card_views import CardViewSet
 from .user_views import UserViewSet
 from .auth_views import AuthViewSet
 from .license_views import LicenseViewSet, LicenseRenewalViewSet
@@ -36,6 +37,7 @@ __all__ = [
     'PurchaseViewSet',
     'CardViewSet',
     'ExpenseViewSet',
+    'FinancialSummaryViewSet',
     'ContactViewSet',
     'LicenseViewSet',
     'LicenseRenewalViewSet',
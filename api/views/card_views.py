@@ -1,11 +1,18 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from ..models import Card
-from ..serializers import CardSerializer
+from ..serializers import CardSerializer, CardTransactionSerializer
 from ..mixins import BusinessFilterMixin
+from ..ledger import balance_at, card_statement
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import ValidationError
 
+# Máximo de días por extracto
+MAX_STATEMENT_DAYS = 366
+
 class CardViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
     serializer_class = CardSerializer
     queryset = Card.objects.none()
@@ -43,3 +50,50 @@ class CardViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response(serializer.data)
+
+    def _parse_param(self, name, parser, required=False):
+        value = self.request.query_params.get(name)
+        if not value:
+            if required:
+                raise ValidationError({name: 'Este parámetro es requerido'})
+            return None
+        parsed = parser(value)
+        if parsed is None:
+            raise ValidationError({name: 'Fecha inválida, use el formato ISO 8601'})
+        return parsed
+
+    @action(detail=True, methods=['get'])
+    def transactions(self, request, pk=None):
+        """Movimientos de la tarjeta, opcionalmente entre las fechas from y to"""
+        card = self.get_object()
+        transactions = card.transactions.order_by('-created_at', '-id')
+        start = self._parse_param('from', parse_date)
+        end = self._parse_param('to', parse_date)
+        if start:
+            transactions = transactions.filter(created_at__date__gte=start)
+        if end:
+            transactions = transactions.filter(created_at__date__lte=end)
+        serializer = CardTransactionSerializer(transactions, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Saldo de cierre diario entre las fechas from y to (por defecto los últimos 30 días)"""
+        card = self.get_object()
+        end = self._parse_param('to', parse_date) or timezone.localdate()
+        start = self._parse_param('from', parse_date) or end - timezone.timedelta(days=29)
+        if start > end or (end - start).days >= MAX_STATEMENT_DAYS:
+            raise ValidationError(
+                {'from': f'El rango debe ser de 1 a {MAX_STATEMENT_DAYS} días'}
+            )
+        statement = card_statement(card.id, start, end)
+        return Response({'card': card.id, 'from': start, 'to': end, **statement})
+
+    @action(detail=True, methods=['get'])
+    def balance_at(self, request, pk=None):
+        """Saldo de la tarjeta en la fecha y hora indicada en el parámetro at"""
+        card = self.get_object()
+        at = self._parse_param('at', parse_datetime, required=True)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        return Response({'card': card.id, 'at': at, 'balance': balance_at(card.id, at)})
@@ -2,10 +2,12 @@ from rest_framework import viewsets
 from ..models import Contact
 from ..serializers import ContactSerializer
 from ..mixins import BusinessFilterMixin
+from ..pagination import CreatedAtCursorPagination
 
 class ContactViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
     serializer_class = ContactSerializer
     queryset = Contact.objects.none()
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         return Contact.objects.filter(business=self.request.user.business)
\ No newline at end of file
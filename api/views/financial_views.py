@@ -1,32 +1,32 @@
+from decimal import Decimal
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
-from ..models import Card, Expense
-from ..serializers import CardSerializer, ExpenseSerializer
-from ..mixins import BusinessFilterMixin
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncYear
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from ..models import Card, Expense, DailyRollup
+from ..serializers import ExpenseSerializer
+from ..mixins import BusinessFilterMixin, RollupMixin
+from ..pagination import CreatedAtCursorPagination
+from ..ledger import adjust_balance
+from ..rollups import bump_rollups, expense_entries
 
-class CardViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
-    serializer_class = CardSerializer
-    queryset = Card.objects.none()
-
-    def get_queryset(self):
-        return Card.objects.filter(business__user=self.request.user)
-
-class ExpenseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
+class ExpenseViewSet(RollupMixin, BusinessFilterMixin, viewsets.ModelViewSet):
     serializer_class = ExpenseSerializer
     queryset = Expense.objects.none()
+    pagination_class = CreatedAtCursorPagination
+    rollup_entries = expense_entries
 
     def get_queryset(self):
         return Expense.objects.filter(business__user=self.request.user)
 
     def perform_create(self, serializer):
-        with transaction.atomic():
-            expense = serializer.save()
-            if hasattr(expense, 'card') and expense.card:
-                card = expense.card
-                card.balance -= expense.amount
-                card.save()
+        # El serializer ya debita la tarjeta asociada
+        serializer.save()
 
     @action(detail=True, methods=['post'])
     def undo_expense(self, request, pk=None):
@@ -39,11 +39,12 @@ class ExpenseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                     raise ValueError("Debe seleccionar una tarjeta para la devolución")
                 
                 try:
-                    card = Card.objects.select_for_update().get(id=card_id)
-                    previous_balance = card.balance
-                    card.balance += expense.amount
-                    card.save()
-                    print(f"Card {card.id} balance updated: {previous_balance} -> {card.balance}")
+                    card_id = int(card_id)
+                except (TypeError, ValueError):
+                    raise ValueError("La tarjeta seleccionada no existe")
+
+                try:
+                    new_balance = adjust_balance(card_id, expense.amount, 'undo_expense', expense.id)
                 except Card.DoesNotExist:
                     raise ValueError("La tarjeta seleccionada no existe")
                 except Exception as e:
@@ -52,11 +53,12 @@ class ExpenseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                 response_data = {
                     'message': 'Gasto deshecho exitosamente',
                     'amount': float(expense.amount),
-                    'card_id': card.id,
-                    'previous_balance': float(previous_balance),
-                    'new_balance': float(card.balance)
+                    'card_id': card_id,
+                    'previous_balance': float(new_balance - expense.amount),
+                    'new_balance': float(new_balance)
                 }
 
+                bump_rollups(expense_entries(expense, sign=-1))
                 expense.delete()
                 return Response(response_data, status=status.HTTP_200_OK)
 
@@ -65,4 +67,72 @@ class ExpenseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
-            )
\ No newline at end of file
+            )
+
+
+class FinancialSummaryViewSet(viewsets.ViewSet):
+    """
+    Resumen financiero del negocio leído de los totales diarios.
+
+    Parámetros: from y to (YYYY-MM-DD, por defecto el mes en curso) y
+    group (day, month o year; por defecto day).
+    """
+    permission_classes = [IsAuthenticated]
+    truncators = {'day': None, 'month': TruncMonth, 'year': TruncYear}
+
+    def list(self, request):
+        group = request.query_params.get('group', 'day')
+        if group not in self.truncators:
+            return Response(
+                {'group': 'Debe ser day, month o year'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        today = timezone.localdate()
+        start = request.query_params.get('from')
+        end = request.query_params.get('to')
+        start = parse_date(start) if start else today.replace(day=1)
+        end = parse_date(end) if end else today
+        if start is None or end is None:
+            return Response(
+                {'detail': 'Fecha inválida, use el formato YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rollups = DailyRollup.objects.filter(
+            business__user=request.user, day__gte=start, day__lte=end
+        )
+        truncator = self.truncators[group]
+        rollups = rollups.annotate(period=truncator('day') if truncator else F('day'))
+        rows = rollups.values('period', 'category').annotate(
+            total=Sum('amount'), transactions=Sum('count')
+        ).order_by('period')
+
+        periods = {}
+        for row in rows:
+            period = periods.setdefault(row['period'], {
+                'period': row['period'],
+                **{category: Decimal('0') for category, _ in DailyRollup.CATEGORY_CHOICES},
+                'sales_count': 0,
+            })
+            period[row['category']] = row['total']
+            if row['category'] == 'revenue':
+                period['sales_count'] = row['transactions']
+
+        results = []
+        for period in periods.values():
+            period['gross_profit'] = period['revenue'] - period['cost_of_goods']
+            period['net_profit'] = period['gross_profit'] - period['expenses']
+            results.append(period)
+
+        totals = {
+            key: sum((period[key] for period in results), Decimal('0'))
+            for key in ('revenue', 'cost_of_goods', 'purchases', 'expenses', 'gross_profit', 'net_profit')
+        }
+        return Response({
+            'from': start,
+            'to': end,
+            'group': group,
+            'totals': totals,
+            'results': results
+        })
@@ -1,17 +1,34 @@
-from django.core.mail import send_mail
-from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from ..models import Order, Business, OrderItem, Product
-from ..serializers import OrderSerializer
+from ..models import Order, Business, OrderItem, OrderStatusNote, Product
+from ..serializers import OrderSerializer, OrderHeaderSerializer, OrderItemSerializer, OrderStatusEventSerializer
+from ..pagination import CreatedAtCursorPagination
+from ..outbox import queue_email
+from ..reservations import reserve_stock, reservation_expiry, apply_status, release_reservation
+from ..order_history import record_status, status_durations
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columnas del tablero que se muestran completas; las cerradas se paginan aparte
+BOARD_ACTIVE_STATUSES = ['pending', 'confirmed', 'preparing', 'ready', 'in_delivery']
+BOARD_CLOSED_STATUSES = ['delivered', 'cancelled']
+BOARD_DEFAULT_LIMIT = 20
+BOARD_MAX_LIMIT = 100
 
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
 
     def get_permissions(self):
         if self.action == 'create':
@@ -21,14 +38,10 @@ class OrderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Order.objects.filter(
             business__owner=self.request.user
-        ).order_by('-created_at')
+        ).select_related('business').prefetch_related('items__product').order_by('-created_at')
 
     def create(self, request, *args, **kwargs):
         business_id = request.data.get('business')
-        
-        # Debug logs
-        print(f"Business ID recibido: {business_id}")
-        print(f"Datos completos recibidos: {request.data}")
 
         if not business_id:
             return Response(
@@ -37,155 +50,264 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            business = Business.objects.get(id=business_id)
-            print(f"Negocio encontrado: {business.name}")
-        except Business.DoesNotExist:
+            business = Business.objects.select_related('user').get(id=business_id)
+        except (Business.DoesNotExist, ValueError):
             return Response(
                 {'business': ['Negocio no encontrado']}, 
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # Usar transacción para asegurar la integridad de los datos
-        with transaction.atomic():
-            try:
-                # Crear la orden primero
-                order_data = request.data.copy()
-                items_data = order_data.pop('items', [])
-                
+        header = OrderHeaderSerializer(data=request.data)
+        if not header.is_valid():
+            return Response(header.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        items_data = request.data.get('items') or []
+        lines, errors = self._parse_items(business, items_data)
+        if errors:
+            return Response({'items': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            # Usar transacción para asegurar la integridad de los datos
+            with transaction.atomic():
+                # Las unidades se apartan antes de crear el pedido: si alguna no
+                # alcanza no se guarda nada
+                stock_errors = reserve_stock(business.id, lines)
+                if stock_errors:
+                    return Response({'items': stock_errors}, status=status.HTTP_400_BAD_REQUEST)
+
+                # El total se calcula antes para guardarlo en el mismo INSERT
                 order = Order.objects.create(
                     business=business,
-                    customer_name=order_data.get('customer_name'),
-                    customer_phone=order_data.get('customer_phone'),
-                    delivery_type=order_data.get('delivery_type'),
-                    delivery_address=order_data.get('delivery_address'),
-                    delivery_municipality=order_data.get('delivery_municipality'),
-                    delivery_notes=order_data.get('delivery_notes'),
-                    pickup_time=order_data.get('pickup_time'),
+                    **header.validated_data,
+                    total_amount=sum((line.subtotal for line in lines), Decimal('0')),
+                    reservation='active',
+                    reservation_expires_at=reservation_expiry(),
                 )
+                for line in lines:
+                    line.order = order
+                items = OrderItem.objects.bulk_create(lines)
+                record_status(order, at=order.created_at)
+                # El aviso se encola en la misma transacción que el pedido
+                self._notify_new_order(business, order, items)
+        except ValidationError as e:
+            return Response({'items': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception('Error al crear la orden del negocio %s', business.id)
+            return Response({
+                'error': f'Error al crear la orden: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Los items ya están en memoria: se serializan aparte para no volver a consultarlos
+        serializer = self.get_serializer(order)
+        serializer.fields.pop('items')
+        order_data = {**serializer.data, 'items': OrderItemSerializer(items, many=True).data}
+        return Response({
+            'tracking_code': order.tracking_code,
+            'message': 'Orden creada exitosamente',
+            'order': order_data
+        }, status=status.HTTP_201_CREATED)
+
+    def _parse_items(self, business, items_data):
+        """
+        Valida los items del pedido y los devuelve como ``OrderItem`` sin
+        guardar. Carga todos los productos del negocio con una sola consulta.
+        """
+        if not isinstance(items_data, list) or not items_data:
+            return [], ['El pedido debe incluir al menos un producto']
+
+        product_ids = set()
+        for item_data in items_data:
+            try:
+                product_ids.add(int(item_data['product']))
+            except (KeyError, TypeError, ValueError):
+                pass
+        products = Product.objects.filter(business=business).in_bulk(product_ids)
+
+        lines, errors = [], []
+        for index, item_data in enumerate(items_data):
+            try:
+                product = products.get(int(item_data['product']))
+                quantity = int(item_data['quantity'])
+                unit_price = Decimal(str(item_data['unit_price']))
+            except (KeyError, TypeError, ValueError, ArithmeticError):
+                errors.append({'index': index, 'error': 'Item inválido: se requieren product, quantity y unit_price'})
+                continue
+            if product is None:
+                errors.append({'index': index, 'error': 'Producto no encontrado en este negocio'})
+            elif quantity <= 0 or unit_price < 0:
+                errors.append({'index': index, 'error': 'Cantidad o precio inválido'})
+            else:
+                unit_price = unit_price.quantize(Decimal('0.01'))
+                lines.append(OrderItem(
+                    product=product, quantity=quantity, unit_price=unit_price, subtotal=quantity * unit_price
+                ))
+        return lines, errors
+
+    def _notify_new_order(self, business, order, items):
+        items_text = "\n".join([
+            f"- {item.quantity}x {item.product.name} (${item.unit_price})"
+            for item in items
+        ])
+
+        delivery_info = (
+            f"Dirección: {order.delivery_address}\n"
+            f"Municipio: {order.delivery_municipality}"
+            if order.delivery_type == 'delivery'
+            else f"Hora de recogida: {order.pickup_time}"
+        )
+
+        subject = f'Nuevo pedido pendiente - {order.tracking_code}'
+        message = f'''
+        ¡Nuevo Pedido en {business.name}!
+
+        Código de seguimiento: {order.tracking_code}
+
+        Información del cliente:
+        - Nombre: {order.customer_name}
+        - Teléfono: {order.customer_phone}
+        - Tipo de entrega: {'Entrega a domicilio' if order.delivery_type == 'delivery' else 'Recoger en tienda'}
+        {delivery_info}
+
+        Productos:
+        {items_text}
+
+        Total: ${order.total_amount}
 
-                # Crear los items de la orden
-                total_amount = 0
-                for item_data in items_data:
-                    product = Product.objects.get(id=item_data['product'])
-                    quantity = item_data['quantity']
-                    unit_price = float(item_data['unit_price'])
-                    
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=quantity,
-                        unit_price=unit_price
-                    )
-                    total_amount += quantity * unit_price
-
-                # Actualizar el total de la orden
-                order.total_amount = total_amount
-                order.save()
-
-                # Enviar email
-                try:
-                    items_text = "\n".join([
-                        f"- {item.quantity}x {item.product.name} (${item.unit_price})"
-                        for item in order.items.all()
-                    ])
-
-                    delivery_info = (
-                        f"Dirección: {order.delivery_address}\n"
-                        f"Municipio: {order.delivery_municipality}"
-                        if order.delivery_type == 'delivery'
-                        else f"Hora de recogida: {order.pickup_time}"
-                    )
-
-                    subject = f'Nuevo pedido pendiente - {order.tracking_code}'
-                    message = f'''
-                    ¡Nuevo Pedido en {business.name}!
-
-                    Código de seguimiento: {order.tracking_code}
-
-                    Información del cliente:
-                    - Nombre: {order.customer_name}
-                    - Teléfono: {order.customer_phone}
-                    - Tipo de entrega: {'Entrega a domicilio' if order.delivery_type == 'delivery' else 'Recoger en tienda'}
-                    {delivery_info}
-
-                    Productos:
-                    {items_text}
-
-                    Total: ${order.total_amount}
-
-                    Por favor, revisa y procesa este pedido lo antes posible.
-                    '''
-
-                    send_mail(
-                        subject=subject,
-                        message=message,
-                        from_email=settings.DEFAULT_FROM_EMAIL,
-                        recipient_list=[business.user.email],
-                        fail_silently=False,
-                    )
-
-                except Exception as e:
-                    print(f"Error al enviar el email: {str(e)}")
-                    # Continuamos aunque falle el email
-
-                # Serializar la respuesta
-                serializer = self.get_serializer(order)
-                return Response({
-                    'tracking_code': order.tracking_code,
-                    'message': 'Orden creada exitosamente',
-                    'order': serializer.data
-                }, status=status.HTTP_201_CREATED)
-
-            except Exception as e:
-                print(f"Error al crear la orden: {str(e)}")
-                return Response({
-                    'error': f'Error al crear la orden: {str(e)}'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        Por favor, revisa y procesa este pedido lo antes posible.
+        '''
+
+        queue_email(subject, message, [business.user.email])
 
     @action(detail=True, methods=['patch'])
     def status(self, request, pk=None):
         order = self.get_object()
         new_status = request.data.get('status')
         notes = request.data.get('notes')
+        previous_status = order.status
 
         if new_status:
+            if new_status not in dict(Order.STATUS_CHOICES):
+                return Response(
+                    {'status': [f'Estado no válido: {new_status}']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             order.status = new_status
-            
-        if notes:
-            # Agregar timestamp a las notas
-            timestamp = timezone.now().strftime("%d/%m/%Y %H:%M")
-            status_text = order.get_status_display()
-            new_note = f"[{timestamp} - {status_text}] {notes}"
-            
-            if order.status_notes:
-                order.status_notes = f"{new_note}\n\n{order.status_notes}"
-            else:
-                order.status_notes = new_note
 
-        order.save()
+        subject = f'Actualización de pedido - {order.tracking_code}'
+        message = f'''
+        Actualización de tu pedido en {order.business.name}
 
-        # Notificar por email del cambio de estado
-        try:
-            subject = f'Actualización de pedido - {order.tracking_code}'
-            message = f'''
-            Actualización de tu pedido en {order.business.name}
-
-            Estado: {order.get_status_display()}
-            
-            Notas: {notes if notes else 'No se agregaron notas'}
-
-            Código de seguimiento: {order.tracking_code}
-            '''
-
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[order.business.user.email],
-                fail_silently=True,
-            )
-        except Exception as e:
-            print(f"Error al enviar email: {str(e)}")
+        Estado: {order.get_status_display()}
+        
+        Notas: {notes if notes else 'No se agregaron notas'}
+
+        Código de seguimiento: {order.tracking_code}
+        '''
+
+        # La reserva, el estado, el historial y el aviso se guardan juntos. Los
+        # campos de la reserva no se incluyen: los actualiza apply_status
+        with transaction.atomic():
+            if new_status:
+                apply_status(order, new_status)
+            order.save(update_fields=['status', 'updated_at'])
+            # Las notas van al historial en lugar de acumularse en status_notes
+            record_status(order, previous_status, notes)
+            queue_email(subject, message, [order.business.user.email])
 
         serializer = self.get_serializer(order)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def board(self, request):
+        """
+        Tablero de pedidos: cantidad por estado y los ``limit`` más recientes
+        de cada estado activo, con un número fijo de consultas. Los entregados
+        y cancelados se consultan paginados en ``board/<estado>/``.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', BOARD_DEFAULT_LIMIT)), 1), BOARD_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': 'Debe ser un número entero'})
+
+        orders = self.get_queryset()
+        counts = orders.order_by().aggregate(**{
+            code: Count('id', filter=Q(status=code)) for code, _ in Order.STATUS_CHOICES
+        })
+        # Los más recientes de cada estado en una sola consulta
+        newest = orders.filter(status__in=BOARD_ACTIVE_STATUSES).annotate(
+            position=Window(RowNumber(), partition_by=F('status'), order_by=[F('created_at').desc(), F('id').desc()])
+        ).filter(position__lte=limit)
+
+        columns = {code: [] for code in BOARD_ACTIVE_STATUSES}
+        for order in self.get_serializer(newest, many=True).data:
+            columns[order['status']].append(order)
+
+        labels = dict(Order.STATUS_CHOICES)
+        return Response({
+            'counts': counts,
+            'columns': [
+                {'status': code, 'status_display': labels[code], 'count': counts[code], 'orders': columns[code]}
+                for code in BOARD_ACTIVE_STATUSES
+            ],
+            'closed': [
+                {'status': code, 'status_display': labels[code], 'count': counts[code]}
+                for code in BOARD_CLOSED_STATUSES
+            ],
+        })
+
+    @action(detail=False, methods=['get'], url_path=r'board/(?P<board_status>delivered|cancelled)')
+    def board_closed(self, request, board_status=None):
+        """Pedidos entregados o cancelados del tablero, paginados por cursor"""
+        page = self.paginate_queryset(self.get_queryset().filter(status=board_status))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """Estados por los que pasó el pedido, con su nota y duración"""
+        order = self.get_object()
+        events = order.status_events.prefetch_related(
+            Prefetch('notes', queryset=OrderStatusNote.objects.order_by('created_at', 'id'))
+        ).order_by('entered_at', 'id')
+        return Response(OrderStatusEventSerializer(events, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='status-durations')
+    def durations(self, request):
+        """Tiempo medio en cada estado de los pedidos del negocio, opcionalmente entre from y to"""
+        start = self._parse_datetime_param('from')
+        end = self._parse_datetime_param('to')
+        return Response(status_durations(request.user.business, start, end))
+
+    def _parse_datetime_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValidationError({name: 'Fecha inválida, use el formato ISO 8601'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def perform_update(self, serializer):
+        # Un cambio de estado por PUT/PATCH ajusta la reserva igual que la acción status
+        new_status = serializer.validated_data.get('status')
+        previous_status = serializer.instance.status
+        with transaction.atomic():
+            # serializer.save() guarda todas las columnas: se bloquea el pedido y se
+            # releen los campos de la reserva para no pisar lo que haya hecho
+            # release_expired entre get_object y el guardado
+            current = Order.objects.select_for_update().values(
+                'reservation', 'reservation_expires_at'
+            ).get(pk=serializer.instance.pk)
+            serializer.instance.reservation = current['reservation']
+            serializer.instance.reservation_expires_at = current['reservation_expires_at']
+            if new_status and new_status != previous_status:
+                apply_status(serializer.instance, new_status)
+            order = serializer.save()
+            record_status(order, previous_status)
+
+    def perform_destroy(self, instance):
+        # Un pedido borrado deja de apartar stock
+        with transaction.atomic():
+            release_reservation(instance)
+            instance.delete()
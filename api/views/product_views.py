@@ -1,13 +1,58 @@
-from rest_framework import viewsets
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from ..models import Product
-from ..serializers import ProductSerializer
+from ..serializers import ProductSerializer, StockMovementSerializer
 from ..licencePersmission import HasValidLicenseForReadOnly
 from ..mixins import BusinessFilterMixin
+from ..ledger import stock_at
 
 class ProductViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, HasValidLicenseForReadOnly]
     queryset = Product.objects.all()
 
+    def _parse_datetime_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValidationError({name: 'Fecha inválida, use el formato ISO 8601'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    @action(detail=True, methods=['get'])
+    def movements(self, request, pk=None):
+        """Historial de movimientos de stock del producto, opcionalmente entre from y to"""
+        product = self.get_object()
+        movements = product.stock_movements.order_by('-created_at', '-id')
+        start = self._parse_datetime_param('from')
+        end = self._parse_datetime_param('to')
+        if start:
+            movements = movements.filter(created_at__gte=start)
+        if end:
+            movements = movements.filter(created_at__lte=end)
+        serializer = StockMovementSerializer(movements, many=True)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def stock_at(self, request, pk=None):
+        """Stock del producto en la fecha indicada en el parámetro at"""
+        product = self.get_object()
+        at = self._parse_datetime_param('at')
+        if at is None:
+            return Response(
+                {'at': 'Se requiere la fecha'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({
+            'product': product.id,
+            'at': at,
+            'stock': stock_at(product.id, at)
+        })
@@ -1,39 +1,70 @@
+import asyncio
+import json
+
 from rest_framework import viewsets, status, serializers, permissions
 from rest_framework.decorators import action, permission_classes, api_view
 from rest_framework.response import Response
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET
 from django.utils import timezone
-from ..models import Product, Business, Order
-from ..serializers import ProductSerializer, BusinessSerializer
+from ..models import Product, Business, BusinessSettings, Order
+from ..serializers import (
+    ProductSerializer, BusinessSerializer, PublicProductWithBusinessSerializer, BusinessSettingsSerializer
+)
+from ..cache import (
+    VersionedCacheMixin, business_namespace, cache_is_shared, not_modified, order_version,
+    order_version_key
+)
+from ..pagination import SearchResultsPagination, StorefrontPagination
+from ..search import search_products
+from ..facets import facet_filters, facet_counts
+from ..fastpath import ValuesRenderer, ValuesReadMixin, image_url
+from ..hours import filter_open_now, open_status
+from ..directory import location_directory
+from ..events import broker, order_event, FINAL_STATUSES
+
+# Columnas compiladas una vez por proceso para los listados públicos
+public_product_renderer = ValuesRenderer(
+    PublicProductWithBusinessSerializer, method_fields={'image_url': image_url(Product)}
+)
+product_renderer = ValuesRenderer(ProductSerializer)
+business_renderer = ValuesRenderer(BusinessSerializer)
+settings_renderer = ValuesRenderer(BusinessSettingsSerializer)
 
 
-class PublicProductViewSet(viewsets.ReadOnlyModelViewSet):
-    serializer_class = ProductSerializer
+class PublicProductViewSet(VersionedCacheMixin, ValuesReadMixin, viewsets.ReadOnlyModelViewSet):
+    serializer_class = PublicProductWithBusinessSerializer
+    renderer = public_product_renderer
     permission_classes = [permissions.AllowAny]
+    cache_namespace = 'products'
 
     def get_queryset(self):
-        return Product.objects.filter(
+        queryset = Product.objects.filter(
             Q(is_public=True) &  # Producto público
             Q(business__is_public=True) &  # Negocio público
             Q(business__user__license__expiration_date__gt=timezone.now()) &  # Licencia válida
             ~Q(business__isnull=True)  # Asegurarse de que el negocio existe
         ).select_related('business', 'business__user')
 
-    def get_serializer_class(self):
-        class PublicProductWithBusinessSerializer(ProductSerializer):
-            business_id = serializers.IntegerField(source='business.id', read_only=True)
-            business_name = serializers.CharField(source='business.name', read_only=True)
-            image_url = serializers.SerializerMethodField()
-            
-            def get_image_url(self, obj):
-                if obj.image:
-                    return obj.image.url if hasattr(obj.image, 'url') else None
-                return None
-            
-            class Meta(ProductSerializer.Meta):
-                fields = ProductSerializer.Meta.fields + ['business_id', 'business_name', 'image_url']
-        
-        return PublicProductWithBusinessSerializer
+        if self.action == 'list':
+            queryset = queryset.filter(facet_filters(self.request.query_params))
+        search = self.request.query_params.get('search', '').strip()
+        if search and self.action == 'list':
+            queryset = search_products(queryset, search)
+        return queryset
+
+    @property
+    def paginator(self):
+        # Solo las búsquedas se paginan; el listado completo conserva su formato
+        if not hasattr(self, '_paginator'):
+            search = self.request.query_params.get('search', '').strip()
+            self._paginator = SearchResultsPagination() if search and self.action == 'list' else None
+        return self._paginator
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -44,79 +75,213 @@ class PublicProductViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def categories(self, request):
         """Obtener todas las categorías disponibles"""
-        categories = Product.objects.filter(
-            is_public=True,
-            business__user__license__expiration_date__gt=timezone.now()
-        ).values_list('category', flat=True).distinct()
-        return Response(list(categories))
+        def render():
+            return Response([item['value'] for item in facet_counts()['category']])
+        return self.cached_response(request, render)
 
-class PublicBusinessViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Cantidad de productos por categoría, rango de precio, provincia y municipio"""
+        return self.cached_response(request, lambda: Response(facet_counts(request.query_params)))
+
+class PublicBusinessViewSet(VersionedCacheMixin, ValuesReadMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = BusinessSerializer
+    renderer = business_renderer
     permission_classes = [permissions.AllowAny]
+    cache_namespace = 'businesses'
+    # El estado abierto/cerrado cambia con la hora
+    cache_timeout = 60
 
     def get_queryset(self):
-        return Business.objects.filter(is_public=True)
+        queryset = Business.objects.filter(is_public=True)
+        open_now = self.request.query_params.get('open_now', '').lower()
+        if self.action == 'list' and open_now in ('true', '1', 'false', '0'):
+            queryset = filter_open_now(queryset, open_now in ('true', '1'))
+        return queryset
+
+    def extend_rows(self, rows):
+        """Añade ``is_open_now`` y ``opens_next_at`` según el horario compilado"""
+        status = open_status([row['id'] for row in rows])
+        for row in rows:
+            row['is_open_now'] = status[row['id']]['is_open_now']
+            opens_next_at = status[row['id']]['opens_next_at']
+            row['opens_next_at'] = opens_next_at.isoformat() if opens_next_at else None
+        return rows
 
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
         """Obtener todos los productos públicos de un negocio específico"""
-        business = self.get_object()
-        products = Product.objects.filter(
-            business=business,
-            is_public=True,
-            business__is_public=True
-        )
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        def render():
+            business = self.get_object()
+            products = Product.objects.filter(
+                business=business,
+                is_public=True,
+                business__is_public=True
+            )
+            return Response(product_renderer.render(products))
+        return self.cached_response(request, render, namespace='products')
+
+    @action(detail=True, methods=['get'])
+    def storefront(self, request, pk=None):
+        """
+        Negocio, configuración pública y una página de sus productos en una
+        sola respuesta (``page`` y ``page_size`` paginan los productos).
+        """
+        # El pk se usa en las consultas y en el espacio de la caché
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+
+        def render():
+            business = self.extend_rows(business_renderer.render(self.get_queryset().filter(pk=pk), request))
+            if not business:
+                raise Http404
+            settings = settings_renderer.render(BusinessSettings.objects.filter(business_id=pk), request)
+
+            products = public_product_renderer.values(
+                Product.objects.filter(business_id=pk, is_public=True).order_by('name', 'id')
+            )
+            paginator = StorefrontPagination()
+            page = paginator.paginate_queryset(products, request, view=self)
+            return Response({
+                'business': business[0],
+                'settings': settings[0] if settings else None,
+                'products': paginator.get_paginated_response(
+                    public_product_renderer.rows(page, request)
+                ).data,
+            })
+        return self.cached_response(request, render, namespace=business_namespace(pk))
 
     @action(detail=False, methods=['get'])
     def types(self, request):
-        """Obtener todos los tipos de negocios disponibles"""
-        business_types = Business.objects.filter(
-            is_public=True,
-            user__license__expiration_date__gt=timezone.now()
-        ).values_list('business_type', flat=True).distinct()
-        return Response(list(business_types))
+        """Obtener los tipos de productos que ofrecen los negocios"""
+        # Business no tiene un campo de tipo: se usan las categorías del catálogo
+        def render():
+            return Response([item['value'] for item in facet_counts()['category']])
+        return self.cached_response(request, render, namespace='products')
 
     @action(detail=False, methods=['get'])
     def locations(self, request):
-        """Obtener todas las ubicaciones disponibles"""
-        locations = Business.objects.filter(
-            is_public=True,
-            user__license__expiration_date__gt=timezone.now()
-        ).values_list('location', flat=True).distinct()
-        return Response(list(locations))
+        """Provincias y municipios con la cantidad de negocios activos en cada uno"""
+        return self.cached_response(request, lambda: Response(location_directory()), namespace='locations')
+
+def _track_order_payload(order):
+    return {
+        'tracking_code': order.tracking_code,
+        'status': order.get_status_display(),
+        'status_code': order.status,
+        'customer_name': order.customer_name,
+        'business_name': order.business.name,
+        'created_at': order.created_at,
+        'delivery_type': order.get_delivery_type_display(),
+        'delivery_address': order.delivery_address,
+        'delivery_municipality': order.delivery_municipality,
+        'delivery_notes': order.delivery_notes,
+        'pickup_time': order.pickup_time,
+        'total_amount': str(order.total_amount),
+        'items': [{
+            'name': item.product.name,
+            'quantity': item.quantity,
+            'unit_price': str(item.unit_price),
+            'subtotal': str(item.subtotal)
+        } for item in order.items.all()]
+    }
+
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def track_order(request, tracking_code):
-    try:
-        order = Order.objects.select_related('business').prefetch_related('items__product').get(
+    """
+    Estado del pedido. Con una caché compartida la respuesta se guarda bajo
+    la versión del pedido (su ``updated_at``), que cada guardado de ``Order``
+    renueva: un pedido sin cambios no vuelve a leerse y las peticiones
+    condicionales reciben 304.
+    """
+    shared = cache_is_shared()
+    version_key = order_version_key(tracking_code)
+    # Con una caché local por proceso los demás no verían la invalidación
+    version = cache.get(version_key) if shared else None
+    data = cache.get(f'track-order:{tracking_code}:{version}') if version is not None else None
+
+    if data is None:
+        order = Order.objects.select_related('business').prefetch_related('items__product').filter(
             tracking_code=tracking_code
+        ).first()
+        if order is None:
+            return Response(
+                {'error': 'Código de seguimiento no válido'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        data = _track_order_payload(order)
+        if not shared:
+            return Response(data, headers={'Cache-Control': 'no-cache'})
+
+        timeout = getattr(settings, 'TRACK_ORDER_CACHE_TIMEOUT', 300)
+        version = order_version(order)
+        # add() no pisa una versión más nueva guardada mientras se leía el pedido
+        if not cache.add(version_key, version, timeout=timeout):
+            cached_version = cache.get(version_key)
+            if cached_version is not None and cached_version != version:
+                return Response(data, headers={'Cache-Control': 'no-cache'})
+        cache.set(f'track-order:{tracking_code}:{version}', data, timeout=timeout)
+
+    etag = quote_etag(f'{tracking_code}-{version}')
+    last_modified = version // 1_000_000
+    headers = {'ETag': etag, 'Last-Modified': http_date(last_modified), 'Cache-Control': 'no-cache'}
+    if not_modified(request, etag, last_modified):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(data, headers=headers)
+
+
+# Cada cuántos segundos se envía un comentario para que proxies y navegadores
+# no den por muerta una conexión sin cambios
+EVENTS_KEEPALIVE = 20
+
+
+def _sse(payload):
+    return f"event: status\ndata: {json.dumps(payload)}\n\n"
+
+
+@require_GET
+async def track_order_events(request, tracking_code):
+    """
+    Estado del pedido en vivo (``text/event-stream``): un evento ``status``
+    al conectar y otro por cada cambio, hasta que el pedido se entrega o se
+    cancela. Cada conexión abierta no consulta la base de datos.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI la conexión ocuparía un worker entero; se sigue consultando track_order
+        return JsonResponse(
+            {'error': 'El seguimiento en vivo requiere el servidor ASGI'}, status=501
         )
-        
-        return Response({
-            'tracking_code': order.tracking_code,
-            'status': order.get_status_display(),
-            'status_code': order.status,
-            'customer_name': order.customer_name,
-            'business_name': order.business.name,
-            'created_at': order.created_at,
-            'delivery_type': order.get_delivery_type_display(),
-            'delivery_address': order.delivery_address,
-            'delivery_municipality': order.delivery_municipality,
-            'delivery_notes': order.delivery_notes,
-            'pickup_time': order.pickup_time,
-            'total_amount': str(order.total_amount),
-            'items': [{
-                'name': item.product.name,
-                'quantity': item.quantity,
-                'unit_price': str(item.unit_price),
-                'subtotal': str(item.subtotal)
-            } for item in order.items.all()]
-        })
-    except Order.DoesNotExist:
-        return Response(
-            {'error': 'Código de seguimiento no válido'}, 
-            status=status.HTTP_404_NOT_FOUND
-        )
\ No newline at end of file
+
+    # Suscribirse antes de leer el estado para no perder un cambio entre medias
+    subscriber = broker.subscribe(tracking_code)
+    order = await Order.objects.filter(tracking_code=tracking_code).only(
+        'tracking_code', 'status', 'updated_at'
+    ).afirst()
+    if order is None:
+        broker.unsubscribe(tracking_code, subscriber)
+        return JsonResponse({'error': 'Código de seguimiento no válido'}, status=404)
+
+    async def stream():
+        _, queue = subscriber
+        try:
+            payload = order_event(order)
+            yield _sse(payload)
+            while payload['status_code'] not in FINAL_STATUSES:
+                try:
+                    payload = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _sse(payload)
+        finally:
+            broker.unsubscribe(tracking_code, subscriber)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Evita que nginx acumule los eventos antes de enviarlos
+    response['X-Accel-Buffering'] = 'no'
+    return response
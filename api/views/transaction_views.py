@@ -1,16 +1,45 @@
+import json
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.conf import settings
 from django.db import transaction
+from django.http import StreamingHttpResponse
 from ..models import Sale, Purchase, Product, Card
 from ..serializers import SaleSerializer, PurchaseSerializer
-from ..mixins import BusinessFilterMixin
+from ..mixins import BusinessFilterMixin, RollupMixin
+from ..pagination import CreatedAtCursorPagination
+from ..bulk import bulk_register_sales, bulk_register_purchases
+from ..ledger import adjust_stock, adjust_balance
+from ..rollups import bump_rollups, sale_entries, purchase_entries
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 
-class SaleViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
+
+def batch_response(results, errors):
+    response_data = {
+        'success_count': len(results),
+        'error_count': len(errors),
+        'results': results,
+        'errors': errors
+    }
+
+    # Si hay errores pero también hay éxitos, retornamos 207 Multi-Status
+    if errors and results:
+        return Response(response_data, status=status.HTTP_207_MULTI_STATUS)
+    # Si todo fue exitoso
+    elif results and not errors:
+        return Response(response_data, status=status.HTTP_201_CREATED)
+    # Si todo falló
+    else:
+        return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+
+
+class SaleViewSet(RollupMixin, BusinessFilterMixin, viewsets.ModelViewSet):
     serializer_class = SaleSerializer
+    rollup_entries = sale_entries
     queryset = Sale.objects.all()
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         return Sale.objects.filter(business__user=self.request.user)
@@ -25,13 +54,8 @@ class SaleViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                 
                 serializer = self.get_serializer(data=data)
                 if serializer.is_valid():
-                    sale = serializer.save()
-                    
-                    # Actualizar el stock del producto
-                    product = Product.objects.get(id=sale.product.id)
-                    product.stock -= sale.quantity
-                    product.save()
-                    
+                    # El serializer ya descuenta el stock y acredita la tarjeta
+                    serializer.save()
                     return Response(serializer.data, status=status.HTTP_201_CREATED)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
@@ -52,23 +76,22 @@ class SaleViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                 is_credit = sale.is_credit
 
                 # Actualizar stock del producto si existe
-                try:
-                    product = Product.objects.get(id=product_id)
-                    product.stock += quantity
-                    product.save()
-                except Product.DoesNotExist:
-                    pass
+                if product_id:
+                    try:
+                        adjust_stock(product_id, quantity, 'undo_sale', sale.id)
+                    except Product.DoesNotExist:
+                        pass
 
                 # Actualizar saldo de la tarjeta si aplica
                 if not is_credit and card_id:
                     try:
-                        card = Card.objects.get(id=card_id)
-                        total_amount = quantity * unit_price
-                        card.balance -= total_amount
-                        card.save()
+                        adjust_balance(card_id, -(quantity * unit_price), 'undo_sale', sale.id)
                     except Card.DoesNotExist:
                         pass
 
+                # Descontar la venta de los totales diarios
+                bump_rollups(sale_entries(sale, sign=-1))
+
                 # Eliminar la venta
                 sale.delete()
                 return Response({'message': 'Venta deshecha exitosamente'}, 
@@ -102,6 +125,11 @@ class SaleViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Modo masivo: todo el lote se valida y guarda con consultas agregadas
+        if request.query_params.get('mode') == 'bulk':
+            results, errors = bulk_register_sales(request.user.business, sales_data)
+            return batch_response(results, errors)
+
         results = []
         errors = []
 
@@ -129,27 +157,14 @@ class SaleViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                         'errors': str(e)
                     })
 
-        response_data = {
-            'success_count': len(results),
-            'error_count': len(errors),
-            'results': results,
-            'errors': errors
-        }
-
-        # Si hay errores pero también hay éxitos, retornamos 207 Multi-Status
-        if errors and results:
-            return Response(response_data, status=status.HTTP_207_MULTI_STATUS)
-        # Si todo fue exitoso
-        elif results and not errors:
-            return Response(response_data, status=status.HTTP_201_CREATED)
-        # Si todo falló
-        else:
-            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
-
-class PurchaseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
+        return batch_response(results, errors)
+
+class PurchaseViewSet(RollupMixin, BusinessFilterMixin, viewsets.ModelViewSet):
     serializer_class = PurchaseSerializer
     permission_classes = [IsAuthenticated]
     queryset = Purchase.objects.all()
+    pagination_class = CreatedAtCursorPagination
+    rollup_entries = purchase_entries
 
     def get_queryset(self):
         return Purchase.objects.filter(business__user=self.request.user)
@@ -190,32 +205,30 @@ class PurchaseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                     )
 
                 try:
-                    product = Product.objects.get(id=product_id)
-                    if product.stock < quantity:
-                        return Response(
-                            {'error': 'No hay suficiente stock para deshacer la compra'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    product.stock -= quantity
-                    product.save()
+                    adjust_stock(product_id, -quantity, 'undo_purchase', purchase.id)
                 except Product.DoesNotExist:
                     return Response(
                         {'error': 'El producto ya no existe'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
+                except ValidationError:
+                    return Response(
+                        {'error': 'No hay suficiente stock para deshacer la compra'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
 
                 if not is_credit and card_id:
                     try:
-                        card = Card.objects.get(id=card_id)
-                        total_amount = quantity * unit_price
-                        card.balance += total_amount
-                        card.save()
+                        adjust_balance(card_id, quantity * unit_price, 'undo_purchase', purchase.id)
                     except Card.DoesNotExist:
+                        # Deshacer el cambio de stock ya aplicado
+                        transaction.set_rollback(True)
                         return Response(
                             {'error': 'La tarjeta seleccionada no existe'},
                             status=status.HTTP_400_BAD_REQUEST
                         )
 
+                bump_rollups(purchase_entries(purchase, sign=-1))
                 purchase.delete()
                 return Response(
                     {'message': 'Compra deshecha exitosamente'}, 
@@ -264,16 +277,83 @@ class PurchaseViewSet(BusinessFilterMixin, viewsets.ModelViewSet):
                         'errors': str(e)
                     })
 
-        response_data = {
-            'success_count': len(results),
-            'error_count': len(errors),
-            'results': results,
-            'errors': errors
-        }
-
-        if errors and results:
-            return Response(response_data, status=status.HTTP_207_MULTI_STATUS)
-        elif results and not errors:
-            return Response(response_data, status=status.HTTP_201_CREATED)
-        else:
-            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return batch_response(results, errors)
+
+    @action(detail=False, methods=['post'])
+    def import_ndjson(self, request):
+        """
+        Importar compras desde un cuerpo NDJSON (una compra JSON por línea).
+
+        El cuerpo se lee línea a línea y se guarda por bloques de
+        ``chunk_size`` compras, cada uno en su propia transacción. La respuesta
+        se transmite también como NDJSON: una línea por compra con su ``id`` o
+        sus errores y una línea final con el resumen.
+        """
+        try:
+            chunk_size = int(request.query_params.get(
+                'chunk_size', settings.PURCHASE_IMPORT_CHUNK_SIZE
+            ))
+        except ValueError:
+            chunk_size = 0
+        if not 0 < chunk_size <= settings.PURCHASE_IMPORT_MAX_CHUNK_SIZE:
+            return Response(
+                {'error': f'chunk_size debe estar entre 1 y {settings.PURCHASE_IMPORT_MAX_CHUNK_SIZE}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        business = request.user.business
+        stream = request.stream
+        if stream is None:
+            return Response(
+                {'error': 'Se espera un cuerpo NDJSON con una compra por línea'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return StreamingHttpResponse(
+            self._import_ndjson_lines(business, stream, chunk_size),
+            content_type='application/x-ndjson'
+        )
+
+    def _import_ndjson_lines(self, business, stream, chunk_size):
+        success_count = 0
+        error_count = 0
+        chunk = []
+        invalid_lines = []
+
+        def flush():
+            created, errors = bulk_register_purchases(business, [data for _, data in chunk])
+            lines = [{'line': chunk[index][0], 'id': purchase.id} for index, purchase in created]
+            lines += [{'line': chunk[err['index']][0], 'errors': err['errors']} for err in errors]
+            lines += invalid_lines
+            lines.sort(key=lambda item: item['line'])
+            return len(created), len(errors) + len(invalid_lines), ''.join(
+                json.dumps(item) + '\n' for item in lines
+            )
+
+        for line_number, raw_line in enumerate(iter(stream.readline, b''), start=1):
+            if not raw_line.strip():
+                continue
+            try:
+                data = json.loads(raw_line)
+                if not isinstance(data, dict):
+                    raise ValueError('Se espera un objeto JSON')
+            except ValueError as e:
+                invalid_lines.append({'line': line_number, 'errors': {'non_field_errors': [str(e)]}})
+            else:
+                chunk.append((line_number, data))
+
+            if len(chunk) + len(invalid_lines) >= chunk_size:
+                created, failed, output = flush()
+                success_count += created
+                error_count += failed
+                chunk = []
+                invalid_lines = []
+                yield output
+
+        if chunk or invalid_lines:
+            created, failed, output = flush()
+            success_count += created
+            error_count += failed
+            yield output
+
+        yield json.dumps({'success_count': success_count, 'error_count': error_count}) + '\n'
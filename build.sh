@@ -7,5 +7,7 @@ python manage.py collectstatic --no-input
 # Crear nuevas migraciones y aplicarlas
 python manage.py makemigrations
 python manage.py migrate
+# Tabla de la caché compartida (no hace nada si ya existe)
+python manage.py createcachetable
 
 
@@ -26,6 +26,58 @@ SECRET_KEY = 'django-insecuremr5ij-1a7xdi%r^us)m*@wjo^a+gc8bhak*=9f!%9n=se#d+36s
 
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB
+
+# Importación NDJSON de compras: compras guardadas por transacción
+PURCHASE_IMPORT_CHUNK_SIZE = 500
+PURCHASE_IMPORT_MAX_CHUNK_SIZE = 5000
+
+# Umbrales a partir de los cuales se registra una petición lenta (api.middleware)
+REQUEST_TIMING_MAX_QUERIES = 30
+REQUEST_TIMING_MAX_DB_MS = 300
+REQUEST_TIMING_MAX_TOTAL_MS = 1000
+
+# Caché de respuestas públicas y del seguimiento de pedidos (api.cache). Debe
+# ser compartida por todos los procesos. En producción se usa Redis con
+# REDIS_URL: una petición repetida de track_order se sirve sin consultar la
+# base. Con DJANGO_CACHE_DIR se usa una carpeta en disco (todos los procesos en
+# la misma máquina). Sin ninguna de las dos, una tabla de la base de datos
+# (crearla con "python manage.py createcachetable"): solo ahorra las uniones,
+# no las consultas, porque leer la versión y la respuesta ya son consultas
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['DJANGO_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'api_cache',
+        }
+    }
+PUBLIC_CACHE_TIMEOUT = 300
+
+# Segundos que se guarda la respuesta de track_order de un pedido sin cambios
+TRACK_ORDER_CACHE_TIMEOUT = 300
+
+# Generar las variantes de imágenes en un hilo aparte tras guardar (api.images)
+IMAGE_VARIANTS_ASYNC = True
+
+# Zona horaria en la que se interpretan los horarios de los negocios (api.hours)
+BUSINESS_HOURS_TIME_ZONE = 'America/Havana'
+
+# Minutos que un pedido pendiente mantiene apartado su stock (release_expired_reservations)
+ORDER_RESERVATION_MINUTES = 120
+
 # SECURITY WARNING: don't run with debug turned on in production!
 if os.environ.get('DJANGO_ENV') == 'development':
     DEBUG = True
@@ -51,6 +103,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -193,6 +246,7 @@ CSRF_COOKIE_SECURE = True
 
 # Asegúrate de que estas configuraciones estén presentes
 MIDDLEWARE = [
+    'api.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -223,6 +277,11 @@ DEFAULT_FROM_EMAIL = '_mainaccount@e-comcuba.com'
 EMAIL_TIMEOUT = 30  # timeout en segundos
 EMAIL_DEBUG = True  # para ver logs de emails durante desarrollo
 
+# Bandeja de salida (comando send_outbox_emails)
+EMAIL_OUTBOX_BATCH_SIZE = 50  # correos enviados por conexión SMTP
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6  # intentos antes de marcar un correo como fallido
+EMAIL_OUTBOX_RETRY_SECONDS = 60  # espera del primer reintento, se duplica en cada fallo
+
 # # Permitir todos los CORS
 # CORS_ALLOW_ALL_ORIGINS = True
 # CORS_ALLOW_CREDENTIALS = True